@@ -2,19 +2,54 @@ let gameState = null;
 let playerId = null;
 let gameId = null;
 let socket = null;
+let spectating = false;
 
-window.addEventListener('DOMContentLoaded', async () => {
-    try {
-        console.log('Fetching test game...');
-        
-        const response = await fetch('/test_game');
+async function fetchTestGame() {
+    console.log('Fetching test game...');
+    
+    const response = await fetch('/test_game');
+    
+    if (!response.ok) {
+        throw new Error('Failed to fetch test game: ' + response.status);
+    }
+    
+    console.log('Test game data received');
+    return response.json();
+}
+
+async function waitForLobbyGame(ticket) {
+    console.log('Waiting for a lobby match...');
+    
+    while (true) {
+        const response = await fetch('/lobby/tickets/' + encodeURIComponent(ticket));
         
         if (!response.ok) {
-            throw new Error('Failed to fetch test game: ' + response.status);
+            throw new Error('Failed to fetch lobby ticket: ' + response.status);
         }
         
         const data = await response.json();
-        console.log('Test game data received');
+        if (data.status === 'ready') {
+            console.log('Lobby game ready');
+            return data;
+        }
+        if (data.status !== 'queued' && data.status !== 'matched') {
+            throw new Error('Lobby ticket ' + data.status + (data.error ? ': ' + data.error : ''));
+        }
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
+window.addEventListener('DOMContentLoaded', async () => {
+    const params = new URLSearchParams(window.location.search);
+    if (params.get('spectate')) {
+        startSpectating(params.get('spectate'));
+        return;
+    }
+    
+    try {
+        // /game?ticket=<id> waits for a lobby match; otherwise start a test game
+        const ticket = params.get('ticket');
+        const data = ticket ? await waitForLobbyGame(ticket) : await fetchTestGame();
         
         gameId = data.game_id;
         playerId = data.player_id;
@@ -51,6 +86,8 @@ window.addEventListener('DOMContentLoaded', async () => {
     
     renderGame();
 });        
+        socket.on('game_patch', onGamePatch);
+        
         socket.on('error', (data) => {
             console.error('Game error:', data);
             alert(data.message);
@@ -65,6 +102,63 @@ window.addEventListener('DOMContentLoaded', async () => {
     }
 });
 
+// /game?spectate=<game_id>: watch a game read-only, with only the public view
+function startSpectating(id) {
+    spectating = true;
+    gameId = id;
+    socket = io();
+    
+    socket.on('connect', () => {
+        socket.emit('spectate_game', { game_id: gameId });
+    });
+    
+    socket.on('game_update', (newState) => {
+        gameState = newState;
+        document.getElementById('loading').classList.add('hidden');
+        renderGame();
+    });
+    
+    socket.on('game_patch', onGamePatch);
+    
+    socket.on('error', (data) => {
+        console.error('Spectator error:', data);
+        document.getElementById('loading').innerHTML = '<h2>Cannot Watch Game</h2><p style="color: #f44336;">' + data.message + '</p>';
+    });
+}
+
+function onGamePatch(patch) {
+    if (!gameState || gameState.version === undefined || patch.base_version > gameState.version) {
+        console.warn('Missed updates, requesting full state');
+        socket.emit('request_resync', {});
+        return;
+    }
+    
+    applyPatch(gameState, patch.ops);
+    gameState.version = patch.version;
+    renderGame();
+}
+
+function applyPatch(state, ops) {
+    ops.forEach(op => {
+        const keys = op.path.split('/').slice(1);
+        const last = keys.pop();
+        let target = state;
+        
+        for (const key of keys) {
+            if (target[key] === undefined || target[key] === null) {
+                target[key] = {};
+            }
+            target = target[key];
+        }
+        
+        if (op.op === 'remove') {
+            delete target[last];
+        } else {
+            target[last] = op.value;
+        }
+    });
+}
+
 function renderGame() {
     if (!gameState) {
         console.error('No game state to render!');
@@ -92,6 +186,11 @@ function renderGame() {
 function renderYourBoard() {
     console.log('renderYourBoard called');
     const yourArea = document.getElementById('your-area');
+    if (spectating) {
+        // Every player is drawn with the opponents' public boards
+        yourArea.style.display = 'none';
+        return;
+    }
     const myPlayerData = gameState.players[playerId];
     
     if (!myPlayerData) {
@@ -262,6 +361,10 @@ function renderZone(zoneId, cardIds, isYourCard) {
         }
         
         const cardElement = createCardElement(card, isYourCard);
+        const playability = gameState.playable ? gameState.playable[card.id] : null;
+        if (card.zone === 'hand' && playability && playability.playable) {
+            cardElement.classList.add('playable');
+        }
         zoneElement.appendChild(cardElement);
     });
 }
@@ -295,6 +398,35 @@ function renderOpponentHand(zoneId, cardCount) {
     }
 }
 
+const pendingDefinitions = new Set();
+
+function getCardDefinition(card) {
+    if (!card.def) {
+        return null;
+    }
+    
+    const cardDefs = gameState.card_defs || (gameState.card_defs = {});
+    if (cardDefs[card.def]) {
+        return cardDefs[card.def];
+    }
+    
+    // Not revealed to us yet (e.g. after a reload) - fetch it once and re-render
+    if (!pendingDefinitions.has(card.def)) {
+        pendingDefinitions.add(card.def);
+        fetch('/card_definition/' + card.def)
+            .then(response => response.ok ? response.json() : null)
+            .then(definition => {
+                pendingDefinitions.delete(card.def);
+                if (definition) {
+                    gameState.card_defs[card.def] = definition;
+                    renderGame();
+                }
+            })
+            .catch(() => pendingDefinitions.delete(card.def));
+    }
+    return null;
+}
+
 function createCardElement(card, isYourCard) {
     const cardDiv = document.createElement('div');
     cardDiv.className = 'card';
@@ -304,8 +436,10 @@ function createCardElement(card, isYourCard) {
         cardDiv.classList.add('exerted');
     }
     
-    if (card.image_url) {
-        cardDiv.style.backgroundImage = 'url(' + card.image_url + ')';
+    const definition = getCardDefinition(card);
+    if (definition && definition.image_url) {
+        // Served from the server's image cache, sized for the board
+        cardDiv.style.backgroundImage = 'url(/card_image/' + card.def + '?size=thumb)';
     } else {
         cardDiv.innerHTML = '<div class="card-back">?</div>';
     }
@@ -362,7 +496,8 @@ function getCardOptions(card) {
         case 'hand':
             options.push({ label: 'Play Card', action: () => playCard(card.id) });
             
-            if (!myPlayer.has_inked_this_turn) {
+            const playability = gameState.playable ? gameState.playable[card.id] : null;
+            if (playability ? playability.inkable : !myPlayer.has_inked_this_turn) {
                 options.push({ label: 'Ink Card', action: () => inkCard(card.id) });
             }
             
@@ -429,8 +564,12 @@ function removeDamage(cardId) {
 }
 
 function quest(cardId) {
-    socket.emit('exert_card', { card_id: cardId });
-    socket.emit('add_lore', { amount: 1 });
+    socket.emit('batch_actions', {
+        actions: [
+            { type: 'exert_card', card_id: cardId },
+            { type: 'add_lore', amount: 1 }
+        ]
+    });
 }
 
 document.getElementById('draw-btn').addEventListener('click', () => {
@@ -445,6 +584,14 @@ document.getElementById('end-turn-btn').addEventListener('click', () => {
     socket.emit('end_turn', {});
 });
 
+document.getElementById('undo-btn').addEventListener('click', () => {
+    socket.emit('undo', {});
+});
+
+document.getElementById('redo-btn').addEventListener('click', () => {
+    socket.emit('redo', {});
+});
+
 function showDeckOptions() {
     socket.emit('draw_card', {});
 }
@@ -0,0 +1,191 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from game_state import GameState
+
+DEFAULT_LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'actions.db')
+
+
+class ActionLog:
+    """Append-only, per-game log of GameState actions with periodic snapshot checkpoints.
+
+    Recording is attached to a game with `attach`; every top-level action is
+    queued and written in batches, so one commit (and one fsync of the WAL)
+    covers many actions. A game is rebuilt by loading the closest checkpoint
+    and replaying the actions after it - shuffles are seeded, so the result
+    is identical.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_LOG_PATH, checkpoint_every: int = 100,
+                 batch_size: int = 256, flush_interval: float = 0.25):
+        self.db_path = db_path
+        self.checkpoint_every = checkpoint_every
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # With WAL, NORMAL only fsyncs at checkpoints; a crash can lose the last unflushed batch at most
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS games ("
+            "game_id TEXT PRIMARY KEY, started REAL NOT NULL, finished REAL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS actions ("
+            "game_id TEXT NOT NULL, seq INTEGER NOT NULL, method TEXT NOT NULL, args TEXT NOT NULL, "
+            "PRIMARY KEY (game_id, seq)) WITHOUT ROWID"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "game_id TEXT NOT NULL, seq INTEGER NOT NULL, data BLOB NOT NULL, "
+            "PRIMARY KEY (game_id, seq)) WITHOUT ROWID"
+        )
+        self.conn.commit()
+
+        self.pending_actions: List[tuple] = []
+        self.pending_checkpoints: List[tuple] = []
+        self.last_flush = time.monotonic()
+
+        self.actions_written = 0
+        self.checkpoints_written = 0
+        self.flushes = 0
+
+    def start(self, game: GameState):
+        """Register a new game: write its initial checkpoint and start recording"""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO games (game_id, started, finished) VALUES (?, ?, NULL)",
+                (game.game_id, time.time())
+            )
+            self.pending_checkpoints.append((game.game_id, game.action_seq, game.to_bytes()))
+        self.attach(game)
+        self.flush()
+
+    def attach(self, game: GameState):
+        """Record the game's actions from now on (e.g. after loading it from a store)"""
+        game.recorder = self.record
+
+    def record(self, game: GameState, method: str, args: tuple, kwargs: Dict):
+        """GameState recorder callback - called after each top-level action"""
+        entry = (game.game_id, game.action_seq, method, json.dumps([args, kwargs], separators=(',', ':')))
+        with self.lock:
+            self.pending_actions.append(entry)
+            # Undo stacks are not in snapshots, so replay never re-runs undo/redo (or a batch
+            # rollback, which reverts recorded actions): it starts after them
+            if game.action_seq % self.checkpoint_every == 0 or method in ('undo', 'redo', 'rollback'):
+                self.pending_checkpoints.append((game.game_id, game.action_seq, game.to_bytes()))
+            due = (len(self.pending_actions) >= self.batch_size
+                   or time.monotonic() - self.last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write queued actions and checkpoints in one transaction"""
+        with self.lock:
+            actions, self.pending_actions = self.pending_actions, []
+            checkpoints, self.pending_checkpoints = self.pending_checkpoints, []
+            self.last_flush = time.monotonic()
+            if not actions and not checkpoints:
+                return
+
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO actions (game_id, seq, method, args) VALUES (?, ?, ?, ?)",
+                    actions
+                )
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO checkpoints (game_id, seq, data) VALUES (?, ?, ?)",
+                    checkpoints
+                )
+            self.actions_written += len(actions)
+            self.checkpoints_written += len(checkpoints)
+            self.flushes += 1
+
+    def finish(self, game_id: str):
+        """Mark a game as over so it is not recovered on restart (its log is kept for replays)"""
+        self.flush()
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE games SET finished = ? WHERE game_id = ?", (time.time(), game_id))
+
+    def delete(self, game_id: str):
+        self.flush()
+        with self.lock, self.conn:
+            for table in ('games', 'actions', 'checkpoints'):
+                self.conn.execute(f"DELETE FROM {table} WHERE game_id = ?", (game_id,))
+
+    def last_seq(self, game_id: str) -> Optional[int]:
+        self.flush()
+        row = self.conn.execute(
+            "SELECT MAX(seq) FROM (SELECT seq FROM actions WHERE game_id = ? "
+            "UNION ALL SELECT seq FROM checkpoints WHERE game_id = ?)",
+            (game_id, game_id)
+        ).fetchone()
+        return row[0]
+
+    def replay(self, game_id: str, upto: Optional[int] = None) -> Optional[GameState]:
+        """Rebuild a game as it was after action `upto` (default: the latest).
+
+        Loads the closest checkpoint at or before `upto` and re-applies the
+        actions after it. The returned game is not recording.
+        """
+        self.flush()
+        with self.lock:
+            if upto is None:
+                row = self.conn.execute(
+                    "SELECT seq, data FROM checkpoints WHERE game_id = ? ORDER BY seq DESC LIMIT 1",
+                    (game_id,)
+                ).fetchone()
+            else:
+                row = self.conn.execute(
+                    "SELECT seq, data FROM checkpoints WHERE game_id = ? AND seq <= ? "
+                    "ORDER BY seq DESC LIMIT 1",
+                    (game_id, upto)
+                ).fetchone()
+            if row is None:
+                return None
+
+            checkpoint_seq, data = row
+            actions = self.conn.execute(
+                "SELECT seq, method, args FROM actions WHERE game_id = ? AND seq > ? AND seq <= ? "
+                "ORDER BY seq",
+                (game_id, checkpoint_seq, upto if upto is not None else 2 ** 62)
+            ).fetchall()
+
+        game = GameState.from_bytes(data)
+        for seq, method, args in actions:
+            args, kwargs = json.loads(args)
+            getattr(game, method)(*args, **kwargs)
+            if game.action_seq != seq:
+                raise RuntimeError(f"Replay of {game_id} diverged at action {seq}")
+        return game
+
+    def recover(self) -> List[GameState]:
+        """Rebuild every game that was still in progress"""
+        game_ids = [
+            row[0] for row in self.conn.execute("SELECT game_id FROM games WHERE finished IS NULL")
+        ]
+        games = []
+        for game_id in game_ids:
+            game = self.replay(game_id)
+            if game is not None:
+                self.attach(game)
+                games.append(game)
+        return games
+
+    def stats(self) -> Dict:
+        return {
+            'pending': len(self.pending_actions),
+            'actions_written': self.actions_written,
+            'checkpoints_written': self.checkpoints_written,
+            'flushes': self.flushes
+        }
+
+    def close(self):
+        self.flush()
+        self.conn.close()
@@ -1,21 +1,164 @@
-from flask import Flask, render_template, jsonify, request, session
-from flask_socketio import SocketIO, emit, join_room
+from flask import Flask, Response, render_template, jsonify, request, send_file, session
+from flask_socketio import SocketIO, emit, join_room, leave_room
+import atexit
+import functools
+import json
+import threading
+import time
 import uuid
 import os
-from game_state import GameState
+import sys
+from game_state import GameState, CARD_DEFINITIONS, SPECTATOR_ID
+from game_store import create_game_store
+from game_lifecycle import GameLifecycle
+from lobby import Lobby
+from action_log import ActionLog, DEFAULT_LOG_PATH
+from broadcast_scheduler import BroadcastScheduler
 from lorcana_api import LorcanaAPI
+from card_cache import CardCache
+from card_catalog import CardCatalog, DEFAULT_DB_PATH
+from card_images import CardImageStore, VARIANTS as IMAGE_VARIANTS
+from deck_analysis import HAND_SIZE, analyze_deck
+from logs import get_logger
+from metrics import BYTE_BUCKETS, CONTENT_TYPE, REGISTRY, counter, gauge
+
+logger = get_logger('app')
+
+SOCKET_HANDLER_SECONDS = REGISTRY.histogram(
+    'lorcana_socket_handler_seconds', 'Socket.IO event handler time', ['event']
+)
+BROADCAST_SECONDS = REGISTRY.histogram(
+    'lorcana_broadcast_seconds', 'Time to build and emit one game update to every player'
+)
+BROADCAST_BYTES = REGISTRY.histogram(
+    'lorcana_broadcast_bytes', 'Bytes emitted per game update (all players)', buckets=BYTE_BUCKETS
+)
+SOCKET_BYTES_OUT = REGISTRY.counter('lorcana_socket_bytes_out_total', 'Encoded Socket.IO payload bytes sent')
+
+# Set while broadcast_game_update emits, so the packet encoder can attribute bytes to the update
+_broadcast_bytes = threading.local()
+
+
+class CountingJSON:
+    """json module for Socket.IO packets that counts what it encodes (no second serialization)"""
+    loads = staticmethod(json.loads)
+    
+    @staticmethod
+    def dumps(obj, **kwargs):
+        data = json.dumps(obj, **kwargs)
+        SOCKET_BYTES_OUT.inc(len(data))
+        if getattr(_broadcast_bytes, 'total', None) is not None:
+            _broadcast_bytes.total += len(data)
+        return data
 
 app = Flask(__name__, 
             template_folder='../UI',
             static_folder='../UI',
             static_url_path='/static')
-app.config['SECRET_KEY'] = 'your-secret-key-here'
-socketio = SocketIO(app, cors_allowed_origins="*")
 
-games = {}
-lorcana_api = LorcanaAPI()
 
-player_sessions = {}
+def detect_async_mode():
+    """SOCKETIO_ASYNC_MODE, else eventlet/gevent only if the process was monkey patched (server.py, gunicorn)"""
+    mode = os.environ.get('SOCKETIO_ASYNC_MODE')
+    if mode:
+        return mode
+    if 'eventlet' in sys.modules and sys.modules['eventlet'].patcher.is_monkey_patched('socket'):
+        return 'eventlet'
+    if 'gevent.monkey' in sys.modules and sys.modules['gevent.monkey'].is_module_patched('socket'):
+        return 'gevent'
+    return 'threading'
+
+
+# Sessions are signed with SECRET_KEY; a random key works for one process but logs everyone
+# out on restart, and several workers must share the same key
+secret_key = os.environ.get('SECRET_KEY')
+if not secret_key:
+    secret_key = os.urandom(32).hex()
+    logger.warning("SECRET_KEY is not set; using a random key for this process")
+app.config['SECRET_KEY'] = secret_key
+
+# Comma-separated origins allowed to open a socket, e.g. https://play.example.com (default: any)
+cors_origins = os.environ.get('CORS_ALLOWED_ORIGINS', '*')
+# With several workers, point them all at the same queue (e.g. redis://...) so
+# emits reach clients connected to any worker
+socketio = SocketIO(app,
+                    async_mode=detect_async_mode(),
+                    cors_allowed_origins='*' if cors_origins == '*' else [
+                        origin.strip() for origin in cors_origins.split(',') if origin.strip()
+                    ],
+                    ping_interval=float(os.environ.get('SOCKETIO_PING_INTERVAL', 25)),
+                    ping_timeout=float(os.environ.get('SOCKETIO_PING_TIMEOUT', 20)),
+                    message_queue=os.environ.get('SOCKETIO_MESSAGE_QUEUE'),
+                    json=CountingJSON)
+
+# Set ACTION_LOG_PATH to an empty string to turn the action log off
+action_log_path = os.environ.get('ACTION_LOG_PATH', DEFAULT_LOG_PATH)
+action_log = ActionLog(
+    action_log_path,
+    checkpoint_every=int(os.environ.get('ACTION_LOG_CHECKPOINT_EVERY', 100))
+) if action_log_path else None
+
+# Idle games are written to disk after GAME_HIBERNATE_AFTER seconds and deleted after
+# GAME_EVICT_AFTER; GAME_MEMORY_BUDGET_MB also hibernates the least recently used games
+# (memory store only - Redis expires idle games with its own TTL)
+game_store_backend = os.environ.get('GAME_STORE', 'memory')
+
+
+def end_game(game_id):
+    """An evicted game leaves the action log and the lobby listing"""
+    if action_log is not None:
+        action_log.finish(game_id)
+    lobby.game_ended(game_id)
+
+
+memory_budget_mb = os.environ.get('GAME_MEMORY_BUDGET_MB')
+game_lifecycle = GameLifecycle(
+    os.environ.get('GAME_HIBERNATE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hibernated')),
+    hibernate_after=float(os.environ.get('GAME_HIBERNATE_AFTER', 900)),
+    evict_after=float(os.environ.get('GAME_EVICT_AFTER', 24 * 3600)),
+    memory_budget=int(float(memory_budget_mb) * 1024 * 1024) if memory_budget_mb else None,
+    on_evict=end_game
+) if game_store_backend == 'memory' else None
+
+game_store = create_game_store(
+    game_store_backend,
+    redis_url=os.environ.get('REDIS_URL'),
+    action_log=action_log,
+    lifecycle=game_lifecycle
+)
+
+if action_log is not None:
+    atexit.register(action_log.flush)
+    recovered = [game for game in action_log.recover() if game.game_id not in game_store]
+    for game in recovered:
+        game_store.save(game)
+    if recovered:
+        logger.info("Recovered games from the action log", extra={'games': len(recovered)})
+
+if game_lifecycle is not None:
+    socketio.start_background_task(game_lifecycle.run, socketio.sleep,
+                                   float(os.environ.get('GAME_SWEEP_INTERVAL', 30)))
+lorcana_offline = os.environ.get('LORCANA_OFFLINE', '').lower() in ['1', 'true', 'yes']
+# LOAD_TEST=1 adds /test_game/<game_id>/join/<seat>, which seats any client in a /test_game game
+load_test_routes = os.environ.get('LOAD_TEST', '').lower() in ['1', 'true', 'yes']
+TEST_GAME_PREFIX = 'test-'
+lorcana_api = LorcanaAPI(
+    catalog=CardCatalog(os.environ.get('LORCANA_CARD_DB', DEFAULT_DB_PATH)),
+    offline=lorcana_offline,
+    cache=CardCache(
+        max_size=int(os.environ.get('LORCANA_CARD_CACHE_SIZE', 4096)),
+        path=os.environ.get('LORCANA_CARD_CACHE_PATH')
+    )
+)
+# Saved off the request path: every LORCANA_CARD_CACHE_SAVE_INTERVAL seconds if it changed, and at exit
+if lorcana_api.cache.path:
+    atexit.register(lorcana_api.cache.flush)
+    socketio.start_background_task(lorcana_api.cache.run, socketio.sleep,
+                                   float(os.environ.get('LORCANA_CARD_CACHE_SAVE_INTERVAL', 60)))
+card_images = CardImageStore(
+    os.environ.get('CARD_IMAGE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'card_images')),
+    offline=lorcana_offline
+)
 
 SAMPLE_DECK = """2 Rapunzel - Gifted with Healing
 3 Stitch - Carefree Surfer
@@ -43,6 +186,39 @@ SAMPLE_DECK = """2 Rapunzel - Gifted with Healing
 2 Maui's Fish Hook"""
 
 
+def resolve_lobby_deck(deck_text):
+    deck = lorcana_api.resolve_deck(deck_text)
+    card_images.prefetch(card.get('image_url') for card in deck)
+    return deck
+
+
+def save_lobby_game(game):
+    game_store.save(game)
+    if action_log is not None:
+        action_log.start(game)
+    logger.info("Lobby game created", extra={'game_id': game.game_id, 'players': len(game.player_order)})
+
+
+# Matched tables are set up on a background task, so deck resolution never runs on a request.
+# The queues live in this process: with several workers (server.py sets SERVER_WORKER_INDEX),
+# only the first one runs the lobby and the others refuse lobby requests
+lobby = Lobby(resolve_lobby_deck, save_lobby_game,
+              ticket_ttl=float(os.environ.get('LOBBY_TICKET_TTL', 600)))
+lobby_owner = int(os.environ.get('SERVER_WORKER_INDEX', 0)) == 0
+if lobby_owner:
+    socketio.start_background_task(lobby.run)
+
+
+def lobby_route(view):
+    """A lobby endpoint, answered only by the worker that runs the lobby"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not lobby_owner:
+            return jsonify({'error': 'The lobby is served by the first worker'}), 404
+        return view(*args, **kwargs)
+    return wrapper
+
+
 @app.route('/')
 def index():
     return """
@@ -126,39 +302,33 @@ def game():
 @app.route('/test_game')
 def test_game():
     try:
-        game_id = str(uuid.uuid4())
+        game_id = f"{TEST_GAME_PREFIX}{uuid.uuid4()}"
         player_id = str(uuid.uuid4())
         
-        print("Loading deck from API...")
-        deck_cards = lorcana_api.parse_dreamborn_deck(SAMPLE_DECK)
-        print(f"Loaded {len(deck_cards)} cards for player 1")
+        deck = lorcana_api.resolve_deck(SAMPLE_DECK)
+        card_images.prefetch(card.get('image_url') for card in deck)
         
         game = GameState(game_id)
+        game.add_player(player_id, "You", deck)
         
-        print("Adding main player...")
-        game.add_player(player_id, "You", deck_cards)
-        
-        print("Adding opponent 1...")
         opponent1_id = str(uuid.uuid4())
-        opponent1_deck = lorcana_api.parse_dreamborn_deck(SAMPLE_DECK)
-        print(f"Loaded {len(opponent1_deck)} cards for player 2")
-        game.add_player(opponent1_id, "Player 2", opponent1_deck)
+        game.add_player(opponent1_id, "Player 2", deck)
         
-        print("Adding opponent 2...")
         opponent2_id = str(uuid.uuid4())
-        opponent2_deck = lorcana_api.parse_dreamborn_deck(SAMPLE_DECK)
-        print(f"Loaded {len(opponent2_deck)} cards for player 3")
-        game.add_player(opponent2_id, "Player 3", opponent2_deck)
+        game.add_player(opponent2_id, "Player 3", deck)
         
-        print("Starting game...")
         game.start_game()
+        game.clear_history()
+        game.collect_changes()
         
-        games[game_id] = game
+        game_store.save(game)
+        if action_log is not None:
+            action_log.start(game)
         
         session['game_id'] = game_id
         session['player_id'] = player_id
         
-        print("Game initialized successfully!")
+        logger.info("Test game created", extra={'game_id': game_id, 'cards': len(deck)})
         
         return jsonify({
             'game_id': game_id,
@@ -167,245 +337,612 @@ def test_game():
         })
         
     except Exception as e:
-        print(f"ERROR in test_game: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Could not create test game")
         return jsonify({'error': str(e)}), 500
 
 
+def join_test_game(game_id, seat):
+    """Take over a seat of an existing test game, so several clients can share it (see loadtest.py)"""
+    if not game_id.startswith(TEST_GAME_PREFIX):
+        return jsonify({'error': 'Game not found'}), 404
+    
+    with game_store.transaction(game_id) as game:
+        if game is None or not 0 <= seat < len(game.player_order):
+            return jsonify({'error': 'Game not found'}), 404
+        
+        player_id = game.player_order[seat]
+        state = game.get_state_for_player(player_id)
+    
+    session['game_id'] = game_id
+    session['player_id'] = player_id
+    
+    return jsonify({
+        'game_id': game_id,
+        'player_id': player_id,
+        'state': state
+    })
+
+
+# Anyone who can reach this route can take a seat, so it only exists for load tests
+if load_test_routes:
+    app.add_url_rule('/test_game/<game_id>/join/<int:seat>', view_func=join_test_game)
+
+
+@app.route('/lobby')
+@lobby_route
+def get_lobby():
+    """Queue sizes and running lobby games (serialized once per change, not per request)"""
+    return Response(lobby.listing_json(), mimetype='application/json')
+
+
+@app.route('/lobby/queue', methods=['POST'])
+@lobby_route
+def join_lobby():
+    """Queue for a table (JSON body: {"username", "deck", "players": 2-4, "format"})"""
+    data = request.get_json(silent=True) or {}
+    username = str(data.get('username') or '').strip()[:32]
+    deck_text = data.get('deck')
+    format = str(data.get('format') or 'core')
+    if not username or not deck_text:
+        return jsonify({'error': 'Missing username or deck list'}), 400
+    if len(format) > 32 or not format.replace('-', '').isalnum():
+        return jsonify({'error': 'Invalid format'}), 400
+    
+    try:
+        ticket = lobby.join(username, deck_text, int(data.get('players', 2)), format)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(ticket.to_dict()), 202
+
+
+@app.route('/lobby/tickets/<ticket_id>')
+@lobby_route
+def get_lobby_ticket(ticket_id):
+    """Poll a ticket; once its game is ready this joins the session to it, like /test_game"""
+    ticket = lobby.get_ticket(ticket_id)
+    if ticket is None:
+        return jsonify({'error': 'Ticket not found'}), 404
+    if ticket.status != 'ready':
+        return jsonify(ticket.to_dict())
+    
+    with game_store.transaction(ticket.game_id) as game:
+        if game is None:
+            return jsonify({'error': 'Game not found'}), 404
+        state = game.get_state_for_player(ticket.player_id)
+    
+    session['game_id'] = ticket.game_id
+    session['player_id'] = ticket.player_id
+    
+    return jsonify({
+        **ticket.to_dict(),
+        'player_id': ticket.player_id,
+        'state': state
+    })
+
+
+@app.route('/lobby/tickets/<ticket_id>', methods=['DELETE'])
+@lobby_route
+def cancel_lobby_ticket(ticket_id):
+    if not lobby.cancel(ticket_id):
+        return jsonify({'error': 'Ticket is not queued'}), 409
+    return jsonify(lobby.get_ticket(ticket_id).to_dict())
+
+
 @app.route('/game_state')
 def get_game_state():
     game_id = session.get('game_id')
     player_id = session.get('player_id')
     
-    if not game_id or game_id not in games:
+    if not game_id:
         return jsonify({'error': 'Game not found'}), 404
     
-    game = games[game_id]
-    return jsonify(game.get_state_for_player(player_id))
+    with game_store.transaction(game_id) as game:
+        if game is None:
+            return jsonify({'error': 'Game not found'}), 404
+        data = game.get_state_json(player_id)
+    return Response(data, mimetype='application/json')
 
 
-def broadcast_game_update(game, game_id):
-    for pid in game.players:
-        if pid in player_sessions:
-            socketio.emit('game_update', 
-                         game.get_state_for_player(pid), 
-                         room=player_sessions[pid])
+@app.route('/spectate/<game_id>')
+def get_spectator_state(game_id):
+    """The public view of any game (face-up cards and zone counts), e.g. for stream overlays"""
+    with game_store.transaction(game_id) as game:
+        if game is None:
+            return jsonify({'error': 'Game not found'}), 404
+        data = game.get_state_json(SPECTATOR_ID)
+    return Response(data, mimetype='application/json')
+
 
+@app.route('/game_state/<int:upto>')
+def get_game_state_at(upto):
+    """The session's game as it was after action `upto` (for rewinding)"""
+    game_id = session.get('game_id')
+    player_id = session.get('player_id')
+    
+    if not game_id or action_log is None:
+        return jsonify({'error': 'Game not found'}), 404
+    
+    game = action_log.replay(game_id, upto=upto)
+    if game is None:
+        return jsonify({'error': 'Game not found'}), 404
+    return Response(game.get_state_json(player_id), mimetype='application/json')
+
+
+@app.route('/deck_analysis', methods=['POST'])
+def get_deck_analysis():
+    """Opening-hand and on-curve odds for a Dreamborn deck list (JSON body: {"deck": "..."})"""
+    data = request.get_json(silent=True) or {}
+    deck_text = data.get('deck')
+    if not deck_text:
+        return jsonify({'error': 'Missing deck list'}), 400
+    
+    deck = lorcana_api.parse_dreamborn_deck(deck_text)
+    if not deck:
+        return jsonify({'error': 'No cards found in deck list'}), 400
+    if len(deck) <= HAND_SIZE:
+        return jsonify({'error': f'A deck needs more than {HAND_SIZE} cards'}), 400
+    return jsonify(analyze_deck(deck))
+
+
+@app.route('/card_definition/<key>')
+def get_card_definition(key):
+    definition = CARD_DEFINITIONS.get_by_key(key)
+    if definition is None:
+        return jsonify({'error': 'Card definition not found'}), 404
+    
+    # Keys are content hashes, so a definition never changes under its key
+    response = jsonify(definition.data)
+    response.set_etag(definition.key)
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
+
+
+@app.route('/card_image/<key>')
+def get_card_image(key):
+    """A card definition's image from the local cache (?size=thumb for board-sized cards)"""
+    definition = CARD_DEFINITIONS.get_by_key(key)
+    if definition is None or not definition.data.get('image_url'):
+        return jsonify({'error': 'Card image not found'}), 404
+    
+    size = request.args.get('size', 'full')
+    if size not in IMAGE_VARIANTS:
+        return jsonify({'error': f"size must be one of {', '.join(IMAGE_VARIANTS)}"}), 400
+    
+    image = card_images.get(definition.data['image_url'], size, definition.card_type)
+    # A path (not a file object) lets the server use wsgi.file_wrapper / sendfile
+    response = send_file(image.path, mimetype=image.mimetype, etag=image.etag,
+                         max_age=image.max_age, conditional=True)
+    response.cache_control.immutable = image.immutable or None
+    return response
+
+
+@app.route('/action_stats')
+def get_action_stats():
+    return jsonify({
+        'executor': game_store.executor.stats(),
+        'broadcasts': broadcast_scheduler.stats(),
+        'action_log': action_log.stats() if action_log is not None else None,
+        'lifecycle': game_lifecycle.stats() if game_lifecycle is not None else None,
+        'lobby': lobby.stats()
+    })
+
+
+@app.route('/cache_stats')
+def get_cache_stats():
+    return jsonify({
+        'cards': lorcana_api.cache.stats(),
+        'decks': lorcana_api.deck_cache.stats(),
+        'images': card_images.stats(),
+        'failures': lorcana_api.failures
+    })
+
+
+def spectator_room(game_id):
+    return f"{game_id}:spectators"
 
-@socketio.on('connect')
-def handle_connect():
-    print(f'Client connected: {request.sid}')
+
+def broadcast_game_update(game, game_id):
+    changes = game.collect_changes()
+    if changes is None:
+        return
+    
+    start = time.perf_counter()
+    _broadcast_bytes.total = 0
+    try:
+        for pid in game.players:
+            sid = game_store.get_session(pid)
+            if sid:
+                socketio.emit('game_patch', 
+                             game.get_delta_for_player(pid, changes), 
+                             room=sid)
+        # Spectators share one public delta: built and serialized once, sent to the room in one emit
+        if game_store.spectator_count(game_id):
+            socketio.emit('game_patch', game.get_delta_for_player(SPECTATOR_ID, changes),
+                          room=spectator_room(game_id))
+        # With a message queue, packets are encoded by the queue listener and not counted here
+        if _broadcast_bytes.total:
+            BROADCAST_BYTES.observe(_broadcast_bytes.total)
+    finally:
+        _broadcast_bytes.total = None
+        BROADCAST_SECONDS.observe(time.perf_counter() - start)
+
+
+def flush_game_update(game_id):
+    with game_store.transaction(game_id) as game:
+        if game is not None:
+            broadcast_game_update(game, game_id)
+    
+    # Write queued actions every tick, so an idle game's last actions are not left pending
+    if action_log is not None:
+        action_log.flush()
+
+
+broadcast_scheduler = BroadcastScheduler(
+    socketio,
+    flush_game_update,
+    interval=int(os.environ.get('BROADCAST_INTERVAL_MS', 30)) / 1000
+)
+
+
+def collect_server_metrics():
+    """Metrics read from the existing stats at scrape time"""
+    for name, cache in (('cards', lorcana_api.cache), ('decks', lorcana_api.deck_cache)):
+        stats = cache.stats()
+        yield counter(f'lorcana_{name}_cache_hits_total', f'{name} cache hits', stats['hits'])
+        yield counter(f'lorcana_{name}_cache_misses_total', f'{name} cache misses', stats['misses'])
+        yield counter(f'lorcana_{name}_cache_evictions_total', f'{name} cache evictions', stats['evictions'])
+        yield gauge(f'lorcana_{name}_cache_entries', f'{name} cache size', stats['size'])
+    
+    images = card_images.stats()
+    yield gauge('lorcana_card_images_cached', 'Card images on disk', images['cached'])
+    yield counter('lorcana_card_image_hits_total', 'Card image requests served from the cache', images['hits'])
+    yield counter('lorcana_card_image_failures_total', 'Card image fetches that failed', images['failures'])
+    
+    yield gauge('lorcana_active_games', 'Games in memory', game_store.game_count())
+    yield gauge('lorcana_active_sessions', 'Players bound to a socket', game_store.session_count())
+    yield gauge('lorcana_spectators', 'Sockets watching a game', game_store.spectator_count())
+    
+    if game_lifecycle is not None:
+        lifecycle = game_lifecycle.stats()
+        yield gauge('lorcana_hibernated_games', 'Games hibernated to disk', lifecycle['hibernated'])
+        yield gauge('lorcana_live_game_bytes', 'Estimated memory held by live games', lifecycle['live_bytes'])
+        yield counter('lorcana_game_hibernations_total', 'Games hibernated', lifecycle['hibernations'])
+        yield counter('lorcana_game_wakes_total', 'Hibernated games loaded again', lifecycle['wakes'])
+        yield counter('lorcana_game_evictions_total', 'Idle games deleted', lifecycle['evictions'])
+    
+    lobby_stats = lobby.stats()
+    yield gauge('lorcana_lobby_waiting', 'Players queued in the lobby', lobby_stats['waiting'])
+    yield gauge('lorcana_lobby_pending_tables', 'Matched tables waiting for their game', lobby_stats['pending_tables'])
+    yield counter('lorcana_lobby_games_total', 'Games created by the lobby', lobby_stats['games_created'])
+    yield counter('lorcana_lobby_failures_total', 'Lobby tickets that failed', lobby_stats['failures'])
+    
+    executor = game_store.executor.stats()
+    yield counter('lorcana_executor_actions_total', 'Actions run under a game lock', executor['actions'])
+    yield gauge('lorcana_executor_queued', 'Actions waiting for a game lock', executor['queued'])
+    yield gauge('lorcana_executor_max_wait_seconds', 'Longest wait for a game lock', executor['max_wait_ms'] / 1000)
+    
+    broadcasts = broadcast_scheduler.stats()
+    yield counter('lorcana_broadcast_flushes_total', 'Game updates broadcast', broadcasts['flushes'])
+    yield counter('lorcana_broadcast_coalesced_total', 'Updates merged into a pending broadcast',
+                  broadcasts['coalesced'])
+    
+    if action_log is not None:
+        log_stats = action_log.stats()
+        yield gauge('lorcana_action_log_pending', 'Actions queued for the action log', log_stats['pending'])
+        yield counter('lorcana_action_log_written_total', 'Actions written to the action log',
+                      log_stats['actions_written'])
+
+
+REGISTRY.add_collector(collect_server_metrics)
+
+
+@app.route('/metrics')
+def get_metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+def socket_event(event):
+    """socketio.on, with the handler's time recorded in SOCKET_HANDLER_SECONDS"""
+    histogram = SOCKET_HANDLER_SECONDS.labels(event=event)
+    
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(*args):
+            start = time.perf_counter()
+            try:
+                return handler(*args)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return socketio.on(event)(wrapper)
+    return decorator
+
+
+@socket_event('connect')
+def handle_connect(auth=None):
+    logger.debug("Client connected", extra={'sid': request.sid})
 
 
-@socketio.on('disconnect')
+@socket_event('disconnect')
 def handle_disconnect():
-    print(f'Client disconnected: {request.sid}')
-    for pid, sid in list(player_sessions.items()):
-        if sid == request.sid:
-            del player_sessions[pid]
-            print(f'Removed player session: {pid}')
+    removed = game_store.remove_sessions_for_sid(request.sid)
+    game_store.remove_spectator(request.sid)
+    logger.debug("Client disconnected", extra={'sid': request.sid, 'players': removed})
 
 
-@socketio.on('join_game')
+@socket_event('join_game')
 def handle_join_game(data):
     game_id = data.get('game_id')
     player_id = data.get('player_id')
     
-    if game_id in games:
+    if game_id in game_store:
         join_room(game_id)
-        player_sessions[player_id] = request.sid
-        print(f'Player {player_id} joined with session {request.sid}')
+        game_store.set_session(player_id, request.sid)
+        logger.info("Player joined", extra={'game_id': game_id, 'player_id': player_id, 'sid': request.sid})
         emit('game_joined', {'game_id': game_id})
 
 
-@socketio.on('move_card')
-def handle_move_card(data):
+@socket_event('spectate_game')
+def handle_spectate_game(data):
+    """Watch any game: the public state now, then the spectator room's patches"""
+    game_id = data.get('game_id')
+    
+    with game_store.transaction(game_id) as game:
+        if game is None:
+            emit('error', {'message': 'Game not found'})
+            return
+        # Joined under the game's lock, so no broadcast falls between this state and the first patch
+        previous = game_store.remove_spectator(request.sid)
+        if previous is not None:
+            leave_room(spectator_room(previous))
+        join_room(spectator_room(game_id))
+        game_store.add_spectator(game_id, request.sid)
+        session['spectating'] = game_id
+        emit('game_update', game.get_state_for_player(SPECTATOR_ID))
+    
+    logger.info("Spectator joined", extra={'game_id': game_id, 'sid': request.sid})
+
+
+@socket_event('stop_spectating')
+def handle_stop_spectating(data=None):
+    game_id = game_store.remove_spectator(request.sid)
+    if game_id is not None:
+        leave_room(spectator_room(game_id))
+    session.pop('spectating', None)
+
+
+@socket_event('request_resync')
+def handle_request_resync(data):
     game_id = session.get('game_id')
     player_id = session.get('player_id')
+    if session.get('spectating'):
+        game_id, player_id = session['spectating'], SPECTATOR_ID
     
-    if game_id not in games:
+    if not game_id:
         return
     
-    game = games[game_id]
+    with game_store.transaction(game_id) as game:
+        if game is not None:
+            emit('game_update', game.get_state_for_player(player_id))
+
+
+def action_move_card(game, player_id, data):
     card_id = data.get('card_id')
-    to_zone = data.get('to_zone')
-    face_up = data.get('face_up')
-    
     if game.cards[card_id].owner != player_id:
-        emit('error', {'message': 'Not your card'})
-        return
-    
-    game.move_card(card_id, to_zone, face_up=face_up)
-    broadcast_game_update(game, game_id)
+        return 'Not your card'
+    game.move_card(card_id, data.get('to_zone'), face_up=data.get('face_up'))
 
 
-@socketio.on('ink_card')
-def handle_ink_card(data):
-    game_id = session.get('game_id')
-    player_id = session.get('player_id')
+def action_ink_card(game, player_id, data):
     card_id = data.get('card_id')
-    
-    if game_id not in games:
-        return
-    
-    game = games[game_id]
     if game.cards[card_id].owner != player_id:
-        emit('error', {'message': 'Not your card'})
-        return
-    
+        return 'Not your card'
     success, error_msg = game.ink_card(card_id)
-    
-    if success:
-        broadcast_game_update(game, game_id)
-    else:
-        emit('error', {'message': error_msg})
+    if not success:
+        return error_msg
 
 
-@socketio.on('play_card')
-def handle_play_card(data):
-    game_id = session.get('game_id')
-    player_id = session.get('player_id')
+def action_play_card(game, player_id, data):
     card_id = data.get('card_id')
-    
-    if game_id not in games:
-        return
-    
-    game = games[game_id]
     if game.cards[card_id].owner != player_id:
-        emit('error', {'message': 'Not your card'})
-        return
-    
+        return 'Not your card'
     can_play, error_msg = game.can_play_card(card_id)
     if not can_play:
-        emit('error', {'message': error_msg})
-        return
-    
+        return error_msg
     game.play_card(card_id)
-    broadcast_game_update(game, game_id)
 
 
-@socketio.on('exert_card')
-def handle_exert_card(data):
+def action_exert_card(game, player_id, data):
+    game.exert_card(data.get('card_id'))
+
+
+def action_ready_card(game, player_id, data):
+    game.ready_card(data.get('card_id'))
+
+
+def action_add_damage(game, player_id, data):
+    game.add_damage(data.get('card_id'), 1)
+
+
+def action_remove_damage(game, player_id, data):
+    game.remove_damage(data.get('card_id'), 1)
+
+
+def action_draw_card(game, player_id, data):
+    game.draw_cards(player_id, 1)
+
+
+def action_shuffle_deck(game, player_id, data):
+    game.shuffle_deck(player_id)
+
+
+def action_end_turn(game, player_id, data):
+    game.end_turn(player_id)
+
+
+def action_add_lore(game, player_id, data):
+    game.add_lore(player_id, data.get('amount', 1))
+
+
+def action_flip_mystery_card(game, player_id, data):
+    if not game.flip_mystery_card(player_id):
+        return 'Cannot flip mystery card yet (turn 3+)'
+
+
+def action_undo(game, player_id, data):
+    if not game.can_undo():
+        return 'Nothing to undo'
+    if not game.undo(player_id):
+        return 'You can only undo your own last action'
+
+
+def action_redo(game, player_id, data):
+    if not game.can_redo():
+        return 'Nothing to redo'
+    if not game.redo(player_id):
+        return 'You can only redo your own last undone action'
+
+
+GAME_ACTIONS = {
+    'move_card': action_move_card,
+    'ink_card': action_ink_card,
+    'play_card': action_play_card,
+    'exert_card': action_exert_card,
+    'ready_card': action_ready_card,
+    'add_damage': action_add_damage,
+    'remove_damage': action_remove_damage,
+    'draw_card': action_draw_card,
+    'shuffle_deck': action_shuffle_deck,
+    'end_turn': action_end_turn,
+    'add_lore': action_add_lore,
+    'flip_mystery_card': action_flip_mystery_card,
+    'undo': action_undo,
+    'redo': action_redo,
+}
+
+
+class ActionRejected(Exception):
+    """An action refused with a message for the player; rolls back the rest of its batch"""
+
+
+def apply_actions(actions):
+    """Apply actions for the session's game under one lock, all or nothing.
+    
+    If any action is refused or raises, every action of the batch is rolled
+    back and one error is sent. The resulting update is broadcast on the
+    scheduler's next tick.
+    """
     game_id = session.get('game_id')
-    card_id = data.get('card_id')
+    player_id = session.get('player_id')
     
-    if game_id not in games:
+    if not game_id:
         return
     
-    game = games[game_id]
-    game.exert_card(card_id)
-    broadcast_game_update(game, game_id)
+    with game_store.transaction(game_id) as game:
+        if game is None:
+            return
+        
+        try:
+            with game.acting_as(player_id), game.atomic():
+                for action_type, data in actions:
+                    action = GAME_ACTIONS.get(action_type)
+                    if action is None:
+                        raise ActionRejected(f'Unknown action: {action_type}')
+                    
+                    error_msg = action(game, player_id, data or {})
+                    if error_msg:
+                        raise ActionRejected(error_msg)
+        except ActionRejected as e:
+            emit('error', {'message': str(e)})
+        except Exception:
+            logger.exception("Action failed", extra={'game_id': game_id, 'player_id': player_id,
+                                                     'actions': [action_type for action_type, _ in actions]})
+            emit('error', {'message': 'Action failed'})
+        
+        broadcast_scheduler.mark_dirty(game_id)
 
 
-@socketio.on('ready_card')
-def handle_ready_card(data):
-    game_id = session.get('game_id')
-    card_id = data.get('card_id')
-    
-    if game_id not in games:
+@socket_event('batch_actions')
+def handle_batch_actions(data):
+    actions = (data.get('actions') or []) if isinstance(data, dict) else None
+    if not isinstance(actions, list) or not all(isinstance(action, dict) for action in actions):
+        emit('error', {'message': 'Invalid actions'})
         return
-    
-    game = games[game_id]
-    game.ready_card(card_id)
-    broadcast_game_update(game, game_id)
+    apply_actions([(action.get('type'), action) for action in actions])
+
+
+@socket_event('move_card')
+def handle_move_card(data):
+    apply_actions([('move_card', data)])
+
+
+@socket_event('ink_card')
+def handle_ink_card(data):
+    apply_actions([('ink_card', data)])
+
+
+@socket_event('play_card')
+def handle_play_card(data):
+    apply_actions([('play_card', data)])
+
+
+@socket_event('exert_card')
+def handle_exert_card(data):
+    apply_actions([('exert_card', data)])
+
+
+@socket_event('ready_card')
+def handle_ready_card(data):
+    apply_actions([('ready_card', data)])
 
 
-@socketio.on('add_damage')
+@socket_event('add_damage')
 def handle_add_damage(data):
-    game_id = session.get('game_id')
-    card_id = data.get('card_id')
-    
-    if game_id not in games:
-        return
-    
-    game = games[game_id]
-    game.add_damage(card_id, 1)
-    broadcast_game_update(game, game_id)
+    apply_actions([('add_damage', data)])
 
 
-@socketio.on('remove_damage')
+@socket_event('remove_damage')
 def handle_remove_damage(data):
-    game_id = session.get('game_id')
-    card_id = data.get('card_id')
-    
-    if game_id not in games:
-        return
-    
-    game = games[game_id]
-    game.remove_damage(card_id, 1)
-    broadcast_game_update(game, game_id)
+    apply_actions([('remove_damage', data)])
 
 
-@socketio.on('draw_card')
+@socket_event('draw_card')
 def handle_draw_card(data):
-    game_id = session.get('game_id')
-    player_id = session.get('player_id')
-    
-    if game_id not in games:
-        return
-    
-    game = games[game_id]
-    game.draw_cards(player_id, 1)
-    broadcast_game_update(game, game_id)
+    apply_actions([('draw_card', data)])
 
 
-@socketio.on('shuffle_deck')
+@socket_event('shuffle_deck')
 def handle_shuffle_deck(data):
-    game_id = session.get('game_id')
-    player_id = session.get('player_id')
-    
-    if game_id not in games:
-        return
-    
-    game = games[game_id]
-    game.shuffle_deck(player_id)
-    broadcast_game_update(game, game_id)
+    apply_actions([('shuffle_deck', data)])
 
 
-@socketio.on('end_turn')
+@socket_event('end_turn')
 def handle_end_turn(data):
-    game_id = session.get('game_id')
-    player_id = session.get('player_id')
-    
-    if game_id not in games:
-        return
-    
-    game = games[game_id]
-    game.end_turn(player_id)
-    broadcast_game_update(game, game_id)
+    apply_actions([('end_turn', data)])
 
 
-@socketio.on('add_lore')
+@socket_event('add_lore')
 def handle_add_lore(data):
-    game_id = session.get('game_id')
-    player_id = session.get('player_id')
-    amount = data.get('amount', 1)
-    
-    if game_id not in games:
-        return
-    
-    game = games[game_id]
-    game.add_lore(player_id, amount)
-    broadcast_game_update(game, game_id)
+    apply_actions([('add_lore', data)])
 
 
-@socketio.on('flip_mystery_card')
+@socket_event('flip_mystery_card')
 def handle_flip_mystery(data):
-    game_id = session.get('game_id')
-    player_id = session.get('player_id')
-    
-    if game_id not in games:
-        return
-    
-    game = games[game_id]
-    success = game.flip_mystery_card(player_id)
-    
-    if success:
-        broadcast_game_update(game, game_id)
-    else:
-        emit('error', {'message': 'Cannot flip mystery card yet (turn 3+)'})
+    apply_actions([('flip_mystery_card', data)])
+
+
+@socket_event('undo')
+def handle_undo(data):
+    apply_actions([('undo', data)])
+
+
+@socket_event('redo')
+def handle_redo(data):
+    apply_actions([('redo', data)])
 
 
 if __name__ == '__main__':
-    socketio.run(app, debug=True, host='0.0.0.0', port=5000, allow_unsafe_werkzeug=True)
+    # Development server with the reloader; run server.py in production
+    socketio.run(app, debug=True, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)),
+                 allow_unsafe_werkzeug=True)
@@ -0,0 +1,868 @@
+"""Benchmarks for the game server hot paths.
+
+Run from the backend directory, e.g. `python benchmarks.py memory --games 5000`.
+"""
+import argparse
+import copy
+import gc
+import inspect
+import itertools
+import json
+import pickle
+import platform
+import random
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from action_log import ActionLog
+from card_cache import CardCache
+from card_catalog import CardCatalog
+from card_images import VARIANTS as IMAGE_VARIANTS, CardImageStore, Image
+from game_executor import GameExecutor
+from game_lifecycle import GameLifecycle, estimate_game_size
+from game_state import GameState, SNAPSHOT_JSON, SNAPSHOT_MSGPACK, SPECTATOR_ID, msgpack
+from game_store import InMemoryGameStore
+from lobby import TABLE_SIZES, Lobby
+from lorcana_api import LorcanaAPI
+
+CARD_TYPES = ['Character', 'Character', 'Character', 'Action', 'Item', 'Character']
+
+
+def make_bench_deck(distinct: int = 24, size: int = 60) -> List[Dict]:
+    """Build a deterministic 60-card deck of realistic card dicts without touching the API"""
+    definitions = []
+    for i in range(distinct):
+        definitions.append({
+            'name': f"Bench Card {i}",
+            'subtitle': f"Version {i}",
+            'full_name': f"Bench Card {i} - Version {i}",
+            'image_url': f"https://example.invalid/cards/{i}.png",
+            'cost': 1 + i % 8,
+            'inkwell': i % 4 != 0,
+            'type': CARD_TYPES[i % len(CARD_TYPES)],
+            'classification': 'Storyborn, Hero',
+            'color': 'Amber',
+            'strength': i % 5,
+            'willpower': 1 + i % 6,
+            'lore': 1 + i % 3,
+            'abilities': 'When you play this character, draw a card. ' * 3,
+            'flavor_text': 'A long flavor text line that most cards carry around.',
+            'rarity': 'Common',
+            'set': 'Benchmark',
+            'card_num': i,
+            'artist': 'Nobody'
+        })
+
+    return [definitions[i % distinct] for i in range(size)]
+
+
+def new_game(game_id: str, deck: List[Dict], players: int = 3, **kwargs) -> GameState:
+    game = GameState(game_id, **kwargs)
+    for p in range(players):
+        game.add_player(f"player-{game_id}-{p}", f"Player {p + 1}", deck)
+    game.start_game()
+    return game
+
+
+def bench_memory(games: int = 5000, players: int = 3) -> Dict:
+    """Memory allocated per started game, with card definitions shared across games"""
+    deck = make_bench_deck()
+    new_game('warmup', deck, players)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+
+    start = time.perf_counter()
+    live = [new_game(str(i), deck, players) for i in range(games)]
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del live
+
+    return {
+        'games': games,
+        'players': players,
+        'bytes_per_game': allocated / games,
+        'total_mb': allocated / (1024 * 1024),
+        'create_us_per_game': elapsed / games * 1e6
+    }
+
+
+ZONES = ['deck', 'hand', 'discard', 'ink', 'summoning', 'ready']
+
+
+def bench_moves(moves: int = 10000, deck_size: int = 60, seed: int = 1) -> Dict:
+    """Random move_card calls between zones, plus draws and a mulligan"""
+    rng = random.Random(seed)
+    game = new_game('moves', make_bench_deck(size=deck_size), players=2)
+    card_ids = list(game.cards)
+    plan = [(rng.choice(card_ids), rng.choice(ZONES), rng.random() < 0.1) for _ in range(moves)]
+
+    start = time.perf_counter()
+    for card_id, to_zone, to_top in plan:
+        game.move_card(card_id, to_zone, position=0 if to_top else None)
+    move_elapsed = time.perf_counter() - start
+
+    player_id = game.player_order[0]
+    start = time.perf_counter()
+    for _ in range(moves):
+        if not game.players[player_id].zones['deck']:
+            hand = list(game.players[player_id].zones['hand'])
+            game.mulligan(player_id, hand)
+            for card_id in hand:
+                game.move_card(card_id, 'deck')
+        game.draw_cards(player_id, 1)
+    draw_elapsed = time.perf_counter() - start
+
+    return {
+        'moves': moves,
+        'deck_size': deck_size,
+        'move_us': move_elapsed / moves * 1e6,
+        'draw_us': draw_elapsed / moves * 1e6
+    }
+
+
+def random_action(game: GameState, rng: random.Random):
+    card_id = rng.randrange(1, game.next_card_id)
+    player_id = game.cards[card_id].owner
+    roll = rng.random()
+
+    if roll < 0.35:
+        game.move_card(card_id, rng.choice(ZONES), face_up=rng.choice([None, True, False]))
+    elif roll < 0.5:
+        if game.can_ink_card(card_id)[0]:
+            game.ink_card(card_id)
+    elif roll < 0.65:
+        if game.can_play_card(card_id)[0]:
+            game.play_card(card_id)
+    elif roll < 0.75:
+        game.draw_cards(player_id, 1)
+    elif roll < 0.8:
+        game.end_turn(game.current_turn)
+    elif roll < 0.85:
+        game.shuffle_deck(player_id)
+    else:
+        game.exert_card(card_id)
+    game.collect_changes()
+
+
+def bench_stress(games: int = 4, threads: int = 16, actions: int = 2000) -> Dict:
+    """Throughput of actions fired at a few games from many threads through the GameExecutor
+    (tests/test_game_executor.py checks the games stay consistent)"""
+    deck = make_bench_deck()
+    all_games = [new_game(f"stress-{i}", deck) for i in range(games)]
+    executor = GameExecutor()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        for _ in range(actions):
+            game = rng.choice(all_games)
+            executor.run(game.game_id, random_action, game, rng)
+
+    # Switch threads as often as possible to expose races
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    start = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    sys.setswitchinterval(interval)
+
+    return {
+        'games': games,
+        'threads': threads,
+        'actions': threads * actions,
+        'actions_per_sec': threads * actions / elapsed,
+        'executor': executor.stats()
+    }
+
+
+def raw_dict(game: GameState) -> Dict:
+    """The game as plain dicts, the way it would be dumped without a schema"""
+    return {
+        'game_id': game.game_id,
+        'version': game.version,
+        'current_turn': game.current_turn,
+        'turn_number': game.turn_number,
+        'player_order': game.player_order,
+        'players': {pid: player.to_dict(pid) for pid, player in game.players.items()},
+        'cards': {cid: dict(card.to_dict(card.owner), card_data=card.card_data) for cid, card in game.cards.items()}
+    }
+
+
+def bench_snapshot(actions: int = 300, rounds: int = 200, seed: int = 1) -> Dict:
+    """Size and speed of to_bytes / from_bytes against json and pickle, for a game after random actions"""
+    rng = random.Random(seed)
+    game = new_game('snapshot', make_bench_deck())
+    for _ in range(actions):
+        random_action(game, rng)
+    encodings = [SNAPSHOT_JSON] + ([SNAPSHOT_MSGPACK] if msgpack is not None else [])
+    
+    candidates = {'json.dumps(raw)': (lambda: json.dumps(raw_dict(game)).encode('utf-8'),
+                                      lambda data: json.loads(data))}
+    for encoding in encodings:
+        name = 'msgpack' if encoding == SNAPSHOT_MSGPACK else 'json'
+        candidates[f"to_bytes({name})"] = (lambda e=encoding: game.to_bytes(encoding=e), GameState.from_bytes)
+        candidates[f"to_bytes({name}, keys only)"] = (
+            lambda e=encoding: game.to_bytes(encoding=e, include_definitions=False), GameState.from_bytes)
+    
+    results = {}
+    for name, (dump, load) in candidates.items():
+        data = dump()
+        start = time.perf_counter()
+        for _ in range(rounds):
+            dump()
+        dump_elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(rounds):
+            load(data)
+        load_elapsed = time.perf_counter() - start
+        results[name] = {
+            'bytes': len(data),
+            'dump_us': dump_elapsed / rounds * 1e6,
+            'load_us': load_elapsed / rounds * 1e6
+        }
+    
+    return {
+        'actions': actions,
+        'pickle_bytes': len(pickle.dumps(game)),
+        'formats': results
+    }
+
+
+def bench_replay(games: int = 20, actions: int = 500, checkpoint_every: int = 100, seed: int = 1) -> Dict:
+    """Cost of recording random actions to an ActionLog, and of recovering every game from it"""
+    rng = random.Random(seed)
+    deck = make_bench_deck()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        log = ActionLog(os.path.join(tmp, 'actions.db'), checkpoint_every=checkpoint_every)
+        all_games = [new_game(f"replay-{i}", deck) for i in range(games)]
+        for game in all_games:
+            log.start(game)
+        
+        start = time.perf_counter()
+        for _ in range(actions):
+            for game in all_games:
+                random_action(game, rng)
+        log.flush()
+        record_elapsed = time.perf_counter() - start
+        stats = log.stats()
+        log.close()
+        
+        # Recovery as a restarted server would do it: fresh connection, every game in progress
+        start = time.perf_counter()
+        log = ActionLog(os.path.join(tmp, 'actions.db'), checkpoint_every=checkpoint_every)
+        recovered = log.recover()
+        recover_elapsed = time.perf_counter() - start
+        log.close()
+    
+    return {
+        'games': games,
+        'actions': actions,
+        'checkpoint_every': checkpoint_every,
+        'record_us_per_action': record_elapsed / (games * actions) * 1e6,
+        'recovered': len(recovered),
+        'recover_ms_per_game': recover_elapsed / games * 1000,
+        'log': stats
+    }
+
+
+def bench_undo(actions: int = 1000, seed: int = 1) -> Dict:
+    """Cost of undoing every action back to the start and redoing them all, against a deepcopy per action"""
+    rng = random.Random(seed)
+    game = new_game('undo', make_bench_deck(), seed=seed, undo_limit=actions)
+    game.clear_history()
+    
+    deepcopy_elapsed = 0.0
+    for _ in range(actions):
+        start = time.perf_counter()
+        copy.deepcopy(game)
+        deepcopy_elapsed += time.perf_counter() - start
+        random_action(game, rng)
+    
+    entries = sum(len(entry[3]) for entry in game.undo_stack)
+    steps = len(game.undo_stack)
+    
+    start = time.perf_counter()
+    for _ in range(steps):
+        game.undo()
+    undo_elapsed = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    for _ in range(steps):
+        game.redo()
+    redo_elapsed = time.perf_counter() - start
+    
+    return {
+        'actions': steps,
+        'journal_entries_per_action': entries / steps if steps else 0.0,
+        'undo_us': undo_elapsed / steps * 1e6 if steps else 0.0,
+        'redo_us': redo_elapsed / steps * 1e6 if steps else 0.0,
+        'deepcopy_us': deepcopy_elapsed / actions * 1e6
+    }
+
+
+def measure_games(build: Callable[[int], GameState], count: int):
+    """tracemalloc bytes per game for `count` games from build(i); returns (bytes, games)"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    games = [build(i) for i in range(count)]
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    return sum(stat.size_diff for stat in after.compare_to(before, 'filename')) / count, games
+
+
+def bench_lifecycle(games: int = 200, actions: int = 50, seed: int = 1) -> Dict:
+    """Compare estimate_game_size with tracemalloc, then time hibernating, waking and evicting games"""
+    deck = make_bench_deck()
+    new_game('warmup', deck)
+    
+    def played(i, players=3):
+        game = new_game(f"life-{i}", deck, players=players, seed=seed + i)
+        rng = random.Random(seed + i)
+        for _ in range(actions):
+            random_action(game, rng)
+        return game
+    
+    def viewed(i):
+        game = new_game(f"view-{i}", deck, seed=seed + i)
+        for pid in game.player_order:
+            game.get_state_json(pid)
+        return game
+    
+    # Measured on fresh games, so subtract what the cards' shared definitions and the deck add once
+    calibration = {}
+    for label, build in (
+        ('2 players', lambda i: new_game(str(i), deck, players=2)),
+        ('3 players', lambda i: new_game(str(i), deck, players=3)),
+        ('4 players', lambda i: new_game(str(i), deck, players=4)),
+        (f"3 players, {actions} actions", played),
+        ('3 players, all views as JSON', viewed)
+    ):
+        measured, built = measure_games(build, min(games, 200))
+        estimated = sum(estimate_game_size(game) for game in built) / len(built)
+        calibration[label] = {'measured': measured, 'estimated': estimated, 'ratio': estimated / measured}
+    
+    with tempfile.TemporaryDirectory() as directory:
+        lifecycle = GameLifecycle(directory, hibernate_after=3600, evict_after=7200, min_idle=0)
+        store = InMemoryGameStore(lifecycle=lifecycle)
+        for i in range(games):
+            store.save(played(i))
+        
+        lifecycle.sweep()
+        live_bytes = lifecycle.live_bytes()
+        lifecycle.memory_budget = live_bytes // 2
+        over_budget = lifecycle.sweep()['over_budget']
+        
+        lifecycle.memory_budget = None
+        lifecycle.hibernate_after = 0
+        start = time.perf_counter()
+        hibernated = lifecycle.sweep()['hibernated']
+        hibernate_elapsed = time.perf_counter() - start
+        disk_bytes = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        
+        # A new store over the same directory (as after a restart) wakes games on their next transaction
+        restarted = InMemoryGameStore(lifecycle=GameLifecycle(directory, hibernate_after=3600, evict_after=7200))
+        start = time.perf_counter()
+        for i in range(games):
+            with restarted.transaction(f"life-{i}"):
+                pass
+        wake_elapsed = time.perf_counter() - start
+        
+        restarted.lifecycle.evict_after = 0
+        evicted = restarted.lifecycle.sweep()['evicted']
+    
+    return {
+        'games': games,
+        'actions': actions,
+        'calibration': calibration,
+        'live_bytes': live_bytes,
+        'over_budget_hibernated': over_budget,
+        'hibernated': hibernated + over_budget,
+        'evicted': evicted,
+        'disk_bytes_per_game': disk_bytes / games,
+        'hibernate_ms_per_game': hibernate_elapsed / max(hibernated, 1) * 1000,
+        'wake_ms_per_game': wake_elapsed / games * 1000
+    }
+
+
+class MockCardAPI:
+    """Local stand-in for the Lorcana API's /cards/fetch, so deck parsing can be timed offline"""
+    
+    def __init__(self, latency: float = 0.0):
+        latency_s = latency
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                full_name = parse_qs(urlparse(self.path).query).get('strict', [''])[0]
+                if latency_s:
+                    time.sleep(latency_s)
+                
+                index = sum(full_name.encode('utf-8'))
+                record = {
+                    'Name': full_name,
+                    'Image': f"https://example.invalid/cards/{index}.png",
+                    'Cost': 1 + index % 8,
+                    'Inkable': index % 4 != 0,
+                    'Type': CARD_TYPES[index % len(CARD_TYPES)],
+                    'Body_Text': 'When you play this character, draw a card.',
+                    'Set_Name': 'Benchmark'
+                }
+                body = json.dumps([record]).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+    
+    def __enter__(self):
+        self.thread.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def make_png(width: int, height: int, rgb=(74, 144, 226)) -> bytes:
+    """A solid-colour PNG, so the image cache can be exercised without Pillow"""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    
+    rows = b''.join(b'\x00' + bytes(rgb) * width for _ in range(height))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b''))
+
+
+class MockImageOrigin:
+    """Local stand-in for the card image host: /cards/<n>.png, 404 for /missing/..., counts requests"""
+    
+    def __init__(self, latency: float = 0.0, width: int = 734, height: int = 1024):
+        origin = self
+        self.requests: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        body = make_png(width, height)
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with origin.lock:
+                    origin.requests[self.path] = origin.requests.get(self.path, 0) + 1
+                if latency:
+                    time.sleep(latency)
+                
+                if not self.path.startswith('/cards/'):
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+    
+    def __enter__(self):
+        self.thread.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def bench_images(images: int = 50, threads: int = 8, origin_latency_ms: float = 50.0) -> Dict:
+    """Cold, prefetch and hit cost of the card image cache against a local origin"""
+    results = {}
+    with MockImageOrigin(origin_latency_ms / 1000) as origin, tempfile.TemporaryDirectory() as directory:
+        store = CardImageStore(directory, max_workers=threads)
+        urls = [f"{origin.url}/cards/{i}.png" for i in range(images)]
+        
+        # Every thread asks for the same new image at once: one download
+        start = time.perf_counter()
+        workers = [threading.Thread(target=store.get, args=(urls[0], 'thumb')) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        results['cold_ms'] = (time.perf_counter() - start) * 1000
+        
+        start = time.perf_counter()
+        store.prefetch(urls + urls)
+        store.executor.shutdown(wait=True)
+        results['prefetch_ms_per_image'] = (time.perf_counter() - start) * 1000 / max(images - 1, 1)
+        
+        results['hit_us'] = time_call(lambda: store.get(urls[2], 'thumb'), 10000)['median_us']
+        # A new process finds the images on disk instead of fetching them again
+        restarted = CardImageStore(directory)
+        results['disk_hit_us'] = time_call(
+            lambda: restarted._read_entry(restarted._hash(urls[3])), 1000
+        )['median_us']
+        
+        disk_bytes = {name: 0 for name in IMAGE_VARIANTS}
+        entry = store.entries[store._hash(urls[1])]
+        for name, (file_name, _) in entry['variants'].items():
+            disk_bytes[name] = os.path.getsize(os.path.join(directory, file_name))
+        results['bytes'] = disk_bytes
+    
+    return {
+        'images': images,
+        'threads': threads,
+        'origin_latency_ms': origin_latency_ms,
+        'resizing': Image is not None,
+        **results,
+        'stats': store.stats()
+    }
+
+
+def time_call(fn: Callable, number: int, repeat: int = 5, setup: Optional[Callable] = None) -> Dict:
+    """Per-call time of fn over `repeat` runs of `number` calls (setup runs before each run, untimed)"""
+    runs = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        runs.append((time.perf_counter() - start) / number * 1e6)
+    runs.sort()
+    return {'median_us': runs[len(runs) // 2], 'best_us': runs[0], 'number': number, 'repeat': repeat}
+
+
+def bench_micro(number: int = 1000, api_latency_ms: float = 0.0, seed: int = 1) -> Dict:
+    """Timings of the per-request and per-action hot paths"""
+    rng = random.Random(seed)
+    deck = make_bench_deck()
+    results = {}
+    
+    # Deck parsing against the local mock API: cold (every card fetched), catalog, card cache, deck cache
+    deck_text = '\n'.join(f"4 Bench Card {i} - Version {i}" for i in range(15))
+    with MockCardAPI(api_latency_ms / 1000) as mock_api:
+        api = LorcanaAPI(cache=CardCache())
+        api.BASE_URL = mock_api.url
+        
+        def parse_cold():
+            api.cache.clear()
+            api.deck_cache.clear()
+            return api.parse_dreamborn_deck(deck_text)
+        
+        results['parse_dreamborn_deck (mock API, cold)'] = time_call(parse_cold, max(number // 100, 3))
+        if not all(card.get('set') == 'Benchmark' for card in parse_cold()):
+            raise RuntimeError("deck was not resolved through the mock API")
+        
+        api.catalog = CardCatalog(':memory:')
+        parse_cold()
+        results['parse_dreamborn_deck (catalog)'] = time_call(parse_cold, max(number // 10, 10))
+        results['parse_dreamborn_deck (card cache)'] = time_call(
+            lambda: (api.deck_cache.clear(), api.parse_dreamborn_deck(deck_text)), max(number // 10, 10))
+        results['parse_dreamborn_deck (deck cache)'] = time_call(
+            lambda: api.parse_dreamborn_deck(deck_text), number)
+    
+    def create_game():
+        game = GameState('micro')
+        for p in range(3):
+            game.add_player(f"p{p}", f"Player {p}", deck)
+        return game
+    
+    results['add_player x3 (60 cards)'] = time_call(create_game, max(number // 10, 10))
+    results['add_player x3 + start_game'] = time_call(lambda: create_game().start_game(), max(number // 10, 10))
+    
+    # Per-action methods on a started 2-player game
+    game = new_game('micro', deck, players=2, seed=seed)
+    card_ids = list(game.cards)
+    moves = itertools.cycle([(rng.choice(card_ids), rng.choice(ZONES)) for _ in range(997)])
+    results['move_card'] = time_call(lambda: game.move_card(*next(moves)), number)
+    
+    player_id = game.player_order[0]
+    hand = itertools.cycle(card_ids)
+    results['can_play_card'] = time_call(lambda: game.can_play_card(next(hand)), number)
+    
+    draw_state = {}
+    
+    def fresh_draw_game():
+        draw_state['game'] = new_game('draw', make_bench_deck(size=number + 20), players=2, seed=seed)
+    
+    results['draw_cards'] = time_call(
+        lambda: draw_state['game'].draw_cards(draw_state['game'].player_order[0], 1), number, setup=fresh_draw_game)
+    
+    # Player views for 2-4 players; a state change between calls defeats the per-version memo
+    for players in (2, 3, 4):
+        game = new_game(f"view-{players}", deck, players=players, seed=seed)
+        viewer = game.player_order[0]
+        results[f"get_state_for_player ({players} players)"] = time_call(
+            lambda: (game._mark_game(), game.get_state_for_player(viewer)), max(number // 10, 10))
+        results[f"get_state_json ({players} players)"] = time_call(
+            lambda: (game._mark_game(), game.get_state_json(viewer)), max(number // 10, 10))
+    results['get_state_for_player (memoized)'] = time_call(lambda: game.get_state_for_player(viewer), number)
+    
+    # Broadcast: one action, then every player's patch serialized, vs a full resync for everyone
+    game = new_game('broadcast', deck, players=3, seed=seed)
+    game.collect_changes()
+    face_up = itertools.cycle([cid for cid, card in game.cards.items() if card.face_up])
+    
+    def broadcast_patch(spectator_deltas=0):
+        card_id = next(face_up)
+        if game.cards[card_id].exerted:
+            game.ready_card(card_id)
+        else:
+            game.exert_card(card_id)
+        changes = game.collect_changes()
+        for pid in game.player_order:
+            json.dumps(game.get_delta_for_player(pid, changes))
+        for _ in range(spectator_deltas):
+            json.dumps(game.get_delta_for_player(SPECTATOR_ID, changes))
+    
+    def broadcast_full():
+        game._mark_game()
+        for pid in game.player_order:
+            game.get_state_json(pid)
+    
+    results['broadcast: action + 3 JSON patches'] = time_call(broadcast_patch, number)
+    # The spectator room gets one shared patch; building one per watcher is what it avoids
+    results['broadcast: + spectator room patch'] = time_call(lambda: broadcast_patch(1), number)
+    results['broadcast: + 100 per-spectator patches'] = time_call(lambda: broadcast_patch(100), max(number // 10, 10))
+    results['broadcast: 3 full JSON states'] = time_call(broadcast_full, max(number // 10, 10))
+    
+    return {'number': number, 'api_latency_ms': api_latency_ms, 'benchmarks': results}
+
+
+def bench_lobby(players: int = 5000, threads: int = 4, cancel_rate: float = 0.05, seed: int = 1) -> Dict:
+    """Queue players from several threads and time the joins and the worker creating the games"""
+    deck = make_bench_deck()
+    formats = ['core', 'infinity']
+    games: Dict[str, GameState] = {}
+    lobby = Lobby(lambda deck_text: deck, lambda game: games.__setitem__(game.game_id, game))
+    threading.Thread(target=lobby.run, daemon=True).start()
+    
+    joined: List[List] = [[] for _ in range(threads)]
+    cancelled = set()
+    
+    def join_many(index):
+        rng = random.Random(seed + index)
+        for i in range(index, players, threads):
+            start = time.perf_counter()
+            ticket = lobby.join(f"player-{i}", 'bench deck', rng.choice(TABLE_SIZES), rng.choice(formats))
+            joined[index].append((ticket, time.perf_counter() - start))
+            if rng.random() < cancel_rate and lobby.cancel(ticket.ticket_id):
+                cancelled.add(ticket.ticket_id)
+    
+    start = time.perf_counter()
+    workers = [threading.Thread(target=join_many, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    join_seconds = time.perf_counter() - start
+    
+    deadline = time.monotonic() + 120
+    while lobby.games_created + lobby.failures < lobby.tables_formed and time.monotonic() < deadline:
+        time.sleep(0.01)
+    ready_seconds = time.perf_counter() - start
+    
+    tickets = [ticket for results in joined for ticket, _ in results]
+    join_us = sorted(elapsed * 1e6 for results in joined for _, elapsed in results)
+    ready_ms = sorted(
+        (ticket.finished_at - ticket.queued_at) * 1000 for ticket in tickets if ticket.status == 'ready'
+    )
+    
+    left_waiting = sum(1 for ticket in tickets if ticket.status == 'queued')
+    listing_us = time_call(lobby.listing_json, 1000)['median_us']
+    
+    return {
+        'players': players,
+        'threads': threads,
+        'cancelled': len(cancelled),
+        'games': len(games),
+        'left_waiting': left_waiting,
+        'joins_per_sec': players / join_seconds,
+        'join_us': {'p50': join_us[len(join_us) // 2], 'p99': join_us[int(len(join_us) * 0.99)]},
+        'ready_ms': {
+            'p50': ready_ms[len(ready_ms) // 2] if ready_ms else 0.0,
+            'p99': ready_ms[int(len(ready_ms) * 0.99)] if ready_ms else 0.0,
+            'max': ready_ms[-1] if ready_ms else 0.0
+        },
+        'all_ready_s': ready_seconds,
+        'listing_us': listing_us
+    }
+
+
+def report_memory(result: Dict):
+    print(f"{result['games']} games x {result['players']} players: "
+          f"{result['bytes_per_game'] / 1024:.1f} KiB/game, {result['total_mb']:.1f} MiB total, "
+          f"{result['create_us_per_game']:.0f} us to create each game")
+
+
+def report_moves(result: Dict):
+    print(f"{result['moves']} random moves ({result['deck_size']}-card decks): "
+          f"{result['move_us']:.2f} us/move_card, "
+          f"{result['draw_us']:.2f} us/draw")
+
+
+def report_stress(result: Dict):
+    print(f"{result['actions']} actions on {result['games']} games from {result['threads']} threads: "
+          f"{result['actions_per_sec']:.0f} actions/s")
+    print(f"executor: {result['executor']}")
+
+
+def report_snapshot(result: Dict):
+    print(f"game after {result['actions']} random actions:")
+    for name, stats in result['formats'].items():
+        print(f"  {name:<28} {stats['bytes']:>7} bytes  "
+              f"dump {stats['dump_us']:7.1f} us  load {stats['load_us']:7.1f} us")
+    print(f"  {'pickle.dumps':<28} {result['pickle_bytes']:>7} bytes  (via to_bytes)")
+    if msgpack is None:
+        print("  (msgpack not installed - pip install msgpack to compare)")
+
+
+def report_undo(result: Dict):
+    print(f"{result['actions']} actions undone and redone: "
+          f"{result['journal_entries_per_action']:.1f} journal entries/action, "
+          f"undo {result['undo_us']:.1f} us, redo {result['redo_us']:.1f} us "
+          f"(deepcopy of the game: {result['deepcopy_us']:.0f} us)")
+
+
+def report_replay(result: Dict):
+    print(f"{result['games']} games x {result['actions']} actions, checkpoint every "
+          f"{result['checkpoint_every']}: {result['record_us_per_action']:.1f} us/action with logging, "
+          f"recovery {result['recover_ms_per_game']:.2f} ms/game ({result['recovered']} games)")
+    print(f"log: {result['log']}")
+
+
+def report_lifecycle(result: Dict):
+    print("estimate_game_size vs tracemalloc:")
+    for label, sizes in result['calibration'].items():
+        print(f"  {label:<32} measured {sizes['measured'] / 1024:7.1f} KiB, "
+              f"estimated {sizes['estimated'] / 1024:7.1f} KiB ({sizes['ratio']:.2f}x)")
+    print(f"{result['games']} games x {result['actions']} actions: {result['live_bytes'] / 1024 / 1024:.1f} MiB "
+          f"estimated live, {result['over_budget_hibernated']} hibernated for a half-size budget")
+    print(f"hibernate {result['hibernate_ms_per_game']:.2f} ms/game, wake {result['wake_ms_per_game']:.2f} ms/game, "
+          f"{result['disk_bytes_per_game'] / 1024:.1f} KiB/game on disk, {result['evicted']} evicted")
+
+
+def report_micro(result: Dict):
+    for name, stats in result['benchmarks'].items():
+        print(f"  {name:<40} {stats['median_us']:10.2f} us  (best {stats['best_us']:.2f}, n={stats['number']})")
+
+
+def report_lobby(result: Dict):
+    print(f"{result['players']} players queued from {result['threads']} threads: "
+          f"{result['joins_per_sec']:.0f} joins/s (p50 {result['join_us']['p50']:.1f} us, "
+          f"p99 {result['join_us']['p99']:.1f} us), {result['cancelled']} cancelled")
+    print(f"{result['games']} games, all ready after {result['all_ready_s']:.2f}s; queue to game: "
+          f"p50 {result['ready_ms']['p50']:.0f} ms, p99 {result['ready_ms']['p99']:.0f} ms, "
+          f"max {result['ready_ms']['max']:.0f} ms; {result['left_waiting']} left waiting")
+    print(f"listing: {result['listing_us']:.2f} us per request")
+
+
+def report_images(result: Dict):
+    print(f"{result['images']} images from a local origin ({result['origin_latency_ms']:.0f} ms latency), "
+          f"resizing {'on' if result['resizing'] else 'off (pip install Pillow)'}")
+    print(f"  cold, {result['threads']} concurrent requests: {result['cold_ms']:.1f} ms; "
+          f"prefetch {result['prefetch_ms_per_image']:.2f} ms/image")
+    print(f"  cached: {result['hit_us']:.2f} us in memory, {result['disk_hit_us']:.1f} us from disk")
+    print(f"  bytes on disk: {', '.join(f'{name} {size}' for name, size in result['bytes'].items())}")
+
+
+# name -> (benchmark, report, help, help for some of its options); the options are the benchmark's arguments
+BENCHMARKS = {
+    'memory': (bench_memory, report_memory, 'memory per game', {}),
+    'moves': (bench_moves, report_moves, 'random move_card / draw_cards microbenchmark', {}),
+    'stress': (bench_stress, report_stress, 'concurrent actions through GameExecutor',
+               {'actions': 'actions per thread'}),
+    'snapshot': (bench_snapshot, report_snapshot, 'GameState.to_bytes size and speed',
+                 {'actions': 'random actions before the snapshot'}),
+    'replay': (bench_replay, report_replay, 'ActionLog recording and recovery time',
+               {'actions': 'random actions per game'}),
+    'undo': (bench_undo, report_undo, 'undo/redo cost against deepcopy', {}),
+    'lifecycle': (bench_lifecycle, report_lifecycle, 'game size estimates, hibernation, wake and eviction',
+                  {'actions': 'random actions per game'}),
+    'micro': (bench_micro, report_micro, 'micro benchmarks of the server hot paths', {
+        'number': 'calls per timing run',
+        'api_latency_ms': 'delay added by the mock card API to each request'
+    }),
+    'lobby': (bench_lobby, report_lobby, 'matchmaking throughput', {
+        'threads': 'threads joining the queues',
+        'cancel_rate': 'share of players who try to leave the queue right after joining'
+    }),
+    'images': (bench_images, report_images, 'card image cache against a local stand-in origin', {})
+}
+
+
+def environment() -> Dict:
+    """Where a result came from, stored next to it in the JSON output"""
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'msgpack': msgpack is not None,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    # Every benchmark can write its result as JSON, for tracking regressions over time
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument('--json', action='store_true', help='print the result as JSON')
+    output.add_argument('--output', help='also write the JSON result to this file')
+
+    for name, (benchmark, _, description, option_help) in BENCHMARKS.items():
+        command = sub.add_parser(name, parents=[output], help=description)
+        for option in inspect.signature(benchmark).parameters.values():
+            command.add_argument(f"--{option.name.replace('_', '-')}", type=type(option.default),
+                                 default=option.default, help=option_help.get(option.name))
+
+    args = parser.parse_args()
+    options = {name: value for name, value in vars(args).items() if name not in ('command', 'json', 'output')}
+    benchmark, report = BENCHMARKS[args.command][:2]
+    result = benchmark(**options)
+    
+    if args.json or args.output:
+        data = json.dumps({'benchmark': args.command, 'environment': environment(), 'result': result}, indent=2)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(data + '\n')
+        if args.json:
+            print(data)
+    if not args.json:
+        report(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import threading
+from typing import Callable, Set
+
+from logs import get_logger
+from metrics import REGISTRY
+
+logger = get_logger('broadcast')
+
+BROADCAST_FAILURES = REGISTRY.counter('lorcana_broadcast_failures_total', 'Game broadcasts that raised')
+
+
+class BroadcastScheduler:
+    """Coalesces game updates: games are marked dirty by actions and flushed
+    at most once per tick, so a burst of actions produces a single broadcast.
+    """
+
+    def __init__(self, socketio, flush_game: Callable[[str], None], interval: float = 0.03):
+        self.socketio = socketio
+        self.flush_game = flush_game
+        self.interval = interval
+        self.dirty: Set[str] = set()
+        self.lock = threading.Lock()
+        self.task = None
+
+        self.flushes = 0
+        self.coalesced = 0
+
+    def mark_dirty(self, game_id: str):
+        with self.lock:
+            if game_id in self.dirty:
+                self.coalesced += 1
+            self.dirty.add(game_id)
+
+            if self.task is None:
+                self.task = self.socketio.start_background_task(self._run)
+
+    def flush(self):
+        """Broadcast every dirty game now"""
+        with self.lock:
+            game_ids = self.dirty
+            self.dirty = set()
+
+        for game_id in game_ids:
+            try:
+                self.flush_game(game_id)
+                self.flushes += 1
+            except Exception:
+                BROADCAST_FAILURES.inc()
+                logger.exception("Broadcast failed", extra={'game_id': game_id})
+
+    def stats(self):
+        return {
+            'interval_ms': self.interval * 1000,
+            'pending': len(self.dirty),
+            'flushes': self.flushes,
+            'coalesced': self.coalesced
+        }
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.interval)
+            if self.dirty:
+                self.flush()
@@ -0,0 +1,162 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from logs import get_logger
+
+logger = get_logger('card_cache')
+
+
+class CardCache:
+    """Size-bounded LRU cache for resolved cards (also used for resolved decks).
+
+    Real cards never expire. Negative entries (card not found) and mock
+    placeholders (API unavailable) get their own short TTLs so a transient
+    outage does not stick to a card for the life of the process.
+    """
+
+    def __init__(self, max_size: int = 4096, negative_ttl: float = 300, mock_ttl: float = 30,
+                 path: Optional[str] = None):
+        self.max_size = max_size
+        self.ttls = {'card': None, 'negative': negative_ttl, 'mock': mock_ttl}
+        self.path = path
+        self.lock = threading.RLock()
+        # Held for a whole save, so saves finish in order and a newer file is never replaced by an older one
+        self.save_lock = threading.Lock()
+        self.entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.dirty = False
+        # Bumped by every change, so a save only clears `dirty` if nothing changed while it wrote
+        self.generation = 0
+
+        if path and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key: str):
+        return self.get(key, count=False) is not None
+
+    def get(self, key: str, count: bool = True) -> Optional[Dict]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                if count:
+                    self.misses += 1
+                return None
+
+            value, kind, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self.entries[key]
+                self.expirations += 1
+                if count:
+                    self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            if count:
+                self.hits += 1
+            return value
+
+    def set(self, key: str, value: Dict, kind: str = 'card'):
+        """Store a card; kind is 'card', 'negative' or 'mock'"""
+        ttl = self.ttls[kind]
+        expires_at = time.time() + ttl if ttl is not None else None
+
+        with self.lock:
+            self.entries[key] = (value, kind, expires_at)
+            self.entries.move_to_end(key)
+            self.dirty = True
+            self.generation += 1
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.dirty = True
+            self.generation += 1
+
+    def stats(self) -> Dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+    def save(self):
+        """Write unexpired entries to disk so a restarted server starts warm"""
+        if not self.path:
+            return
+
+        with self.save_lock:
+            with self.lock:
+                now = time.time()
+                data = [
+                    [key, value, kind, expires_at]
+                    for key, (value, kind, expires_at) in self.entries.items()
+                    if expires_at is None or expires_at > now
+                ]
+                generation = self.generation
+
+            # A temp file of its own per save, so saves from several processes never share one
+            fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(os.path.abspath(self.path)))
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.path)
+            except Exception:
+                os.remove(tmp_path)
+                raise
+
+            with self.lock:
+                if self.generation == generation:
+                    self.dirty = False
+
+    def flush(self):
+        """Save if anything changed since the last save; a failed save is retried next time"""
+        if not self.path or not self.dirty:
+            return
+        try:
+            self.save()
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning("Could not save card cache", extra={'path': self.path, 'error': str(e)})
+
+    def run(self, sleep: Callable[[float], None], interval: float = 60):
+        """Flush forever (start with socketio.start_background_task)"""
+        while True:
+            sleep(interval)
+            self.flush()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not load card cache", extra={'path': self.path, 'error': str(e)})
+            return
+
+        now = time.time()
+        with self.lock:
+            for key, value, kind, expires_at in data:
+                if expires_at is None or expires_at > now:
+                    self.entries[key] = (value, kind, expires_at)
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
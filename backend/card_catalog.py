@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cards.db')
+
+
+def card_key(main_name: str, subtitle: Optional[str]) -> str:
+    """Normalized lookup key for a card (`name|subtitle`, or `name|no_subtitle`)"""
+    main_name = ' '.join(main_name.split())
+    subtitle = ' '.join(subtitle.split()) if subtitle else 'NO_SUBTITLE'
+    return f"{main_name}|{subtitle}".lower()
+
+
+def split_card_name(record: Dict) -> Tuple[str, Optional[str]]:
+    """Split an API record into (main_name, subtitle)"""
+    name = (record.get('Name') or '').strip()
+    subtitle = (record.get('Subtitle') or '').strip()
+
+    if not subtitle and ' - ' in name:
+        name, subtitle = name.split(' - ', 1)
+    elif subtitle and name.endswith(f" - {subtitle}"):
+        name = name[:-len(subtitle) - 3]
+
+    return name.strip(), subtitle.strip() or None
+
+
+def card_info_from_api(card: Dict, main_name: str, subtitle: Optional[str]) -> Dict:
+    """Build the card dict used by the game from a raw API record"""
+    return {
+        'name': card.get('Name', main_name),
+        'subtitle': card.get('Subtitle', subtitle) if subtitle else '',
+        'full_name': f"{main_name} - {subtitle}" if subtitle else main_name,
+        'image_url': card.get('Image'),
+        'cost': card.get('Cost'),
+        'inkwell': card.get('Inkable'),
+        'type': card.get('Type'),
+        'classification': card.get('Classifications'),
+        'color': card.get('Color'),
+        'strength': card.get('Strength'),
+        'willpower': card.get('Willpower'),
+        'lore': card.get('Lore_Value') or card.get('Lore'),
+        'abilities': card.get('Body_Text'),
+        'flavor_text': card.get('Flavor_Text'),
+        'rarity': card.get('Rarity'),
+        'set': card.get('Set_Name'),
+        'card_num': card.get('Card_Num'),
+        'artist': card.get('Artist')
+    }
+
+
+class CardCatalog:
+    """Local snapshot of the full card set, stored in SQLite and served from memory"""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cards ("
+            "key TEXT PRIMARY KEY, content_hash TEXT NOT NULL, data TEXT NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)"
+        )
+        self.conn.commit()
+
+        self.cards: Dict[str, Dict] = {}
+        self.hashes: Dict[str, str] = {}
+        for key, content_hash, data in self.conn.execute("SELECT key, content_hash, data FROM cards"):
+            self.cards[key] = json.loads(data)
+            self.hashes[key] = content_hash
+
+    def __len__(self):
+        return len(self.cards)
+
+    def __contains__(self, key: str):
+        return key in self.cards
+
+    def get(self, main_name: str, subtitle: Optional[str]) -> Optional[Dict]:
+        """Look up a card by name and subtitle (in-memory, never touches disk)"""
+        return self.cards.get(card_key(main_name, subtitle))
+
+    def put(self, main_name: str, subtitle: Optional[str], card_info: Dict):
+        """Add or replace a single card in the snapshot"""
+        self._upsert([(card_key(main_name, subtitle), card_info)])
+
+    def import_records(self, records: Iterable[Dict]) -> Dict[str, int]:
+        """Upsert raw API records, only rewriting cards whose content changed"""
+        rows = []
+        for record in records:
+            main_name, subtitle = split_card_name(record)
+            if not main_name:
+                continue
+            rows.append((card_key(main_name, subtitle), card_info_from_api(record, main_name, subtitle)))
+
+        return self._upsert(rows)
+
+    def import_dump(self, path: str) -> Dict[str, int]:
+        """One-time import of a JSON dump of the full card set"""
+        with open(path, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+        return self.import_records(records)
+
+    def refresh(self, base_url: str, timeout: float = 30) -> Dict[str, int]:
+        """Download the full card list from the API and apply only the changes"""
+        response = requests.get(f"{base_url}/cards/all", timeout=timeout)
+        response.raise_for_status()
+        return self.import_records(response.json())
+
+    def last_updated(self) -> Optional[float]:
+        row = self.conn.execute("SELECT value FROM meta WHERE name = 'last_updated'").fetchone()
+        return float(row[0]) if row else None
+
+    def close(self):
+        self.conn.close()
+
+    def _upsert(self, rows: List[Tuple[str, Dict]]) -> Dict[str, int]:
+        with self.lock:
+            return self._upsert_locked(rows)
+
+    def _upsert_locked(self, rows: List[Tuple[str, Dict]]) -> Dict[str, int]:
+        added = updated = unchanged = 0
+        changed = []
+
+        for key, card_info in rows:
+            data = json.dumps(card_info, sort_keys=True)
+            content_hash = hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+            if self.hashes.get(key) == content_hash:
+                unchanged += 1
+                continue
+
+            if key in self.hashes:
+                updated += 1
+            else:
+                added += 1
+
+            changed.append((key, content_hash, data))
+            self.cards[key] = card_info
+            self.hashes[key] = content_hash
+
+        if changed:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO cards (key, content_hash, data) VALUES (?, ?, ?)",
+                    changed
+                )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO meta (name, value) VALUES ('last_updated', ?)",
+                    (str(time.time()),)
+                )
+
+        return {'added': added, 'updated': updated, 'unchanged': unchanged}
+
+
+def main(argv: List[str]) -> int:
+    """Command line entry point: `import <dump.json>` or `refresh`"""
+    if not argv or argv[0] not in ('import', 'refresh'):
+        print("Usage: python card_catalog.py import <dump.json> [db_path]")
+        print("       python card_catalog.py refresh [db_path]")
+        return 1
+
+    command = argv[0]
+    if command == 'import':
+        if len(argv) < 2:
+            print("Missing path to JSON dump")
+            return 1
+        catalog = CardCatalog(argv[2] if len(argv) > 2 else DEFAULT_DB_PATH)
+        result = catalog.import_dump(argv[1])
+    else:
+        from lorcana_api import LorcanaAPI
+        catalog = CardCatalog(argv[1] if len(argv) > 1 else DEFAULT_DB_PATH)
+        result = catalog.refresh(LorcanaAPI.BASE_URL)
+
+    print(f"{command}: {result['added']} added, {result['updated']} updated, "
+          f"{result['unchanged']} unchanged ({len(catalog)} cards in {catalog.db_path})")
+    catalog.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
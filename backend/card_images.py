@@ -0,0 +1,272 @@
+"""Local cache of card images, served by /card_image/<key>.
+
+Each image URL is fetched from its origin once, written to disk next to its
+resized variants and served from there with strong ETags, so renders do not
+depend on the card site being up or fast. Bundled placeholder art (UI/
+placeholders) stands in for mock cards and for images that cannot be fetched.
+
+Resizing needs Pillow (`pip install Pillow`); without it every variant is the
+original image.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+from logs import get_logger
+from metrics import REGISTRY
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = get_logger('card_images')
+
+IMAGE_FETCH_SECONDS = REGISTRY.histogram(
+    'lorcana_card_image_fetch_seconds', 'Card image download and variant generation', ['outcome'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+
+PLACEHOLDER_URL = '/static/placeholders/'
+PLACEHOLDER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'UI', 'placeholders')
+PLACEHOLDER_TYPES = ('character', 'action', 'item')
+
+# Board cards are 120px wide; variants are sized for 2x displays
+VARIANTS = {'thumb': (240, 336), 'full': (500, 700)}
+
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png', 'png'),
+    (b'\xff\xd8\xff', 'image/jpeg', 'jpg'),
+    (b'GIF87a', 'image/gif', 'gif'),
+    (b'GIF89a', 'image/gif', 'gif'),
+)
+
+
+def sniff_image(data: bytes) -> Optional[Tuple[str, str]]:
+    """(mimetype, extension) from the file's magic bytes, or None if it is not an image we serve"""
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp', 'webp'
+    for signature, mimetype, extension in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return mimetype, extension
+    return None
+
+
+class CardImage:
+    """A file to send for one image request"""
+    __slots__ = ('path', 'mimetype', 'etag', 'max_age', 'immutable')
+
+    def __init__(self, path: str, mimetype: str, etag: str, max_age: int, immutable: bool = False):
+        self.path = path
+        self.mimetype = mimetype
+        self.etag = etag
+        self.max_age = max_age
+        self.immutable = immutable
+
+
+class CardImageStore:
+    """Fetch-once disk cache of card images and their resized variants.
+
+    `directory` holds one `<url hash>.json` entry per image URL, written
+    last so a half-finished fetch is never served, plus the original and
+    variant files named by the original's content hash. A URL that fails to
+    fetch is retried after `failure_ttl` seconds; until then, and always
+    when `offline`, it is served as a placeholder with a short max-age.
+    """
+
+    def __init__(self, directory: str, placeholder_dir: str = PLACEHOLDER_DIR, offline: bool = False,
+                 timeout: float = 10, max_bytes: int = 8 * 1024 * 1024, failure_ttl: float = 300,
+                 max_workers: int = 4):
+        self.directory = directory
+        self.placeholder_dir = os.path.abspath(placeholder_dir)
+        self.offline = offline
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.failure_ttl = failure_ttl
+        self.session = requests.Session()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='card-images')
+
+        self.lock = threading.Lock()
+        # url hash -> entry, for images already on disk
+        self.entries: Dict[str, Dict] = {}
+        self.failed: Dict[str, float] = {}
+        # One [lock, users] per URL being fetched, so concurrent requests download it once
+        self.fetching: Dict[str, List] = {}
+        self.placeholders: Dict[str, CardImage] = {}
+
+        self.hits = 0
+        self.fetches = 0
+        self.failures = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, url: str, variant: str = 'full', card_type: str = '') -> CardImage:
+        """The file for `url` at `variant`, fetching it first if this is its first request"""
+        if url.startswith(PLACEHOLDER_URL):
+            return self.placeholder(url[len(PLACEHOLDER_URL):].rsplit('.', 1)[0], immutable=True)
+
+        entry = self._entry(url)
+        if entry is None:
+            return self.placeholder(card_type, immutable=False)
+
+        file_name, mimetype = entry['variants'].get(variant) or entry['variants']['full']
+        return CardImage(os.path.join(self.directory, file_name), mimetype,
+                         f"{entry['digest']}-{variant}", max_age=31536000, immutable=True)
+
+    def placeholder(self, card_type: str, immutable: bool) -> CardImage:
+        """Bundled art for a card type; a stand-in (immutable=False) is only cached briefly"""
+        name = card_type.lower() if card_type.lower() in PLACEHOLDER_TYPES else 'action'
+        key = f"{name}:{immutable}"
+        image = self.placeholders.get(key)
+        if image is None:
+            path = os.path.join(self.placeholder_dir, f"{name}.svg")
+            with open(path, 'rb') as f:
+                digest = hashlib.sha1(f.read()).hexdigest()
+            image = CardImage(path, 'image/svg+xml', digest,
+                              max_age=86400 if immutable else 300, immutable=False)
+            self.placeholders[key] = image
+        return image
+
+    def prefetch(self, urls: Iterable[Optional[str]]):
+        """Fetch images in the background (e.g. when a deck is resolved), so first renders hit the cache"""
+        if self.offline:
+            return
+        for url in set(urls):
+            if url and url.startswith(('http://', 'https://')):
+                url_hash = self._hash(url)
+                if url_hash not in self.entries and url_hash not in self.fetching:
+                    self.executor.submit(self._entry, url)
+
+    def _hash(self, url: str) -> str:
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def _entry(self, url: str) -> Optional[Dict]:
+        url_hash = self._hash(url)
+        entry = self.entries.get(url_hash)
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        with self.lock:
+            fetching = self.fetching.setdefault(url_hash, [threading.Lock(), 0])
+            fetching[1] += 1
+        try:
+            with fetching[0]:
+                # Whoever held the lock may have fetched it, or an earlier run left it on disk
+                entry = self.entries.get(url_hash) or self._read_entry(url_hash)
+                if entry is not None:
+                    self.hits += 1
+                    self.entries[url_hash] = entry
+                    return entry
+
+                failed_at = self.failed.get(url_hash)
+                if self.offline or not url.startswith(('http://', 'https://')) or (
+                        failed_at is not None and time.monotonic() - failed_at < self.failure_ttl):
+                    return None
+
+                entry = self._fetch(url, url_hash)
+                if entry is None:
+                    self.failed[url_hash] = time.monotonic()
+                else:
+                    self.failed.pop(url_hash, None)
+                    self.entries[url_hash] = entry
+                return entry
+        finally:
+            # Drop the lock with its last user; a newcomer must not get a second lock while others wait on this one
+            with self.lock:
+                fetching[1] -= 1
+                if not fetching[1]:
+                    del self.fetching[url_hash]
+
+    def _read_entry(self, url_hash: str) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self.directory, f"{url_hash}.json"), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _fetch(self, url: str, url_hash: str) -> Optional[Dict]:
+        start = time.perf_counter()
+        try:
+            with self.session.get(url, timeout=self.timeout, stream=True) as response:
+                response.raise_for_status()
+                data = bytearray()
+                for chunk in response.iter_content(65536):
+                    data.extend(chunk)
+                    if len(data) > self.max_bytes:
+                        raise ValueError(f"larger than {self.max_bytes} bytes")
+            data = bytes(data)
+            kind = sniff_image(data)
+            if kind is None:
+                raise ValueError("not a PNG, JPEG, GIF or WebP image")
+
+            digest = hashlib.sha1(data).hexdigest()
+            mimetype, extension = kind
+            original = f"{digest}.{extension}"
+            self._write(original, data)
+
+            entry = {
+                'url': url,
+                'digest': digest,
+                'variants': self._make_variants(digest, data, (original, mimetype))
+            }
+            self._write(f"{url_hash}.json", json.dumps(entry).encode('utf-8'))
+        except (requests.RequestException, OSError, ValueError) as e:
+            self.failures += 1
+            IMAGE_FETCH_SECONDS.labels(outcome='error').observe(time.perf_counter() - start)
+            logger.warning("Could not fetch card image", extra={'url': url, 'error': str(e)})
+            return None
+
+        self.fetches += 1
+        IMAGE_FETCH_SECONDS.labels(outcome='fetched').observe(time.perf_counter() - start)
+        return entry
+
+    def _make_variants(self, digest: str, data: bytes, original: Tuple[str, str]) -> Dict[str, Tuple[str, str]]:
+        """WebP files scaled down to each variant's box (never up); the original without Pillow"""
+        variants = {name: original for name in VARIANTS}
+        if Image is None:
+            return variants
+
+        try:
+            with Image.open(BytesIO(data)) as image:
+                image.load()
+                has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+                resized = image.convert('RGBA' if has_alpha else 'RGB')
+                # Largest box first, so each smaller variant is scaled from the one before
+                for name, box in sorted(VARIANTS.items(), key=lambda item: -item[1][0]):
+                    resized.thumbnail(box, Image.LANCZOS, reducing_gap=2.0)
+                    output = BytesIO()
+                    resized.save(output, 'WEBP', quality=85, method=4)
+                    file_name = f"{digest}.{name}.webp"
+                    self._write(file_name, output.getvalue())
+                    variants[name] = (file_name, 'image/webp')
+        except (OSError, ValueError) as e:
+            # Pillow could not read it (or lacks WebP support): serve the original everywhere
+            logger.warning("Could not resize card image", extra={'digest': digest, 'error': str(e)})
+            return {name: original for name in VARIANTS}
+        return variants
+
+    def _write(self, file_name: str, data: bytes):
+        path = os.path.join(self.directory, file_name)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def stats(self) -> Dict:
+        return {
+            'cached': len(self.entries),
+            'hits': self.hits,
+            'fetches': self.fetches,
+            'failures': self.failures,
+            'failing': len(self.failed),
+            'resizing': Image is not None,
+            'offline': self.offline
+        }
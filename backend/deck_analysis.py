@@ -0,0 +1,254 @@
+"""Opening-hand and draw probabilities for a resolved deck.
+
+Exact values use hypergeometric math. Monte Carlo estimates deal the way
+GameState.start_game does (mystery card off the top, then a 7-card hand)
+and exist mainly as a cross-check.
+
+The mystery card is a uniformly random card nobody sees, so it does not
+change the distribution of the hand or later draws - a hand is a uniform
+7-card subset of the whole deck. It only matters for the mulligan redraw,
+where it is one fewer unseen card in the deck.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from math import comb
+from typing import Callable, Dict, List, Optional
+
+from game_state import CardDefinition
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+HAND_SIZE = 7
+# Trials sampled at once by the NumPy Monte Carlo
+MONTE_CARLO_CHUNK = 65536
+
+CardPredicate = Callable[[CardDefinition], bool]
+
+
+def hypergeom_pmf(k: int, population: int, successes: int, draws: int) -> float:
+    """P(exactly k successes in `draws` cards from `population` cards containing `successes`)"""
+    if k < 0 or k > draws or k > successes or draws - k > population - successes:
+        return 0.0
+    return comb(successes, k) * comb(population - successes, draws - k) / comb(population, draws)
+
+
+def hypergeom_at_least(k: int, population: int, successes: int, draws: int) -> float:
+    return sum(hypergeom_pmf(i, population, successes, draws) for i in range(max(k, 0), draws + 1))
+
+
+def is_inkable(definition: CardDefinition) -> bool:
+    return definition.inkable
+
+
+def costs(cost: int) -> CardPredicate:
+    return lambda definition: definition.cost == cost
+
+
+def deck_definitions(deck: List[Dict]) -> List[CardDefinition]:
+    """Card definitions for a resolved deck, parsed the same way GameState does.
+
+    They are built for this analysis only and not interned, so deck lists
+    posted for analysis do not grow the game's definition table.
+    """
+    parsed: Dict[int, CardDefinition] = {}
+    for card in deck:
+        if id(card) not in parsed:
+            parsed[id(card)] = CardDefinition(-1, '', card)
+    return [parsed[id(card)] for card in deck]
+
+
+def count_matching(deck: List[Dict], predicate: CardPredicate) -> int:
+    return sum(1 for definition in deck_definitions(deck) if predicate(definition))
+
+
+def cards_seen(turn: int, on_play: bool = True, hand_size: int = HAND_SIZE) -> int:
+    """Cards in hand plus draws by `turn` (the starting player skips their first draw)"""
+    return hand_size + (turn - 1 if on_play else turn)
+
+
+def opening_distribution(deck_size: int, matching: int, hand_size: int = HAND_SIZE) -> List[float]:
+    """P(i matching cards in the opening hand) for i = 0..hand_size"""
+    return [hypergeom_pmf(i, deck_size, matching, hand_size) for i in range(hand_size + 1)]
+
+
+def p_opening_at_least(deck_size: int, matching: int, k: int, hand_size: int = HAND_SIZE) -> float:
+    return hypergeom_at_least(k, deck_size, matching, hand_size)
+
+
+def p_after_mulligan_at_least(deck_size: int, matching: int, k: int, hand_size: int = HAND_SIZE) -> float:
+    """P(at least k matching cards after the mulligan, when a hand with fewer than k
+    puts back every non-matching card.
+
+    GameState.mulligan shuffles the put-back cards into the deck and redraws the
+    same number; the deck then holds every unseen card except the mystery card.
+    """
+    unseen = deck_size - hand_size
+    if unseen <= 0:
+        # No mystery card and nothing to redraw from
+        return p_opening_at_least(deck_size, matching, k, hand_size)
+
+    total = 0.0
+    for i in range(hand_size + 1):
+        p_hand = hypergeom_pmf(i, deck_size, matching, hand_size)
+        if p_hand == 0.0:
+            continue
+        if i >= k:
+            total += p_hand
+            continue
+
+        put_back = hand_size - i
+        unseen_matching = matching - i
+        # The mystery card is one of the unseen cards, matching or not
+        for mystery_matches, p_mystery in ((1, unseen_matching / unseen), (0, 1 - unseen_matching / unseen)):
+            if p_mystery == 0.0:
+                continue
+            deck_left = unseen - 1 + put_back
+            total += p_hand * p_mystery * hypergeom_at_least(
+                k - i, deck_left, unseen_matching - mystery_matches, put_back
+            )
+    return total
+
+
+def p_by_turn(deck_size: int, matching: int, turn: int, k: int = 1, on_play: bool = True,
+              hand_size: int = HAND_SIZE) -> float:
+    """P(at least k matching cards seen by `turn`, without mulligan)"""
+    seen = min(cards_seen(turn, on_play, hand_size), deck_size - 1)
+    return hypergeom_at_least(k, deck_size, matching, seen)
+
+
+def monte_carlo(deck: List[Dict], predicate: CardPredicate, k: int, turn: Optional[int] = None,
+                mulligan: bool = False, on_play: bool = True, trials: int = 100000,
+                seed: int = 0, hand_size: int = HAND_SIZE) -> float:
+    """Estimate the same probabilities by sampling: the opening hand (or the cards seen by
+    `turn`), optionally after the put-back-non-matching mulligan.
+
+    With NumPy, only the counts are sampled (hypergeometric draws, in chunks of
+    MONTE_CARLO_CHUNK trials), so memory does not grow with `trials`; without
+    it, the deck is shuffled card by card.
+    """
+    if mulligan and turn is not None:
+        raise ValueError("The mulligan estimate is for the opening hand only")
+
+    matches = [predicate(definition) for definition in deck_definitions(deck)]
+    deck_size = len(matches)
+    seen = hand_size if turn is None else min(cards_seen(turn, on_play, hand_size), deck_size - 1)
+
+    if np is None:
+        return _monte_carlo_python(matches, k, seen, mulligan, trials, seed, hand_size)
+
+    rng = np.random.default_rng(seed)
+    matching = sum(matches)
+    hits = 0
+    for start in range(0, trials, MONTE_CARLO_CHUNK):
+        size = min(MONTE_CARLO_CHUNK, trials - start)
+        if not mulligan:
+            counts = rng.hypergeometric(matching, deck_size - matching, seen, size=size)
+        else:
+            counts = rng.hypergeometric(matching, deck_size - matching, hand_size, size=size)
+            redo = counts < k
+            in_hand = counts[redo]
+            # The mystery card is one of the cards left after the hand
+            rest = deck_size - hand_size
+            mystery = rng.random(in_hand.size) * rest < matching - in_hand
+            put_back = hand_size - in_hand
+            left_matching = matching - in_hand - mystery
+            left_other = rest - 1 + put_back - left_matching
+            counts[redo] = in_hand + rng.hypergeometric(left_matching, left_other, put_back)
+        hits += int((counts >= k).sum())
+    return hits / trials
+
+
+def _monte_carlo_python(matches: List[bool], k: int, seen: int, mulligan: bool, trials: int,
+                        seed: int, hand_size: int) -> float:
+    rng = random.Random(seed)
+    deck = list(matches)
+    hits = 0
+    for _ in range(trials):
+        rng.shuffle(deck)
+        hand = deck[1:1 + hand_size]
+        in_hand = sum(hand)
+        if mulligan and in_hand < k:
+            rest = deck[1 + hand_size:] + [False] * (hand_size - in_hand)
+            rng.shuffle(rest)
+            in_hand += sum(rest[:hand_size - in_hand])
+            hits += in_hand >= k
+        else:
+            hits += sum(deck[1:1 + seen]) >= k
+    return hits / trials
+
+
+def analyze_deck(deck: List[Dict], max_turn: int = 7, hand_size: int = HAND_SIZE) -> Dict:
+    """Summary used by the deck builder: inkable odds and on-curve odds for each cost"""
+    definitions = deck_definitions(deck)
+    deck_size = len(definitions)
+    inkable = sum(1 for definition in definitions if definition.inkable)
+
+    cost_counts: Dict[int, int] = {}
+    for definition in definitions:
+        cost_counts[definition.cost] = cost_counts.get(definition.cost, 0) + 1
+
+    return {
+        'deck_size': deck_size,
+        'hand_size': hand_size,
+        'inkable': inkable,
+        'cost_counts': {cost: cost_counts[cost] for cost in sorted(cost_counts)},
+        'opening_inkable': opening_distribution(deck_size, inkable, hand_size),
+        'inkable_at_least': {
+            k: {
+                'opening': p_opening_at_least(deck_size, inkable, k, hand_size),
+                'after_mulligan': p_after_mulligan_at_least(deck_size, inkable, k, hand_size)
+            }
+            for k in range(1, 5)
+        },
+        # P(holding a cost-N card on turn N), going first / second
+        'on_curve': {
+            cost: {
+                'on_play': p_by_turn(deck_size, cost_counts[cost], cost, 1, True, hand_size),
+                'on_draw': p_by_turn(deck_size, cost_counts[cost], cost, 1, False, hand_size)
+            }
+            for cost in range(1, max_turn + 1) if cost in cost_counts
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('deck', help="Dreamborn deck list file ('-' for stdin)")
+    parser.add_argument('--check', type=int, default=0, metavar='TRIALS',
+                        help='compare the exact numbers with a Monte Carlo run of this many shuffles')
+    parser.add_argument('--card-db', default=None)
+    parser.add_argument('--offline', action='store_true', help='resolve cards from the local catalog only')
+    args = parser.parse_args()
+
+    from card_catalog import CardCatalog, DEFAULT_DB_PATH
+    from lorcana_api import LorcanaAPI
+
+    deck_text = sys.stdin.read() if args.deck == '-' else open(args.deck, encoding='utf-8').read()
+    api = LorcanaAPI(catalog=CardCatalog(args.card_db or DEFAULT_DB_PATH), offline=args.offline)
+    deck = api.parse_dreamborn_deck(deck_text)
+
+    start = time.perf_counter()
+    result = analyze_deck(deck)
+    result['elapsed_ms'] = (time.perf_counter() - start) * 1000
+    print(json.dumps(result, indent=2))
+
+    if args.check:
+        print(f"Monte Carlo, {args.check} shuffles ({'numpy' if np is not None else 'pure python'}):")
+        for k, exact in result['inkable_at_least'].items():
+            for mulligan in (False, True):
+                estimate = monte_carlo(deck, is_inkable, k, mulligan=mulligan, trials=args.check)
+                label = 'after_mulligan' if mulligan else 'opening'
+                print(f"  >= {k} inkable, {label}: exact {exact[label]:.4f}, estimate {estimate:.4f}")
+        for cost, exact in result['on_curve'].items():
+            estimate = monte_carlo(deck, costs(cost), 1, turn=cost, trials=args.check)
+            print(f"  cost {cost} by turn {cost} (on play): exact {exact['on_play']:.4f}, estimate {estimate:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+class GameExecutor:
+    """Serializes actions per game - actions for one game run one at a time,
+    actions for different games run in parallel.
+    """
+
+    def __init__(self):
+        self.locks: Dict[str, threading.Lock] = {}
+        self.depths: Dict[str, int] = {}
+        self.registry_lock = threading.Lock()
+
+        self.actions = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.max_depth = 0
+
+    @contextmanager
+    def acquire(self, game_id: str):
+        """Hold the game's lock for the duration of the block"""
+        with self.registry_lock:
+            lock = self.locks.get(game_id)
+            if lock is None:
+                lock = self.locks[game_id] = threading.Lock()
+            depth = self.depths.get(game_id, 0) + 1
+            self.depths[game_id] = depth
+            if depth > self.max_depth:
+                self.max_depth = depth
+
+        start = time.perf_counter()
+        lock.acquire()
+        wait = time.perf_counter() - start
+
+        with self.registry_lock:
+            self.actions += 1
+            self.total_wait += wait
+            if wait > self.max_wait:
+                self.max_wait = wait
+
+        try:
+            yield
+        finally:
+            with self.registry_lock:
+                self.depths[game_id] -= 1
+            lock.release()
+
+    def run(self, game_id: str, action, *args, **kwargs):
+        """Run action(*args, **kwargs) while holding the game's lock"""
+        with self.acquire(game_id):
+            return action(*args, **kwargs)
+
+    def queue_depth(self, game_id: str) -> int:
+        """Actions running or waiting for a game"""
+        return self.depths.get(game_id, 0)
+
+    def remove(self, game_id: str):
+        """Forget a finished game's lock"""
+        with self.registry_lock:
+            if not self.depths.get(game_id):
+                self.locks.pop(game_id, None)
+                self.depths.pop(game_id, None)
+
+    def stats(self) -> Dict:
+        with self.registry_lock:
+            return {
+                'games': len(self.locks),
+                'actions': self.actions,
+                'busy_games': sum(1 for depth in self.depths.values() if depth),
+                'queued': sum(max(depth - 1, 0) for depth in self.depths.values()),
+                'max_queue_depth': self.max_depth,
+                'avg_wait_ms': self.total_wait / self.actions * 1000 if self.actions else 0.0,
+                'max_wait_ms': self.max_wait * 1000
+            }
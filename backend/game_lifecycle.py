@@ -0,0 +1,250 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Set
+from urllib.parse import quote, unquote
+
+from game_state import GameState
+from logs import get_logger
+
+logger = get_logger('lifecycle')
+
+HIBERNATED_SUFFIX = '.game'
+
+# Rough heap cost of a live game, measured with tracemalloc (`python benchmarks.py lifecycle`)
+GAME_BYTES = 11500
+CARD_BYTES = 290
+JOURNAL_ENTRY_BYTES = 120
+PROJECTED_CARD_BYTES = 145
+
+
+def estimate_game_size(game: GameState) -> int:
+    """Approximate bytes held by a live game: cards, undo journals and memoized player views"""
+    size = GAME_BYTES + CARD_BYTES * len(game.cards)
+    # Redo entries are only the call (name, args, kwargs); count them as one entry each
+    size += JOURNAL_ENTRY_BYTES * (sum(len(entry[3]) for entry in game.undo_stack) + len(game.redo_stack))
+    for _, _, data, _ in game.projections.values():
+        size += PROJECTED_CARD_BYTES * len(game.cards)
+        if data is not None:
+            size += len(data)
+    return size
+
+
+class GameLifecycle:
+    """Idle hibernation, eviction and a memory budget for an InMemoryGameStore.
+
+    The store it is passed to sets `store`, reports activity with `touch` (on
+    every save) and asks `wake` for games it does not hold, so a hibernated
+    game comes back on its next event. `sweep`, run periodically:
+
+    - hibernates games idle for `hibernate_after` seconds to `directory`
+      (GameState.to_bytes snapshots, undo history included)
+    - deletes games, live or hibernated, idle for `evict_after` seconds
+    - while the live games' estimated size is over `memory_budget` bytes,
+      hibernates the least recently active games idle for at least `min_idle`
+    """
+
+    def __init__(self, directory: str, hibernate_after: float = 900, evict_after: float = 24 * 3600,
+                 memory_budget: Optional[int] = None, min_idle: float = 10,
+                 on_evict: Optional[Callable[[str], None]] = None):
+        self.directory = directory
+        self.hibernate_after = hibernate_after
+        self.evict_after = evict_after
+        self.memory_budget = memory_budget
+        self.min_idle = min_idle
+        self.on_evict = on_evict
+        self.store = None
+        self.lock = threading.Lock()
+
+        # Every known game, least recently active first
+        self.last_active: 'OrderedDict[str, float]' = OrderedDict()
+        self.sizes: Dict[str, int] = {}
+        self.stale_sizes: Set[str] = set()
+        self.hibernated: Set[str] = set()
+
+        self.hibernations = 0
+        self.budget_hibernations = 0
+        self.wakes = 0
+        self.evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._index_directory()
+
+    def _index_directory(self):
+        """Pick up games hibernated by a previous run; their file time is their last activity"""
+        found = []
+        for name in os.listdir(self.directory):
+            if name.endswith(HIBERNATED_SUFFIX):
+                path = os.path.join(self.directory, name)
+                found.append((os.path.getmtime(path), unquote(name[:-len(HIBERNATED_SUFFIX)])))
+
+        now_wall, now = time.time(), time.monotonic()
+        for mtime, game_id in sorted(found):
+            self.hibernated.add(game_id)
+            self.last_active[game_id] = now - max(now_wall - mtime, 0)
+
+    def _path(self, game_id: str) -> str:
+        return os.path.join(self.directory, quote(game_id, safe='') + HIBERNATED_SUFFIX)
+
+    def touch(self, game: GameState):
+        with self.lock:
+            self.last_active[game.game_id] = time.monotonic()
+            self.last_active.move_to_end(game.game_id)
+            self.stale_sizes.add(game.game_id)
+
+    def is_hibernated(self, game_id: str) -> bool:
+        return game_id in self.hibernated
+
+    def wake(self, game_id: str, games: Dict[str, GameState]) -> Optional[GameState]:
+        """Load a hibernated game back into `games` (its file is removed)"""
+        with self.lock:
+            # Another thread may have woken it first
+            game = games.get(game_id)
+            if game is not None or game_id not in self.hibernated:
+                return game
+
+            path = self._path(game_id)
+            with open(path, 'rb') as f:
+                game = GameState.from_bytes(f.read())
+            os.remove(path)
+
+            games[game_id] = game
+            self.hibernated.discard(game_id)
+            self.last_active[game_id] = time.monotonic()
+            self.last_active.move_to_end(game_id)
+            self.stale_sizes.add(game_id)
+            self.wakes += 1
+        return game
+
+    def hibernate(self, game: GameState, games: Dict[str, GameState]):
+        """Write a game to disk and remove it from `games` (call with the game's lock held)"""
+        path = self._path(game.game_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(game.to_bytes(include_history=True))
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            games.pop(game.game_id, None)
+            self.hibernated.add(game.game_id)
+            self.sizes.pop(game.game_id, None)
+            self.stale_sizes.discard(game.game_id)
+            self.hibernations += 1
+
+    def forget(self, game_id: str):
+        """Drop every trace of a game, including its hibernated file"""
+        with self.lock:
+            self.last_active.pop(game_id, None)
+            self.sizes.pop(game_id, None)
+            self.stale_sizes.discard(game_id)
+            if game_id in self.hibernated:
+                self.hibernated.discard(game_id)
+                try:
+                    os.remove(self._path(game_id))
+                except OSError:
+                    pass
+
+    def live_bytes(self) -> int:
+        with self.lock:
+            return sum(self.sizes.values())
+
+    def sweep(self) -> Dict:
+        """One pass of eviction, idle hibernation and the memory budget over the store"""
+        store = self.store
+        now = time.monotonic()
+        with self.lock:
+            stale, self.stale_sizes = self.stale_sizes, set()
+            by_age = list(self.last_active.items())
+
+        for game_id in stale:
+            if store.executor.queue_depth(game_id):
+                # Busy now, so it will be touched again; measure it next time
+                continue
+            with store.lock(game_id):
+                game = store.games.get(game_id)
+                size = estimate_game_size(game) if game is not None else None
+            if size is not None:
+                with self.lock:
+                    if game_id not in self.hibernated:
+                        self.sizes[game_id] = size
+
+        evicted = hibernated = over_budget = 0
+        first_deadline = min(self.hibernate_after, self.evict_after)
+        for game_id, last_active in by_age:
+            idle = now - last_active
+            if idle < first_deadline:
+                break
+            if idle >= self.evict_after:
+                evicted += self._evict(game_id, last_active)
+            elif game_id not in self.hibernated:
+                hibernated += self._hibernate_idle(game_id, last_active)
+
+        if self.memory_budget is not None:
+            total = self.live_bytes()
+            for game_id, last_active in by_age:
+                if total <= self.memory_budget or now - last_active < self.min_idle:
+                    break
+                size = self.sizes.get(game_id)
+                if size is not None and self._hibernate_idle(game_id, last_active):
+                    total -= size
+                    over_budget += 1
+            self.budget_hibernations += over_budget
+            if total > self.memory_budget:
+                logger.warning("Over the game memory budget", extra={
+                    'live_bytes': total, 'budget': self.memory_budget
+                })
+
+        return {'evicted': evicted, 'hibernated': hibernated, 'over_budget': over_budget}
+
+    def _hibernate_idle(self, game_id: str, last_active: float) -> bool:
+        store = self.store
+        # A game with an action running or queued is not idle
+        if store.executor.queue_depth(game_id):
+            return False
+        with store.lock(game_id):
+            game = store.games.get(game_id)
+            if game is None or self.last_active.get(game_id) != last_active:
+                return False
+            self.hibernate(game, store.games)
+        return True
+
+    def _evict(self, game_id: str, last_active: float) -> bool:
+        store = self.store
+        if store.executor.queue_depth(game_id):
+            return False
+        with store.lock(game_id):
+            if self.last_active.get(game_id) != last_active:
+                return False
+            store.delete(game_id)
+        # The lock is only dropped once nobody holds it
+        store.executor.remove(game_id)
+
+        self.evictions += 1
+        if self.on_evict is not None:
+            self.on_evict(game_id)
+        logger.debug("Evicted idle game", extra={'game_id': game_id})
+        return True
+
+    def run(self, sleep: Callable[[float], None], interval: float = 30):
+        """Sweep forever (start with socketio.start_background_task)"""
+        while True:
+            sleep(interval)
+            try:
+                result = self.sweep()
+                if any(result.values()):
+                    logger.info("Game lifecycle sweep", extra=result)
+            except Exception:
+                logger.exception("Game lifecycle sweep failed")
+
+    def stats(self) -> Dict:
+        return {
+            'tracked': len(self.last_active),
+            'hibernated': len(self.hibernated),
+            'live_bytes': self.live_bytes(),
+            'memory_budget': self.memory_budget,
+            'hibernations': self.hibernations,
+            'budget_hibernations': self.budget_hibernations,
+            'wakes': self.wakes,
+            'evictions': self.evictions
+        }
@@ -1,13 +1,164 @@
+import functools
+import hashlib
+import json
 import random
-import uuid
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 from typing import Dict, List, Optional, Set
-from copy import deepcopy
+
+from metrics import REGISTRY
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+STATE_BUILD_SECONDS = REGISTRY.histogram(
+    'lorcana_state_build_seconds', 'get_state_for_player time when the per-version memo misses'
+)
+STATE_MEMO = REGISTRY.counter('lorcana_state_memo_total', 'get_state_for_player memo lookups', ['result'])
+STATE_MEMO_HITS = STATE_MEMO.labels(result='hit')
+STATE_MEMO_MISSES = STATE_MEMO.labels(result='miss')
+
+# Viewer id for spectators: not a player, so the state and deltas built for it hold
+# only what every non-owner sees (face-up cards and zone counts)
+SPECTATOR_ID = '*'
+
+
+class CardDefinition:
+    """Immutable card definition, shared by every copy of the card in every game"""
+    __slots__ = ('index', 'key', 'data', 'cost', 'inkable', 'card_type')
+    
+    def __init__(self, index: int, key: str, data: Dict):
+        self.index = index
+        self.key = key
+        self.data = data
+        self.cost = data.get('cost') or 0
+        self.card_type = (data.get('type') or '').lower()
+        
+        inkwell = data.get('inkwell')
+        if isinstance(inkwell, bool):
+            self.inkable = inkwell
+        elif isinstance(inkwell, str):
+            self.inkable = inkwell.lower() in ['true', 'yes', '1']
+        elif isinstance(inkwell, int):
+            self.inkable = inkwell == 1
+        else:
+            self.inkable = False
+
+
+class CardDefinitionTable:
+    """Interning table - each distinct card definition is stored exactly once"""
+    def __init__(self):
+        self.definitions: List[CardDefinition] = []
+        self.by_object: Dict[int, int] = {}
+        self.by_content: Dict[str, int] = {}
+        self.by_key: Dict[str, int] = {}
+        self.lock = threading.Lock()
+    
+    def __getitem__(self, index: int) -> CardDefinition:
+        return self.definitions[index]
+    
+    def __len__(self):
+        return len(self.definitions)
+    
+    def intern(self, card_data: Dict) -> int:
+        """Return the definition index for card_data, adding it if new"""
+        index = self.by_object.get(id(card_data))
+        if index is not None:
+            return index
+        
+        content_key = json.dumps(card_data, sort_keys=True, default=str)
+        with self.lock:
+            index = self.by_content.get(content_key)
+            if index is None:
+                index = len(self.definitions)
+                key = hashlib.sha1(content_key.encode('utf-8')).hexdigest()[:12]
+                self.definitions.append(CardDefinition(index, key, card_data))
+                self.by_content[content_key] = index
+                self.by_key[key] = index
+            
+            # Definitions keep a reference to their dict, so only that dict's id can map here
+            if self.definitions[index].data is card_data:
+                self.by_object[id(card_data)] = index
+        return index
+    
+    def get_by_key(self, key: str) -> Optional[CardDefinition]:
+        index = self.by_key.get(key)
+        return self.definitions[index] if index is not None else None
+
+
+CARD_DEFINITIONS = CardDefinitionTable()
+
+
+def _to_json(value) -> str:
+    return json.dumps(value, separators=(',', ':'))
+
+
+# Snapshot encodings (first byte of GameState.to_bytes)
+SNAPSHOT_JSON = 1
+SNAPSHOT_MSGPACK = 2
+SNAPSHOT_SCHEMA = 2
+
+ZONE_NAMES = ['deck', 'hand', 'discard', 'ink', 'summoning', 'ready', 'mystery']
+
+# Undo journal entry kinds
+UNDO_CARD = 0     # (kind, card_id, attr, old value)
+UNDO_PLAYER = 1   # (kind, player_id, attr, old value)
+UNDO_GAME = 2     # (kind, attr, old value)
+UNDO_MOVE = 3     # (kind, card_id, from zone, card above it there, was it there)
+UNDO_ORDER = 4    # (kind, player_id, zone, old card order) - shuffles only
+
+
+def recorded(method):
+    """Mark a GameState method as an action: top-level calls are counted,
+    journaled for undo (under the game's current actor) and passed to the
+    game's recorder (calls made from inside another action are part of that
+    action).
+    
+    An action that raises is rolled back from its journal, so it never leaves
+    a half-applied change - whether or not undo is enabled. A game made with
+    rollback=False and undo_limit=0 skips the journal altogether.
+    """
+    name = method.__name__
+    
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.call_depth:
+            return method(self, *args, **kwargs)
+        
+        self.journal = [] if self.rollback or self.undo_stack.maxlen else None
+        self.call_depth = 1
+        try:
+            result = method(self, *args, **kwargs)
+        except Exception:
+            if self.journal is not None:
+                self._revert(self.journal)
+            raise
+        finally:
+            self.call_depth = 0
+            journal, self.journal = self.journal, None
+        
+        if self.atomic_journal is not None and journal is not None:
+            self.atomic_journal.extend(journal)
+        if journal and self.undo_stack.maxlen:
+            self.undo_stack.append((name, args, kwargs, journal, self.actor))
+            self.redo_stack.clear()
+        self._finish_action(name, args, kwargs)
+        return result
+    
+    return wrapper
+
 
 class Card:
     """Represents a single card instance in the game"""
-    def __init__(self, card_data: Dict, owner_id: str):
-        self.id = str(uuid.uuid4())
-        self.card_data = card_data
+    __slots__ = ('id', 'definition', 'owner', 'zone', 'face_up', 'exerted', 'damage', 'position')
+    
+    def __init__(self, card_id: int, definition: int, owner_id: str):
+        self.id = card_id
+        self.definition = definition
         self.owner = owner_id
         self.zone = 'deck'
         self.face_up = False
@@ -15,10 +166,27 @@ class Card:
         self.damage = 0
         self.position = 0
     
+    @property
+    def definition_data(self) -> CardDefinition:
+        return CARD_DEFINITIONS[self.definition]
+    
+    @property
+    def card_data(self) -> Dict:
+        return CARD_DEFINITIONS[self.definition].data
+    
+    def is_public(self) -> bool:
+        """Face up where everyone sees it (cards in hand are face up to their owner only)"""
+        return self.face_up and self.zone != 'hand'
+    
+    def visible_to(self, viewer_id: str) -> bool:
+        return self.is_public() or (viewer_id == self.owner and self.zone == 'hand')
+    
     def to_dict(self, viewer_id: str = None) -> Dict:
-        """Convert to dictionary for JSON serialization"""
-        can_see_face = self.face_up or (viewer_id == self.owner and self.zone == 'hand')
+        """Convert to dictionary for JSON serialization.
         
+        Only the definition key is sent; the definition itself goes out once
+        per viewer in `card_defs`.
+        """
         return {
             'id': self.id,
             'owner': self.owner,
@@ -27,11 +195,156 @@ class Card:
             'exerted': self.exerted,
             'damage': self.damage,
             'position': self.position,
-            'card_data': self.card_data if can_see_face else None,
-            'image_url': self.card_data.get('image_url') if can_see_face else None
+            'def': CARD_DEFINITIONS[self.definition].key if self.visible_to(viewer_id) else None
         }
 
 
+class Zone:
+    """Ordered pile of card ids (index 0 is the top).
+    
+    Stored as a doubly linked list over dicts, so membership, removal by id,
+    append and drawing from the top are all O(1).
+    """
+    __slots__ = ('prev', 'next', 'head', 'tail')
+    
+    def __init__(self, card_ids=()):
+        self.prev: Dict[int, Optional[int]] = {}
+        self.next: Dict[int, Optional[int]] = {}
+        self.head: Optional[int] = None
+        self.tail: Optional[int] = None
+        if card_ids:
+            self.replace(card_ids)
+    
+    def __len__(self):
+        return len(self.next)
+    
+    def __bool__(self):
+        return self.head is not None
+    
+    def __contains__(self, card_id):
+        return card_id in self.next
+    
+    def __iter__(self):
+        card_id = self.head
+        while card_id is not None:
+            yield card_id
+            card_id = self.next[card_id]
+    
+    def __getitem__(self, index: int) -> int:
+        if index == 0 and self.head is not None:
+            return self.head
+        if index == -1 and self.tail is not None:
+            return self.tail
+        return self.to_list()[index]
+    
+    def __repr__(self):
+        return f"Zone({self.to_list()!r})"
+    
+    def to_list(self) -> List[int]:
+        return list(self)
+    
+    def top(self) -> Optional[int]:
+        return self.head
+    
+    def append(self, card_id: int):
+        tail = self.tail
+        self.prev[card_id] = tail
+        self.next[card_id] = None
+        if tail is None:
+            self.head = card_id
+        else:
+            self.next[tail] = card_id
+        self.tail = card_id
+    
+    def insert_after(self, anchor: Optional[int], card_id: int):
+        """Insert card_id after anchor (None inserts at the top)"""
+        after = self.next[anchor] if anchor is not None else self.head
+        self.prev[card_id] = anchor
+        self.next[card_id] = after
+        
+        if anchor is None:
+            self.head = card_id
+        else:
+            self.next[anchor] = card_id
+        
+        if after is None:
+            self.tail = card_id
+        else:
+            self.prev[after] = card_id
+    
+    def insert(self, position: int, card_id: int):
+        """Insert at a list position - O(position)"""
+        if position >= len(self.next):
+            self.append(card_id)
+            return
+        
+        anchor = None
+        for _ in range(position):
+            anchor = self.next[anchor] if anchor is not None else self.head
+        self.insert_after(anchor, card_id)
+    
+    def remove(self, card_id: int) -> Optional[int]:
+        """Remove card_id, returning the id that was above it (None if it was the top)"""
+        before = self.prev.pop(card_id)
+        after = self.next.pop(card_id)
+        
+        if before is None:
+            self.head = after
+        else:
+            self.next[before] = after
+        
+        if after is None:
+            self.tail = before
+        else:
+            self.prev[after] = before
+        
+        return before
+    
+    def discard(self, card_id: int) -> bool:
+        """Remove card_id if present; returns whether it was removed"""
+        if card_id not in self.next:
+            return False
+        self.remove(card_id)
+        return True
+    
+    def pop_top(self) -> int:
+        card_id = self.head
+        if card_id is None:
+            raise IndexError("pop from empty zone")
+        
+        after = self.next.pop(card_id)
+        del self.prev[card_id]
+        self.head = after
+        if after is None:
+            self.tail = None
+        else:
+            self.prev[after] = None
+        return card_id
+    
+    def clear(self):
+        self.prev.clear()
+        self.next.clear()
+        self.head = self.tail = None
+    
+    def replace(self, card_ids):
+        """Replace the contents with card_ids, in order"""
+        card_ids = list(card_ids)
+        if not card_ids:
+            self.clear()
+            return
+        
+        # Build both link maps in one go rather than appending one card at a time
+        self.prev = dict(zip(card_ids, [None] + card_ids[:-1]))
+        self.next = dict(zip(card_ids, card_ids[1:] + [None]))
+        self.head = card_ids[0]
+        self.tail = card_ids[-1]
+    
+    def shuffle(self, shuffle=random.shuffle):
+        card_ids = self.to_list()
+        shuffle(card_ids)
+        self.replace(card_ids)
+
+
 class Player:
     """Represents a player's state"""
     def __init__(self, player_id: str, username: str):
@@ -39,15 +352,9 @@ class Player:
         self.username = username
         self.lore = 0
         self.has_inked_this_turn = False
-        self.zones = {
-            'deck': [],
-            'hand': [],
-            'discard': [],
-            'ink': [],
-            'summoning': [],
-            'ready': [],
-            'mystery': []
-        }
+        self.ink_total = 0
+        self.ink_available = 0
+        self.zones: Dict[str, Zone] = {zone: Zone() for zone in ZONE_NAMES}
     
     def to_dict(self, viewer_id: str = None) -> Dict:
         """Convert to dictionary, hiding private info from other players"""
@@ -58,22 +365,403 @@ class Player:
             'username': self.username,
             'lore': self.lore,
             'has_inked_this_turn': self.has_inked_this_turn,
+            'ink_total': self.ink_total,
+            'ink_available': self.ink_available,
             'zone_counts': {
                 zone: len(cards) for zone, cards in self.zones.items()
             },
-            'zones': self.zones if is_owner else {}
+            'zones': {
+                zone: cards.to_list() for zone, cards in self.zones.items()
+            } if is_owner else {}
         }
 
 
 class GameState:
     """Main game state manager"""
-    def __init__(self, game_id: str):
+    def __init__(self, game_id: str, seed: Optional[int] = None, undo_limit: int = 50, rollback: bool = True):
         self.game_id = game_id
         self.players: Dict[str, Player] = {}
-        self.cards: Dict[str, Card] = {}
+        self.cards: Dict[int, Card] = {}
         self.current_turn: Optional[str] = None
         self.turn_number = 1
         self.player_order: List[str] = []
+        self.next_card_id = 1
+        
+        # Shuffles are derived from (seed, shuffle count), so a replayed game shuffles the same way
+        self.seed = seed if seed is not None else random.getrandbits(63)
+        self.shuffles = 0
+        
+        # Actions applied so far; the recorder (e.g. ActionLog.record) sees each one
+        self.action_seq = 0
+        self.call_depth = 0
+        self.recorder = None
+        
+        # Undo keeps each action's journal of inverse operations (undo_limit=0 turns it off)
+        # and the player it is attributed to, who is the only one allowed to undo it.
+        # rollback=False (with undo_limit=0) skips journaling, for throwaway games like simulations
+        self.rollback = rollback
+        self.journal: Optional[List[tuple]] = None
+        self.actor: Optional[str] = None
+        # Journal of every action in the current atomic() block
+        self.atomic_journal: Optional[List[tuple]] = None
+        self.undo_stack: deque = deque(maxlen=undo_limit)
+        self.redo_stack: deque = deque(maxlen=undo_limit)
+        
+        # Change tracking for delta broadcasts
+        self.version = 0
+        self.broadcast_version = 0
+        self.dirty_cards: Set[int] = set()
+        self.dirty_players: Set[str] = set()
+        self.dirty_game = False
+        
+        # Definition keys already sent to each viewer
+        self.revealed_defs: Dict[str, Set[str]] = {}
+        
+        # Memoized projections: viewer -> (version, state, json bytes)
+        self.projections: Dict[str, tuple] = {}
+        self.public_view: Optional[tuple] = None
+    
+    def __reduce__(self):
+        # Pickles (multiprocessing, stores) go through the compact snapshot
+        return (GameState.from_bytes, (self.to_bytes(),))
+    
+    def to_bytes(self, include_definitions: bool = True, encoding: Optional[int] = None,
+                 include_history: bool = False, include_broadcast: bool = False) -> bytes:
+        """Compact snapshot of the game.
+        
+        Cards are flat runs of small ints and refer to definitions by position
+        in a per-snapshot table. With include_definitions=False only the
+        definition keys are written, which is much smaller but can only be
+        restored in a process that already has those definitions interned.
+        include_history adds the undo/redo stacks. include_broadcast adds the
+        changes not yet broadcast (and the definitions each viewer was sent),
+        for stores that reload the game between an action and its broadcast.
+        Caches are never saved.
+        """
+        if encoding is None:
+            encoding = SNAPSHOT_MSGPACK if msgpack is not None else SNAPSHOT_JSON
+        
+        local_defs = {}
+        cards = []
+        for card_id in sorted(self.cards):
+            card = self.cards[card_id]
+            local = local_defs.get(card.definition)
+            if local is None:
+                local = local_defs[card.definition] = len(local_defs)
+            cards.extend((card_id, local, card.face_up | card.exerted << 1, card.damage, card.position))
+        
+        definitions = [
+            [CARD_DEFINITIONS[index].key, CARD_DEFINITIONS[index].data] if include_definitions
+            else CARD_DEFINITIONS[index].key
+            for index in local_defs
+        ]
+        players = [
+            [player.id, player.username, player.lore, player.has_inked_this_turn,
+             [player.zones[zone].to_list() for zone in ZONE_NAMES]]
+            for player in self.players.values()
+        ]
+        snapshot = [
+            SNAPSHOT_SCHEMA, self.game_id, self.version, self.turn_number, self.current_turn,
+            self.player_order, self.next_card_id, definitions, players, cards,
+            self.seed, self.shuffles, self.action_seq
+        ]
+        if include_history or include_broadcast:
+            snapshot.append([self.undo_stack.maxlen, list(self.undo_stack), list(self.redo_stack)]
+                            if include_history else None)
+        if include_broadcast:
+            snapshot.append([
+                self.broadcast_version, sorted(self.dirty_cards), sorted(self.dirty_players), self.dirty_game,
+                {viewer: sorted(keys) for viewer, keys in self.revealed_defs.items()}
+            ])
+        
+        if encoding == SNAPSHOT_MSGPACK:
+            if msgpack is None:
+                raise RuntimeError("msgpack snapshots need the 'msgpack' package (pip install msgpack)")
+            return bytes((SNAPSHOT_MSGPACK,)) + msgpack.packb(snapshot, use_bin_type=True)
+        return bytes((SNAPSHOT_JSON,)) + _to_json(snapshot).encode('utf-8')
+    
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'GameState':
+        """Restore a game written by to_bytes"""
+        encoding = data[0]
+        if encoding == SNAPSHOT_MSGPACK:
+            if msgpack is None:
+                raise RuntimeError("msgpack snapshots need the 'msgpack' package (pip install msgpack)")
+            snapshot = msgpack.unpackb(data[1:], raw=False, strict_map_key=False)
+        elif encoding == SNAPSHOT_JSON:
+            snapshot = json.loads(data[1:])
+        else:
+            raise ValueError(f"Unknown snapshot encoding: {encoding}")
+        
+        if snapshot[0] != SNAPSHOT_SCHEMA:
+            raise ValueError(f"Unsupported snapshot schema: {snapshot[0]}")
+        (_, game_id, version, turn_number, current_turn, player_order, next_card_id,
+         definitions, players, cards, seed, shuffles, action_seq) = snapshot[:13]
+        
+        remap = []
+        for definition in definitions:
+            key, card_data = (definition, None) if isinstance(definition, str) else definition
+            interned = CARD_DEFINITIONS.get_by_key(key)
+            if interned is not None:
+                remap.append(interned.index)
+            elif card_data is not None:
+                remap.append(CARD_DEFINITIONS.intern(card_data))
+            else:
+                raise ValueError(f"Card definition {key} is not loaded in this process")
+        
+        if len(snapshot) > 13 and snapshot[13] is not None:
+            undo_limit, undo_stack, redo_stack = snapshot[13]
+            game = cls(game_id, seed=seed, undo_limit=undo_limit)
+            game.undo_stack.extend(undo_stack)
+            game.redo_stack.extend(redo_stack)
+        else:
+            game = cls(game_id, seed=seed)
+        game.shuffles = shuffles
+        game.action_seq = action_seq
+        game.version = game.broadcast_version = version
+        if len(snapshot) > 14:
+            broadcast_version, dirty_cards, dirty_players, dirty_game, revealed_defs = snapshot[14]
+            game.broadcast_version = broadcast_version
+            game.dirty_cards = set(dirty_cards)
+            game.dirty_players = set(dirty_players)
+            game.dirty_game = dirty_game
+            game.revealed_defs = {viewer: set(keys) for viewer, keys in revealed_defs.items()}
+        game.turn_number = turn_number
+        game.current_turn = current_turn
+        game.player_order = list(player_order)
+        game.next_card_id = next_card_id
+        
+        for i in range(0, len(cards), 5):
+            card_id, local, flags, damage, position = cards[i:i + 5]
+            card = Card(card_id, remap[local], None)
+            card.face_up = bool(flags & 1)
+            card.exerted = bool(flags & 2)
+            card.damage = damage
+            card.position = position
+            game.cards[card_id] = card
+        
+        for player_id, username, lore, has_inked, zones in players:
+            player = Player(player_id, username)
+            player.lore = lore
+            player.has_inked_this_turn = has_inked
+            for zone_name, card_ids in zip(ZONE_NAMES, zones):
+                player.zones[zone_name].replace(card_ids)
+                for card_id in card_ids:
+                    card = game.cards[card_id]
+                    card.owner = player_id
+                    card.zone = zone_name
+            
+            ink = [game.cards[card_id] for card_id in zones[ZONE_NAMES.index('ink')]]
+            player.ink_total = len(ink)
+            player.ink_available = sum(1 for card in ink if not card.face_up)
+            game.players[player_id] = player
+        
+        return game
+    
+    def _shuffle(self, items: List):
+        if self.journal is not None:
+            self.journal.append((UNDO_GAME, 'shuffles', self.shuffles))
+        self.shuffles += 1
+        random.Random(f"{self.seed}:{self.shuffles}").shuffle(items)
+    
+    def _mark_card(self, card_id: int):
+        self.dirty_cards.add(card_id)
+        self.version += 1
+    
+    def _mark_player(self, player_id: str):
+        self.dirty_players.add(player_id)
+        self.version += 1
+    
+    def _mark_game(self):
+        self.dirty_game = True
+        self.version += 1
+    
+    # Every change made by an action goes through these helpers, which journal
+    # the previous value so the action can be undone
+    
+    def _set_card(self, card: Card, attr: str, value):
+        if self.journal is not None:
+            self.journal.append((UNDO_CARD, card.id, attr, getattr(card, attr)))
+        setattr(card, attr, value)
+        self._mark_card(card.id)
+    
+    def _set_player(self, player: Player, attr: str, value):
+        if self.journal is not None:
+            self.journal.append((UNDO_PLAYER, player.id, attr, getattr(player, attr)))
+        setattr(player, attr, value)
+        self._mark_player(player.id)
+    
+    def _set_game(self, attr: str, value):
+        if self.journal is not None:
+            self.journal.append((UNDO_GAME, attr, getattr(self, attr)))
+        setattr(self, attr, value)
+        self._mark_game()
+    
+    def _place_card(self, card: Card, to_zone: str, position: Optional[int] = None):
+        """Move a card into another of its owner's zones (no flags or ink counters)"""
+        zones = self.players[card.owner].zones
+        target = zones[to_zone]
+        from_zone = zones[card.zone]
+        removed = card.id in from_zone
+        anchor = from_zone.remove(card.id) if removed else None
+        
+        if position is not None:
+            target.insert(position, card.id)
+        else:
+            target.append(card.id)
+        
+        if self.journal is not None:
+            self.journal.append((UNDO_MOVE, card.id, card.zone, anchor, removed))
+        card.zone = to_zone
+        self._mark_card(card.id)
+        self._mark_player(card.owner)
+    
+    def _shuffle_zone(self, player: Player, zone_name: str):
+        zone = player.zones[zone_name]
+        if self.journal is not None:
+            self.journal.append((UNDO_ORDER, player.id, zone_name, zone.to_list()))
+        zone.shuffle(self._shuffle)
+        self._mark_player(player.id)
+    
+    def _revert(self, journal: List[tuple], inverse: Optional[List[tuple]] = None):
+        """Apply a journal's inverse operations, newest first.
+        
+        `inverse` collects a journal of the revert itself, so an undo made
+        inside an atomic() block can be rolled back with the rest of it.
+        """
+        for entry in reversed(journal):
+            kind = entry[0]
+            if kind == UNDO_CARD:
+                _, card_id, attr, value = entry
+                card = self.cards[card_id]
+                if inverse is not None:
+                    inverse.append((UNDO_CARD, card_id, attr, getattr(card, attr)))
+                setattr(card, attr, value)
+                self._mark_card(card_id)
+            elif kind == UNDO_PLAYER:
+                _, player_id, attr, value = entry
+                player = self.players[player_id]
+                if inverse is not None:
+                    inverse.append((UNDO_PLAYER, player_id, attr, getattr(player, attr)))
+                setattr(player, attr, value)
+                self._mark_player(player_id)
+            elif kind == UNDO_GAME:
+                _, attr, value = entry
+                if inverse is not None:
+                    inverse.append((UNDO_GAME, attr, getattr(self, attr)))
+                setattr(self, attr, value)
+                self._mark_game()
+            elif kind == UNDO_MOVE:
+                _, card_id, from_zone, anchor, removed = entry
+                card = self.cards[card_id]
+                zones = self.players[card.owner].zones
+                present = card_id in zones[card.zone]
+                above = zones[card.zone].remove(card_id) if present else None
+                if inverse is not None:
+                    inverse.append((UNDO_MOVE, card_id, card.zone, above, present))
+                if removed:
+                    zones[from_zone].insert_after(anchor, card_id)
+                card.zone = from_zone
+                self._mark_card(card_id)
+                self._mark_player(card.owner)
+            elif kind == UNDO_ORDER:
+                _, player_id, zone_name, card_ids = entry
+                zone = self.players[player_id].zones[zone_name]
+                if inverse is not None:
+                    inverse.append((UNDO_ORDER, player_id, zone_name, zone.to_list()))
+                zone.replace(card_ids)
+                self._mark_player(player_id)
+    
+    def _finish_action(self, name: str, args: tuple, kwargs: Dict):
+        self.action_seq += 1
+        if self.recorder is not None:
+            self.recorder(self, name, args, kwargs)
+    
+    def clear_history(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+    
+    @contextmanager
+    def acting_as(self, player_id: Optional[str]):
+        """Attribute the actions made inside the block to a player"""
+        previous, self.actor = self.actor, player_id
+        try:
+            yield
+        finally:
+            self.actor = previous
+    
+    @contextmanager
+    def atomic(self):
+        """Apply the actions made inside the block as one unit.
+        
+        If the block raises, every action in it is reverted from the journal
+        and the undo history is put back; the recorder then sees a
+        'rollback' action, since it already saw the reverted ones. Nothing
+        is reverted in a game made with rollback=False and undo_limit=0.
+        """
+        if self.atomic_journal is not None:
+            yield
+            return
+        
+        self.atomic_journal = []
+        undo_stack, redo_stack = list(self.undo_stack), list(self.redo_stack)
+        action_seq = self.action_seq
+        try:
+            yield
+        except Exception:
+            self._revert(self.atomic_journal)
+            self.undo_stack.clear()
+            self.undo_stack.extend(undo_stack)
+            self.redo_stack.clear()
+            self.redo_stack.extend(redo_stack)
+            if self.action_seq != action_seq:
+                self._finish_action('rollback', (), {})
+            raise
+        finally:
+            self.atomic_journal = None
+    
+    def can_undo(self, player_id: Optional[str] = None) -> bool:
+        """Is there an action to undo (made by player_id, if given)"""
+        return bool(self.undo_stack) and player_id in (None, self.undo_stack[-1][4])
+    
+    def can_redo(self, player_id: Optional[str] = None) -> bool:
+        return bool(self.redo_stack) and player_id in (None, self.redo_stack[-1][3])
+    
+    def undo(self, player_id: Optional[str] = None) -> bool:
+        """Revert the last action; with player_id, only if that player made it"""
+        if self.call_depth or not self.can_undo(player_id):
+            return False
+        
+        name, args, kwargs, journal, actor = self.undo_stack.pop()
+        self._revert(journal, self.atomic_journal)
+        self.redo_stack.append((name, args, kwargs, actor))
+        self._finish_action('undo', (), {})
+        return True
+    
+    def redo(self, player_id: Optional[str] = None) -> bool:
+        """Re-apply the last undone action; with player_id, only if that player made it
+        (shuffles come out the same, since undo restores the counter)"""
+        if self.call_depth or not self.can_redo(player_id):
+            return False
+        
+        name, args, kwargs, actor = self.redo_stack.pop()
+        self.journal = []
+        self.call_depth += 1
+        try:
+            getattr(self, name)(*args, **kwargs)
+        except Exception:
+            self._revert(self.journal)
+            self.redo_stack.append((name, args, kwargs, actor))
+            raise
+        finally:
+            self.call_depth -= 1
+            journal, self.journal = self.journal, None
+        
+        if self.atomic_journal is not None:
+            self.atomic_journal.extend(journal)
+        self.undo_stack.append((name, args, kwargs, journal, actor))
+        self._finish_action('redo', (), {})
+        return True
     
     def add_player(self, player_id: str, username: str, deck_data: List[Dict]):
         """Add a player with their deck"""
@@ -81,77 +769,78 @@ class GameState:
         self.players[player_id] = player
         self.player_order.append(player_id)
         
+        card_ids = []
         for card_data in deck_data:
-            card = Card(card_data, player_id)
+            card = Card(self.next_card_id, CARD_DEFINITIONS.intern(card_data), player_id)
+            self.next_card_id += 1
             self.cards[card.id] = card
-            player.zones['deck'].append(card.id)
+            card_ids.append(card.id)
         
+        player.zones['deck'].replace(card_ids)
+        self.dirty_cards.update(card_ids)
+        self.version += len(card_ids)
+        
+        self._mark_player(player_id)
+        self._mark_game()
         return player
     
+    @recorded
     def start_game(self):
         """Initialize game - shuffle, set mystery card, draw hands"""
-        random.shuffle(self.player_order)
-        self.current_turn = self.player_order[0]
+        player_order = list(self.player_order)
+        self._shuffle(player_order)
+        self._set_game('player_order', player_order)
+        self._set_game('current_turn', self.player_order[0])
         
         for player_id in self.player_order:
             player = self.players[player_id]
             
-            random.shuffle(player.zones['deck'])
+            self._shuffle_zone(player, 'deck')
             
             if player.zones['deck']:
-                mystery_card_id = player.zones['deck'].pop(0)
-                player.zones['mystery'] = [mystery_card_id]
-                self.cards[mystery_card_id].zone = 'mystery'
+                self._place_card(self.cards[player.zones['deck'].top()], 'mystery')
             
-            for _ in range(7):
-                if player.zones['deck']:
-                    card_id = player.zones['deck'].pop(0)
-                    player.zones['hand'].append(card_id)
-                    self.cards[card_id].zone = 'hand'
-                    self.cards[card_id].face_up = True
-    
-    def mulligan(self, player_id: str, card_ids: List[str]):
+            self.draw_cards(player_id, 7)
+    
+    @recorded
+    def mulligan(self, player_id: str, card_ids: List[int]):
         """Mulligan specific cards - put back in deck, shuffle, redraw"""
         player = self.players[player_id]
         
         for card_id in card_ids:
             if card_id in player.zones['hand']:
-                player.zones['hand'].remove(card_id)
-                player.zones['deck'].append(card_id)
-                self.cards[card_id].zone = 'deck'
-                self.cards[card_id].face_up = False
-        
-        random.shuffle(player.zones['deck'])
+                card = self.cards[card_id]
+                self._place_card(card, 'deck')
+                self._set_card(card, 'face_up', False)
         
-        for _ in range(len(card_ids)):
-            if player.zones['deck']:
-                card_id = player.zones['deck'].pop(0)
-                player.zones['hand'].append(card_id)
-                self.cards[card_id].zone = 'hand'
-                self.cards[card_id].face_up = True
+        self._shuffle_zone(player, 'deck')
+        self.draw_cards(player_id, len(card_ids))
     
-    def move_card(self, card_id: str, to_zone: str, position: Optional[int] = None, 
+    @recorded
+    def move_card(self, card_id: int, to_zone: str, position: Optional[int] = None, 
                   face_up: Optional[bool] = None):
         """Move a card between zones"""
         card = self.cards[card_id]
         player = self.players[card.owner]
         
-        if card_id in player.zones[card.zone]:
-            player.zones[card.zone].remove(card_id)
+        if card.zone == 'ink':
+            self._set_player(player, 'ink_total', player.ink_total - 1)
+            if not card.face_up:
+                self._set_player(player, 'ink_available', player.ink_available - 1)
         
-        if position is not None and position < len(player.zones[to_zone]):
-            player.zones[to_zone].insert(position, card_id)
-        else:
-            player.zones[to_zone].append(card_id)
+        self._place_card(card, to_zone, position)
+        if face_up is not None and face_up != card.face_up:
+            self._set_card(card, 'face_up', face_up)
         
-        card.zone = to_zone
-        if face_up is not None:
-            card.face_up = face_up
+        if to_zone == 'ink':
+            self._set_player(player, 'ink_total', player.ink_total + 1)
+            if not card.face_up:
+                self._set_player(player, 'ink_available', player.ink_available + 1)
         
-        if to_zone in ['hand', 'deck', 'discard', 'ink']:
-            card.exerted = False
+        if to_zone in ['hand', 'deck', 'discard', 'ink'] and card.exerted:
+            self._set_card(card, 'exerted', False)
     
-    def can_ink_card(self, card_id: str):
+    def can_ink_card(self, card_id: int):
         """Check if a card can be inked. Returns (can_ink, error_message)"""
         card = self.cards[card_id]
         player = self.players[card.owner]
@@ -162,22 +851,13 @@ class GameState:
         if card.zone != 'hand':
             return False, "Card must be in hand to ink"
         
-        inkwell = card.card_data.get('inkwell')
-        
-        has_inkwell = False
-        if isinstance(inkwell, bool):
-            has_inkwell = inkwell
-        elif isinstance(inkwell, str):
-            has_inkwell = inkwell.lower() in ['true', 'yes', '1']
-        elif isinstance(inkwell, int):
-            has_inkwell = inkwell == 1
-        
-        if not has_inkwell:
+        if not card.definition_data.inkable:
             return False, "This card cannot be inked (no inkwell)"
         
         return True, ""
     
-    def ink_card(self, card_id: str):
+    @recorded
+    def ink_card(self, card_id: int):
         """Ink a card - move to ink zone face down (dried)"""
         can_ink, error_msg = self.can_ink_card(card_id)
         
@@ -188,10 +868,10 @@ class GameState:
         player = self.players[card.owner]
         
         self.move_card(card_id, 'ink', face_up=False)
-        player.has_inked_this_turn = True
+        self._set_player(player, 'has_inked_this_turn', True)
         return True, ""
     
-    def can_play_card(self, card_id: str):
+    def can_play_card(self, card_id: int):
         """Check if a card can be played. Returns (can_play, error_message)"""
         card = self.cards[card_id]
         player = self.players[card.owner]
@@ -199,35 +879,51 @@ class GameState:
         if card.zone != 'hand':
             return False, "Card must be in hand to play"
         
-        cost = card.card_data.get('cost')
-        if cost is None:
-            cost = 0
+        cost = card.definition_data.cost
         
-        available_ink = sum(1 for ink_card_id in player.zones['ink'] 
-                           if not self.cards[ink_card_id].face_up)
-        
-        if available_ink < cost:
-            return False, f"Not enough ink. Need {cost}, have {available_ink}"
+        if player.ink_available < cost:
+            return False, f"Not enough ink. Need {cost}, have {player.ink_available}"
         
         return True, ""
     
+    def get_hand_playability(self, player_id: str) -> Dict[int, Dict[str, bool]]:
+        """Playable / inkable flags for every card in a player's hand, in one pass"""
+        player = self.players[player_id]
+        can_ink = not player.has_inked_this_turn
+        
+        playability = {}
+        for card_id in player.zones['hand']:
+            definition = self.cards[card_id].definition_data
+            playability[card_id] = {
+                'playable': definition.cost <= player.ink_available,
+                'inkable': can_ink and definition.inkable
+            }
+        return playability
+    
+    @recorded
     def spend_ink(self, player_id: str, amount: int):
         """Spend (flip face-up) ink cards"""
         player = self.players[player_id]
-        spent = 0
+        if amount <= 0 or player.ink_available == 0:
+            return
         
+        spent = 0
         for ink_card_id in player.zones['ink']:
             if spent >= amount:
                 break
             if not self.cards[ink_card_id].face_up:
-                self.cards[ink_card_id].face_up = True
+                self._set_card(self.cards[ink_card_id], 'face_up', True)
                 spent += 1
+        
+        self._set_player(player, 'ink_available', player.ink_available - spent)
     
-    def play_card(self, card_id: str):
+    @recorded
+    def play_card(self, card_id: int):
         """Play a card from hand - goes to appropriate zone based on type"""
         card = self.cards[card_id]
-        card_type = card.card_data.get('type', '').lower()
-        cost = card.card_data.get('cost', 0) or 0
+        definition = card.definition_data
+        card_type = definition.card_type
+        cost = definition.cost
         
         self.spend_ink(card.owner, cost)
         
@@ -235,42 +931,52 @@ class GameState:
             self.move_card(card_id, 'discard', face_up=True)
         elif card_type == 'item' or card_type == 'location':
             self.move_card(card_id, 'ready', face_up=True)
-            self.cards[card_id].exerted = False
+            self._set_card(card, 'exerted', False)
         else:
             self.move_card(card_id, 'summoning', face_up=True)
-            self.cards[card_id].exerted = False
+            self._set_card(card, 'exerted', False)
     
-    def exert_card(self, card_id: str):
+    @recorded
+    def exert_card(self, card_id: int):
         """Exert (tap) a card"""
-        self.cards[card_id].exerted = True
+        self._set_card(self.cards[card_id], 'exerted', True)
     
-    def ready_card(self, card_id: str):
+    @recorded
+    def ready_card(self, card_id: int):
         """Ready (untap) a card"""
-        self.cards[card_id].exerted = False
+        self._set_card(self.cards[card_id], 'exerted', False)
     
-    def add_damage(self, card_id: str, amount: int = 1):
+    @recorded
+    def add_damage(self, card_id: int, amount: int = 1):
         """Add damage to a card"""
-        self.cards[card_id].damage += amount
+        card = self.cards[card_id]
+        self._set_card(card, 'damage', card.damage + amount)
     
-    def remove_damage(self, card_id: str, amount: int = 1):
+    @recorded
+    def remove_damage(self, card_id: int, amount: int = 1):
         """Remove damage from a card"""
-        self.cards[card_id].damage = max(0, self.cards[card_id].damage - amount)
+        card = self.cards[card_id]
+        self._set_card(card, 'damage', max(0, card.damage - amount))
     
+    @recorded
     def shuffle_deck(self, player_id: str):
         """Shuffle a player's deck"""
-        player = self.players[player_id]
-        random.shuffle(player.zones['deck'])
+        self._shuffle_zone(self.players[player_id], 'deck')
     
+    @recorded
     def draw_cards(self, player_id: str, count: int = 1):
         """Draw cards from deck to hand"""
         player = self.players[player_id]
         for _ in range(count):
             if player.zones['deck']:
-                card_id = player.zones['deck'].pop(0)
-                player.zones['hand'].append(card_id)
-                self.cards[card_id].zone = 'hand'
-                self.cards[card_id].face_up = True
+                card = self.cards[player.zones['deck'].top()]
+                self._place_card(card, 'hand')
+                if not card.face_up:
+                    self._set_card(card, 'face_up', True)
+        
+        self._mark_player(player_id)
     
+    @recorded
     def flip_mystery_card(self, player_id: str):
         """Flip and play mystery card (turn 3+, free, ready immediately)"""
         if self.turn_number < 3:
@@ -278,12 +984,13 @@ class GameState:
         
         player = self.players[player_id]
         if player.zones['mystery']:
-            card_id = player.zones['mystery'][0]
+            card_id = player.zones['mystery'].top()
             self.move_card(card_id, 'ready', face_up=True)
-            self.cards[card_id].exerted = False
+            self._set_card(self.cards[card_id], 'exerted', False)
             return True
         return False
     
+    @recorded
     def end_turn(self, player_id: str):
         """End current player's turn - dry ink, move to next player"""
         if self.current_turn != player_id:
@@ -291,43 +998,206 @@ class GameState:
         
         player = self.players[player_id]
         
-        for card_id in player.zones['ink']:
-            self.cards[card_id].face_up = False
+        if player.ink_available < player.ink_total:
+            for card_id in player.zones['ink']:
+                if self.cards[card_id].face_up:
+                    self._set_card(self.cards[card_id], 'face_up', False)
+            self._set_player(player, 'ink_available', player.ink_total)
         
-        player.has_inked_this_turn = False
+        self._set_player(player, 'has_inked_this_turn', False)
         
         current_idx = self.player_order.index(player_id)
         next_idx = (current_idx + 1) % len(self.player_order)
-        self.current_turn = self.player_order[next_idx]
+        self._set_game('current_turn', self.player_order[next_idx])
         
         if next_idx == 0:
-            self.turn_number += 1
+            self._set_game('turn_number', self.turn_number + 1)
         
         return True
     
+    @recorded
     def add_lore(self, player_id: str, amount: int):
         """Add lore to a player"""
-        self.players[player_id].lore += amount
+        player = self.players[player_id]
+        self._set_player(player, 'lore', player.lore + amount)
+    
+    def _public_view(self) -> Dict:
+        """Everything any non-owner can see, built once per version and shared by all viewers"""
+        if self.public_view is not None and self.public_view[0] == self.version:
+            return self.public_view[1]
+        
+        face_up = {pid: {} for pid in self.players}
+        card_defs = {}
+        for cid, card in self.cards.items():
+            if card.is_public():
+                face_up[card.owner][cid] = card.to_dict()
+                definition = CARD_DEFINITIONS[card.definition]
+                card_defs[definition.key] = definition.data
+        
+        view = {
+            'players': {pid: player.to_dict() for pid, player in self.players.items()},
+            'face_up': face_up,
+            'card_defs': card_defs,
+            # Serialized fragments, spliced into every viewer's JSON by get_state_json
+            'players_json': None,
+            'face_up_json': None,
+            'card_defs_json': None
+        }
+        self.public_view = (self.version, view)
+        return view
     
     def get_state_for_player(self, viewer_id: str) -> Dict:
-        """Get game state from a specific player's perspective"""
-        return {
+        """Get game state from a specific player's perspective (memoized per version)"""
+        cached = self.projections.get(viewer_id)
+        if cached is not None and cached[0] == self.version:
+            STATE_MEMO_HITS.inc()
+            state = cached[1]
+            self.revealed_defs[viewer_id] = set(state['card_defs'])
+            return state
+        
+        STATE_MEMO_MISSES.inc()
+        start = time.perf_counter()
+        public = self._public_view()
+        card_defs = dict(public['card_defs'])
+        own_defs = {}
+        players = dict(public['players'])
+        my_cards = {}
+        visible_cards = {}
+        
+        for pid, cards in public['face_up'].items():
+            if pid != viewer_id:
+                visible_cards.update(cards)
+        
+        viewer = self.players.get(viewer_id)
+        if viewer is not None:
+            players[viewer_id] = viewer.to_dict(viewer_id)
+            own_face_up = public['face_up'][viewer_id]
+            for zone in viewer.zones.values():
+                for cid in zone:
+                    if cid in own_face_up:
+                        my_cards[cid] = own_face_up[cid]
+                        continue
+                    card = self.cards[cid]
+                    my_cards[cid] = card.to_dict(viewer_id)
+                    if card.visible_to(viewer_id):
+                        definition = CARD_DEFINITIONS[card.definition]
+                        if definition.key not in card_defs:
+                            card_defs[definition.key] = own_defs[definition.key] = definition.data
+        
+        state = {
+            'card_defs': card_defs,
             'game_id': self.game_id,
+            'version': self.version,
             'current_turn': self.current_turn,
             'turn_number': self.turn_number,
             'player_order': self.player_order,
-            'players': {
-                pid: player.to_dict(viewer_id) 
-                for pid, player in self.players.items()
-            },
-            'my_cards': {
-                cid: card.to_dict(viewer_id)
-                for cid, card in self.cards.items()
-                if card.owner == viewer_id
-            },
-            'visible_cards': {
-                cid: card.to_dict(viewer_id)
-                for cid, card in self.cards.items()
-                if card.owner != viewer_id and card.face_up
-            }
+            'playable': self.get_hand_playability(viewer_id) if viewer is not None else {},
+            'players': players,
+            'my_cards': my_cards,
+            'visible_cards': visible_cards
+        }
+        self.projections[viewer_id] = (self.version, state, None, own_defs)
+        self.revealed_defs[viewer_id] = set(card_defs)
+        STATE_BUILD_SECONDS.observe(time.perf_counter() - start)
+        return state
+    
+    def get_state_json(self, viewer_id: str) -> bytes:
+        """Serialized get_state_for_player, memoized per (viewer, version).
+        
+        The public parts are serialized once per version and spliced in, so
+        each viewer only pays for serializing their own cards.
+        """
+        state = self.get_state_for_player(viewer_id)
+        version, _, data, own_defs = self.projections[viewer_id]
+        if data is not None:
+            return data
+        
+        public = self._public_view()
+        if public['players_json'] is None:
+            public['players_json'] = {pid: _to_json(p) for pid, p in public['players'].items()}
+            public['face_up_json'] = {pid: _to_json(cards)[1:-1] for pid, cards in public['face_up'].items()}
+            public['card_defs_json'] = _to_json(public['card_defs'])[1:-1]
+        
+        players = ','.join(
+            f"{_to_json(pid)}:{_to_json(player) if pid == viewer_id else public['players_json'][pid]}"
+            for pid, player in state['players'].items()
+        )
+        visible_cards = ','.join(
+            cards for pid, cards in public['face_up_json'].items() if pid != viewer_id and cards
+        )
+        card_defs = ','.join(
+            part for part in (public['card_defs_json'], _to_json(own_defs)[1:-1]) if part
+        )
+        head = _to_json({
+            key: state[key]
+            for key in ('game_id', 'version', 'current_turn', 'turn_number', 'player_order', 'playable')
+        })[:-1]
+        
+        data = (
+            f"{head},\"card_defs\":{{{card_defs}}},\"players\":{{{players}}},"
+            f"\"my_cards\":{_to_json(state['my_cards'])},\"visible_cards\":{{{visible_cards}}}}}"
+        ).encode('utf-8')
+        self.projections[viewer_id] = (version, state, data, own_defs)
+        return data
+    
+    def collect_changes(self) -> Optional[Dict]:
+        """Take the changes made since the last broadcast and reset the dirty sets"""
+        if self.version == self.broadcast_version:
+            return None
+        
+        changes = {
+            'base_version': self.broadcast_version,
+            'version': self.version,
+            'cards': self.dirty_cards,
+            'players': self.dirty_players,
+            'game': self.dirty_game
+        }
+        self.broadcast_version = self.version
+        self.dirty_cards = set()
+        self.dirty_players = set()
+        self.dirty_game = False
+        return changes
+    
+    def get_delta_for_player(self, viewer_id: str, changes: Dict) -> Dict:
+        """JSON-patch style delta of `changes`, from a specific player's perspective.
+        
+        Every op replaces a whole value, so it can be applied to any state at or
+        after base_version; clients behind base_version must resync.
+        """
+        ops = []
+        
+        if changes['game']:
+            ops.append({'op': 'replace', 'path': '/current_turn', 'value': self.current_turn})
+            ops.append({'op': 'replace', 'path': '/turn_number', 'value': self.turn_number})
+            ops.append({'op': 'replace', 'path': '/player_order', 'value': self.player_order})
+        
+        for pid in changes['players']:
+            ops.append({'op': 'replace', 'path': f'/players/{pid}',
+                        'value': self.players[pid].to_dict(viewer_id)})
+        
+        if viewer_id in changes['players']:
+            ops.append({'op': 'replace', 'path': '/playable',
+                        'value': self.get_hand_playability(viewer_id)})
+        
+        revealed = self.revealed_defs.setdefault(viewer_id, set())
+        for cid in changes['cards']:
+            card = self.cards[cid]
+            if card.visible_to(viewer_id):
+                definition = CARD_DEFINITIONS[card.definition]
+                if definition.key not in revealed:
+                    revealed.add(definition.key)
+                    ops.append({'op': 'add', 'path': f'/card_defs/{definition.key}', 'value': definition.data})
+            
+            if card.owner == viewer_id:
+                ops.append({'op': 'replace', 'path': f'/my_cards/{cid}', 'value': card.to_dict(viewer_id)})
+            elif card.is_public():
+                ops.append({'op': 'replace', 'path': f'/visible_cards/{cid}', 'value': card.to_dict(viewer_id)})
+            else:
+                ops.append({'op': 'remove', 'path': f'/visible_cards/{cid}'})
+        
+        return {
+            'game_id': self.game_id,
+            'base_version': changes['base_version'],
+            'version': changes['version'],
+            'ops': ops
         }
@@ -0,0 +1,319 @@
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Set
+
+from game_executor import GameExecutor
+from game_lifecycle import GameLifecycle
+from game_state import GameState
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class GameStore:
+    """Where games and player sessions live between actions.
+
+    Actions go through `transaction`, which holds the game's lock, loads the
+    game, and saves it back when the block exits. If an ActionLog is given,
+    loaded games record their actions to it.
+    """
+
+    def __init__(self, executor: Optional[GameExecutor] = None, action_log=None):
+        self.executor = executor if executor is not None else GameExecutor()
+        self.action_log = action_log
+
+    def get(self, game_id: str) -> Optional[GameState]:
+        raise NotImplementedError
+
+    def save(self, game: GameState):
+        raise NotImplementedError
+
+    def delete(self, game_id: str):
+        raise NotImplementedError
+
+    def game_ids(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def game_count(self) -> int:
+        return sum(1 for _ in self.game_ids())
+
+    def __contains__(self, game_id) -> bool:
+        return game_id is not None and self.get(game_id) is not None
+
+    @contextmanager
+    def lock(self, game_id: str):
+        with self.executor.acquire(game_id):
+            yield
+
+    @contextmanager
+    def transaction(self, game_id: str):
+        """Lock, load and (on success) save a game; yields None if it does not exist.
+
+        A block that only reads the game (no action and no broadcast) does not
+        save it, so state requests cost one load, and do not count as activity.
+        """
+        with self.lock(game_id):
+            game = self.get(game_id)
+            if game is None:
+                yield None
+                return
+            if self.action_log is not None:
+                self.action_log.attach(game)
+            before = (game.action_seq, game.version, game.broadcast_version)
+            yield game
+            if (game.action_seq, game.version, game.broadcast_version) != before:
+                self.save(game)
+
+    def set_session(self, player_id: str, sid: str):
+        raise NotImplementedError
+
+    def get_session(self, player_id: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def remove_sessions_for_sid(self, sid: str) -> list:
+        """Forget every player bound to a socket id; returns their ids"""
+        raise NotImplementedError
+
+    def session_count(self) -> int:
+        raise NotImplementedError
+
+    def add_spectator(self, game_id: str, sid: str):
+        """Bind a socket to a game's spectator room (a socket watches one game at a time)"""
+        raise NotImplementedError
+
+    def remove_spectator(self, sid: str) -> Optional[str]:
+        """Forget a spectating socket; returns the game it was watching"""
+        raise NotImplementedError
+
+    def spectator_count(self, game_id: Optional[str] = None) -> int:
+        """Spectators of one game, or of all games"""
+        raise NotImplementedError
+
+
+class InMemoryGameStore(GameStore):
+    """Single-process store - games stay live objects, save is free.
+
+    With a GameLifecycle, idle games are hibernated to disk and transparently
+    loaded again by `get`.
+    """
+
+    def __init__(self, executor: Optional[GameExecutor] = None, action_log=None,
+                 lifecycle: Optional[GameLifecycle] = None):
+        super().__init__(executor, action_log)
+        self.games: Dict[str, GameState] = {}
+        self.sessions: Dict[str, str] = {}
+        self.spectators: Dict[str, Set[str]] = {}
+        self.spectating: Dict[str, str] = {}
+        self.lifecycle = lifecycle
+        if lifecycle is not None:
+            lifecycle.store = self
+
+    def get(self, game_id: str) -> Optional[GameState]:
+        game = self.games.get(game_id)
+        if game is None and self.lifecycle is not None and self.lifecycle.is_hibernated(game_id):
+            game = self.lifecycle.wake(game_id, self.games)
+        return game
+
+    def save(self, game: GameState):
+        self.games[game.game_id] = game
+        if self.lifecycle is not None:
+            self.lifecycle.touch(game)
+
+    def delete(self, game_id: str):
+        game = self.games.pop(game_id, None)
+        if game is not None:
+            # Players of a deleted game must not keep pointing at it
+            for pid in game.players:
+                self.sessions.pop(pid, None)
+        for sid in self.spectators.pop(game_id, ()):
+            self.spectating.pop(sid, None)
+        if self.lifecycle is not None:
+            self.lifecycle.forget(game_id)
+        self.executor.remove(game_id)
+
+    def __contains__(self, game_id) -> bool:
+        if game_id is None:
+            return False
+        if game_id in self.games:
+            return True
+        return self.lifecycle is not None and self.lifecycle.is_hibernated(game_id)
+
+    def game_ids(self) -> Iterator[str]:
+        hibernated = list(self.lifecycle.hibernated) if self.lifecycle is not None else []
+        return iter(list(self.games) + hibernated)
+
+    def __len__(self):
+        return len(self.games)
+
+    def game_count(self) -> int:
+        """Live games (hibernated games are on disk)"""
+        return len(self.games)
+
+    def set_session(self, player_id: str, sid: str):
+        self.sessions[player_id] = sid
+
+    def get_session(self, player_id: str) -> Optional[str]:
+        return self.sessions.get(player_id)
+
+    def remove_sessions_for_sid(self, sid: str) -> list:
+        removed = [pid for pid, player_sid in list(self.sessions.items()) if player_sid == sid]
+        for pid in removed:
+            self.sessions.pop(pid, None)
+        return removed
+
+    def session_count(self) -> int:
+        return len(self.sessions)
+
+    def add_spectator(self, game_id: str, sid: str):
+        self.remove_spectator(sid)
+        self.spectators.setdefault(game_id, set()).add(sid)
+        self.spectating[sid] = game_id
+
+    def remove_spectator(self, sid: str) -> Optional[str]:
+        game_id = self.spectating.pop(sid, None)
+        if game_id is not None:
+            sids = self.spectators.get(game_id)
+            if sids is not None:
+                sids.discard(sid)
+                if not sids:
+                    del self.spectators[game_id]
+        return game_id
+
+    def spectator_count(self, game_id: Optional[str] = None) -> int:
+        if game_id is None:
+            return len(self.spectating)
+        return len(self.spectators.get(game_id, ()))
+
+
+class RedisGameStore(GameStore):
+    """Shared store for running several workers; works with any redis-py compatible client
+    (e.g. fakeredis in tests). Games are stored as GameState.to_bytes snapshots,
+    with their pending broadcast, since the broadcast tick loads the game again.
+
+    Each game is one key, `lorcana:game:{<game_id>}`; the braces make the
+    game id the Redis Cluster hash tag, so a game and its lock live on the
+    same shard.
+    """
+
+    def __init__(self, client=None, url: Optional[str] = None, prefix: str = 'lorcana',
+                 lock_timeout: float = 10, ttl: Optional[int] = 24 * 3600,
+                 executor: Optional[GameExecutor] = None, action_log=None,
+                 dumps: Callable[[GameState], bytes] = None,
+                 loads: Callable[[bytes], GameState] = None):
+        super().__init__(executor, action_log)
+        if client is None:
+            if redis is None:
+                raise RuntimeError("RedisGameStore needs the 'redis' package (pip install redis)")
+            client = redis.Redis.from_url(url or 'redis://localhost:6379/0')
+
+        self.client = client
+        self.prefix = prefix
+        self.lock_timeout = lock_timeout
+        self.ttl = ttl
+        self.dumps = dumps or (lambda game: game.to_bytes(include_history=True, include_broadcast=True))
+        self.loads = loads or GameState.from_bytes
+        self.sessions_key = f"{prefix}:sessions"
+        self.spectating_key = f"{prefix}:spectating"
+
+    def _game_key(self, game_id: str) -> str:
+        return f"{self.prefix}:game:{{{game_id}}}"
+
+    def _lock_key(self, game_id: str) -> str:
+        return f"{self.prefix}:lock:{{{game_id}}}"
+
+    def get(self, game_id: str) -> Optional[GameState]:
+        data = self.client.get(self._game_key(game_id))
+        return self.loads(data) if data is not None else None
+
+    def save(self, game: GameState):
+        self.client.set(self._game_key(game.game_id), self.dumps(game), ex=self.ttl)
+
+    def delete(self, game_id: str):
+        sids = self.client.smembers(self._spectators_key(game_id))
+        pipe = self.client.pipeline()
+        pipe.delete(self._game_key(game_id), self._spectators_key(game_id))
+        if sids:
+            pipe.hdel(self.spectating_key, *sids)
+        pipe.execute()
+        self.executor.remove(game_id)
+
+    def __contains__(self, game_id) -> bool:
+        return game_id is not None and bool(self.client.exists(self._game_key(game_id)))
+
+    def game_ids(self) -> Iterator[str]:
+        start = len(f"{self.prefix}:game:{{")
+        for key in self.client.scan_iter(match=f"{self.prefix}:game:*"):
+            key = key.decode('utf-8') if isinstance(key, bytes) else key
+            yield key[start:-1]
+
+    @contextmanager
+    def lock(self, game_id: str):
+        # Local lock first so workers in this process queue cheaply, then the cross-worker lock
+        with self.executor.acquire(game_id):
+            with self.client.lock(self._lock_key(game_id), timeout=self.lock_timeout,
+                                  blocking_timeout=self.lock_timeout):
+                yield
+
+    def _sid_key(self, sid: str) -> str:
+        return f"{self.prefix}:sid:{sid}"
+
+    def set_session(self, player_id: str, sid: str):
+        self.client.hset(self.sessions_key, player_id, sid)
+        self.client.sadd(self._sid_key(sid), player_id)
+
+    def get_session(self, player_id: str) -> Optional[str]:
+        sid = self.client.hget(self.sessions_key, player_id)
+        if isinstance(sid, bytes):
+            sid = sid.decode('utf-8')
+        return sid
+
+    def remove_sessions_for_sid(self, sid: str) -> list:
+        removed = [
+            pid.decode('utf-8') if isinstance(pid, bytes) else pid
+            for pid in self.client.smembers(self._sid_key(sid))
+        ]
+        # Only drop players still bound to this sid (they may have reconnected elsewhere)
+        removed = [pid for pid in removed if self.get_session(pid) == sid]
+        if removed:
+            self.client.hdel(self.sessions_key, *removed)
+        self.client.delete(self._sid_key(sid))
+        return removed
+
+    def session_count(self) -> int:
+        return self.client.hlen(self.sessions_key)
+
+    def _spectators_key(self, game_id: str) -> str:
+        return f"{self.prefix}:spectators:{{{game_id}}}"
+
+    def add_spectator(self, game_id: str, sid: str):
+        self.remove_spectator(sid)
+        self.client.sadd(self._spectators_key(game_id), sid)
+        self.client.hset(self.spectating_key, sid, game_id)
+        if self.ttl is not None:
+            self.client.expire(self._spectators_key(game_id), self.ttl)
+
+    def remove_spectator(self, sid: str) -> Optional[str]:
+        game_id = self.client.hget(self.spectating_key, sid)
+        if game_id is None:
+            return None
+        if isinstance(game_id, bytes):
+            game_id = game_id.decode('utf-8')
+        self.client.srem(self._spectators_key(game_id), sid)
+        self.client.hdel(self.spectating_key, sid)
+        return game_id
+
+    def spectator_count(self, game_id: Optional[str] = None) -> int:
+        if game_id is None:
+            return self.client.hlen(self.spectating_key)
+        return self.client.scard(self._spectators_key(game_id))
+
+
+def create_game_store(backend: str = 'memory', redis_url: Optional[str] = None,
+                      action_log=None, lifecycle: Optional[GameLifecycle] = None) -> GameStore:
+    """`lifecycle` applies to the memory backend; Redis expires idle games with its own TTL"""
+    if backend == 'redis':
+        return RedisGameStore(url=redis_url, action_log=action_log)
+    if backend == 'memory':
+        return InMemoryGameStore(action_log=action_log, lifecycle=lifecycle)
+    raise ValueError(f"Unknown game store backend: {backend}")
@@ -0,0 +1,339 @@
+"""Socket.IO load generator: many clients playing in shared games.
+
+Each client takes a seat in a test game, then toggles exert_card / ready_card
+on one of its own cards and times how long it takes for the matching
+game_patch to come back. Without --url the server runs in this process, e.g.
+`python loadtest.py --games 10 --clients 30 --duration 20 --json`.
+
+--idle N first opens N more connections that only listen to their game, to
+compare how many concurrent sockets a server mode holds (and what they do to
+the active clients' latency), e.g. against `python app.py` and `python server.py`.
+--spectators N adds N clients watching the games through the spectator room;
+the server's mean broadcast time (from /metrics) shows what they cost.
+"""
+import argparse
+import contextlib
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import requests
+import socketio
+
+
+class LoadClient:
+    """One simulated player: its own HTTP session (for the Flask session cookie) and socket"""
+
+    def __init__(self, url: str, game_id: str, seat: int, transport: str, timeout: float):
+        self.url = url
+        self.timeout = timeout
+        self.http = requests.Session()
+
+        joined = self.http.get(f"{url}/test_game/{game_id}/join/{seat}", timeout=timeout)
+        if joined.status_code == 404:
+            raise RuntimeError(f"{url} cannot seat load test clients; start it with LOAD_TEST=1")
+        joined.raise_for_status()
+        data = joined.json()
+        self.game_id = data['game_id']
+        self.player_id = data['player_id']
+
+        hand = [cid for cid, card in data['state']['my_cards'].items() if card['zone'] == 'hand']
+        self.card_id = int(hand[0])
+        self.exerted = data['state']['my_cards'][hand[0]]['exerted']
+
+        self.patch_path = f"/my_cards/{self.card_id}"
+        self.expected: Optional[bool] = None
+        self.answered = threading.Event()
+        self.latencies: List[float] = []
+        self.timeouts = 0
+        self.errors = 0
+
+        self.sio = socketio.Client(http_session=self.http, reconnection=False)
+        self.sio.on('game_patch', self._on_patch)
+        self.sio.on('error', self._on_error)
+        self.sio.connect(url, transports=[transport])
+        self.sio.emit('join_game', {'game_id': self.game_id, 'player_id': self.player_id})
+
+    def _on_patch(self, patch: Dict):
+        if self.expected is None:
+            return
+        for op in patch['ops']:
+            if op['path'] == self.patch_path and op['value']['exerted'] == self.expected:
+                self.answered.set()
+                return
+
+    def _on_error(self, data: Dict):
+        self.errors += 1
+
+    def run(self, until: float, interval: float):
+        """Send toggles until `until`, at most one every `interval` seconds (0 = back to back)"""
+        while time.monotonic() < until:
+            started = time.perf_counter()
+            self.expected = not self.exerted
+            self.answered.clear()
+            self.sio.emit('exert_card' if self.expected else 'ready_card', {'card_id': self.card_id})
+
+            if self.answered.wait(self.timeout):
+                self.latencies.append(time.perf_counter() - started)
+                self.exerted = self.expected
+            else:
+                # The state is unknown now; the next toggle re-sends from the last confirmed one
+                self.timeouts += 1
+            self.expected = None
+
+            wait = interval - (time.perf_counter() - started)
+            if wait > 0:
+                time.sleep(wait)
+
+    def close(self):
+        self.sio.disconnect()
+
+
+class SpectatorClient:
+    """A watcher: receives the public state, then the spectator room's patches"""
+
+    def __init__(self, url: str, game_id: str, transport: str):
+        self.version: Optional[int] = None
+        self.patches = 0
+        self.gaps = 0
+        self.joined = threading.Event()
+
+        self.sio = socketio.Client(http_session=requests.Session(), reconnection=False)
+        self.sio.on('game_update', self._on_state)
+        self.sio.on('game_patch', self._on_patch)
+        self.sio.connect(url, transports=[transport])
+        self.sio.emit('spectate_game', {'game_id': game_id})
+
+    def _on_state(self, state: Dict):
+        self.version = state['version']
+        self.joined.set()
+
+    def _on_patch(self, patch: Dict):
+        if self.version is None or patch['base_version'] > self.version:
+            self.gaps += 1
+        self.version = patch['version']
+        self.patches += 1
+
+    def close(self):
+        self.sio.disconnect()
+
+
+def broadcast_totals(url: str) -> Optional[tuple]:
+    """(seconds, count) of the server's lorcana_broadcast_seconds histogram, if /metrics is there"""
+    try:
+        text = requests.get(f"{url}/metrics", timeout=5).text
+    except requests.RequestException:
+        return None
+    totals = {}
+    for line in text.splitlines():
+        name, _, value = line.partition(' ')
+        if name in ('lorcana_broadcast_seconds_sum', 'lorcana_broadcast_seconds_count'):
+            totals[name] = float(value)
+    if len(totals) != 2:
+        return None
+    return totals['lorcana_broadcast_seconds_sum'], totals['lorcana_broadcast_seconds_count']
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def start_local_server() -> str:
+    """Run the app in this process on a free port; returns its URL"""
+    os.environ.setdefault('LORCANA_OFFLINE', '1')
+    os.environ['LOAD_TEST'] = '1'
+    import app as server
+
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+
+    threading.Thread(
+        target=lambda: server.socketio.run(server.app, host='127.0.0.1', port=port,
+                                           allow_unsafe_werkzeug=True, log_output=False),
+        daemon=True
+    ).start()
+
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            requests.get(f"{url}/cache_stats", timeout=1)
+            return url
+        except requests.ConnectionError:
+            time.sleep(0.05)
+    raise RuntimeError("local server did not start")
+
+
+def open_idle(url: str, game_ids: List[str], count: int, transport: str, timeout: float,
+              concurrency: int = 16) -> Dict:
+    """Connect `count` listening clients to the games; returns them with connect times and failures"""
+    def connect(i):
+        started = time.perf_counter()
+        try:
+            client = LoadClient(url, game_ids[i % len(game_ids)], i % 3, transport, timeout)
+        except Exception as e:
+            return None, str(e)
+        return client, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(connect, range(count)))
+
+    return {
+        'clients': [client for client, _ in results if client is not None],
+        'errors': [error for client, error in results if client is None],
+        'connect_ms': [elapsed * 1000 for client, elapsed in results if client is not None]
+    }
+
+
+def run_load(url: str, games: int, clients: int, duration: float, rate: float,
+             transport: str = 'polling', timeout: float = 5, idle: int = 0, spectators: int = 0) -> Dict:
+    """Spread `clients` over `games` 3-player test games and measure action round trips"""
+    seats_per_game = 3
+    if clients > games * seats_per_game:
+        raise ValueError(f"{games} games have room for {games * seats_per_game} clients")
+
+    game_ids = []
+    for _ in range(games):
+        created = requests.get(f"{url}/test_game", timeout=30)
+        created.raise_for_status()
+        game_ids.append(created.json()['game_id'])
+
+    idle_clients = open_idle(url, game_ids, idle, transport, timeout) if idle else None
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        watchers = list(pool.map(
+            lambda i: SpectatorClient(url, game_ids[i % games], transport), range(spectators)
+        ))
+    for watcher in watchers:
+        watcher.joined.wait(timeout)
+    load_clients = [
+        LoadClient(url, game_ids[i % games], i // games, transport, timeout) for i in range(clients)
+    ]
+    time.sleep(0.5)
+
+    interval = 1 / rate if rate > 0 else 0
+    broadcasts_before = broadcast_totals(url)
+    start = time.monotonic()
+    until = start + duration
+    threads = [threading.Thread(target=client.run, args=(until, interval)) for client in load_clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+    # Let the last broadcasts reach the spectators
+    time.sleep(0.5)
+    broadcasts_after = broadcast_totals(url)
+
+    for client in load_clients + (idle_clients['clients'] if idle_clients else []) + watchers:
+        client.close()
+
+    latencies = [latency * 1000 for client in load_clients for latency in client.latencies]
+    result = {
+        'url': url,
+        'transport': transport,
+        'games': games,
+        'clients': clients,
+        'duration_s': elapsed,
+        'rate_per_client': rate,
+        'actions': len(latencies),
+        'actions_per_sec': len(latencies) / elapsed,
+        'timeouts': sum(client.timeouts for client in load_clients),
+        'server_errors': sum(client.errors for client in load_clients),
+        'latency_ms': {
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p99': percentile(latencies, 99),
+            'max': max(latencies, default=0.0),
+            'mean': sum(latencies) / len(latencies) if latencies else 0.0
+        }
+    }
+    if broadcasts_before is not None and broadcasts_after is not None:
+        count = broadcasts_after[1] - broadcasts_before[1]
+        result['server_broadcast_ms'] = {
+            'count': count,
+            'mean': (broadcasts_after[0] - broadcasts_before[0]) / count * 1000 if count else 0.0
+        }
+    if watchers:
+        result['spectators'] = {
+            'clients': len(watchers),
+            'joined': sum(watcher.version is not None for watcher in watchers),
+            'patches_per_spectator': sum(watcher.patches for watcher in watchers) / len(watchers),
+            'gaps': sum(watcher.gaps for watcher in watchers)
+        }
+    if idle_clients is not None:
+        connect_ms = idle_clients['connect_ms']
+        result['idle'] = {
+            'requested': idle,
+            'connected': len(idle_clients['clients']),
+            'failed': len(idle_clients['errors']),
+            'first_error': idle_clients['errors'][0] if idle_clients['errors'] else None,
+            'connect_ms': {'p50': percentile(connect_ms, 50), 'p99': percentile(connect_ms, 99)}
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='server to load (default: start one in this process)')
+    parser.add_argument('--games', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=12, help='clients in total, up to 3 per game')
+    parser.add_argument('--duration', type=float, default=10, help='seconds')
+    parser.add_argument('--rate', type=float, default=5,
+                        help='actions per second per client (0 = next action as soon as the last is seen)')
+    parser.add_argument('--transport', choices=['polling', 'websocket'], default='polling')
+    parser.add_argument('--timeout', type=float, default=5, help='seconds to wait for an action to come back')
+    parser.add_argument('--idle', type=int, default=0, help='extra connections that only listen to their game')
+    parser.add_argument('--spectators', type=int, default=0, help='clients watching the games as spectators')
+    parser.add_argument('--json', action='store_true', help='print the result as JSON')
+    parser.add_argument('--output', help='also write the JSON result to this file')
+    args = parser.parse_args()
+
+    # An in-process server logs to stdout; keep that out of the report
+    with contextlib.redirect_stdout(sys.stderr if args.url is None else sys.stdout):
+        url = (args.url or start_local_server()).rstrip('/')
+        result = run_load(url, args.games, args.clients, args.duration, args.rate, args.transport, args.timeout,
+                          args.idle, args.spectators)
+
+    if args.json or args.output:
+        from benchmarks import environment
+        data = json.dumps({'benchmark': 'loadtest', 'environment': environment(), 'result': result}, indent=2)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(data + '\n')
+        if args.json:
+            print(data)
+    if not args.json:
+        latency = result['latency_ms']
+        print(f"{result['clients']} clients in {result['games']} games over {result['transport']}, "
+              f"{result['duration_s']:.1f}s: {result['actions']} actions ({result['actions_per_sec']:.0f}/s), "
+              f"{result['timeouts']} timeouts")
+        print(f"round trip: p50 {latency['p50']:.1f} ms, p90 {latency['p90']:.1f} ms, "
+              f"p99 {latency['p99']:.1f} ms, max {latency['max']:.1f} ms")
+        if 'server_broadcast_ms' in result:
+            print(f"server: {result['server_broadcast_ms']['count']:.0f} broadcasts, "
+                  f"{result['server_broadcast_ms']['mean']:.3f} ms each")
+        if 'spectators' in result:
+            watching = result['spectators']
+            print(f"spectators: {watching['joined']}/{watching['clients']} watching, "
+                  f"{watching['patches_per_spectator']:.0f} patches each, {watching['gaps']} gaps")
+        if 'idle' in result:
+            idle = result['idle']
+            print(f"idle connections: {idle['connected']}/{idle['requested']} connected "
+                  f"(connect p50 {idle['connect_ms']['p50']:.0f} ms, p99 {idle['connect_ms']['p99']:.0f} ms), "
+                  f"{idle['failed']} failed")
+
+    if (result['timeouts'] or result['server_errors'] or result.get('idle', {}).get('failed')
+            or result.get('spectators', {}).get('gaps')):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+import heapq
+import itertools
+import json
+import queue
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from game_state import GameState
+from logs import get_logger
+from metrics import REGISTRY
+
+logger = get_logger('lobby')
+
+TABLE_SIZES = (2, 3, 4)
+DEFAULT_FORMAT = 'core'
+
+MATCH_SECONDS = REGISTRY.histogram(
+    'lorcana_lobby_match_seconds', 'Time from joining the queue to the game being ready',
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+)
+GAME_CREATE_SECONDS = REGISTRY.histogram(
+    'lorcana_lobby_game_create_seconds', 'Deck resolution and game setup for one matched table'
+)
+
+QueueKey = Tuple[int, str]
+
+
+class Ticket:
+    """One player's place in the lobby, from queueing until their game is ready"""
+    __slots__ = ('ticket_id', 'player_id', 'username', 'deck_text', 'table_size', 'format',
+                 'status', 'game_id', 'error', 'queued_at', 'priority', 'finished_at')
+
+    def __init__(self, username: str, deck_text: str, table_size: int, format: str, priority: float):
+        self.ticket_id = str(uuid.uuid4())
+        self.player_id = str(uuid.uuid4())
+        self.username = username
+        self.deck_text = deck_text
+        self.table_size = table_size
+        self.format = format
+        # queued -> matched -> ready, or failed / cancelled
+        self.status = 'queued'
+        self.game_id: Optional[str] = None
+        self.error: Optional[str] = None
+        self.queued_at = time.monotonic()
+        self.priority = priority
+        self.finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            'ticket_id': self.ticket_id,
+            'status': self.status,
+            'players': self.table_size,
+            'format': self.format,
+            'game_id': self.game_id,
+            'error': self.error
+        }
+
+
+class Lobby:
+    """Matchmaking for 2-4 player tables.
+
+    Each (table size, format) has its own heap of waiting tickets ordered by
+    priority (the time they first queued, so players put back after a failed
+    table keep their place). Joining, cancelling and forming a table are
+    O(log n); a full table is handed to a background worker that resolves
+    the decks and creates the game, so no request waits on the card API.
+
+    `resolve_deck(deck_text)` returns a deck for GameState.add_player (empty
+    if nothing resolved) and `save_game(game)` stores a started game. The
+    lobby lives in one process; with several workers, run it on one of them.
+    """
+
+    def __init__(self, resolve_deck: Callable[[str], Sequence[Dict]], save_game: Callable[[GameState], None],
+                 ticket_ttl: float = 600):
+        self.resolve_deck = resolve_deck
+        self.save_game = save_game
+        self.ticket_ttl = ticket_ttl
+        self.lock = threading.Lock()
+
+        self.queues: Dict[QueueKey, List[Tuple[float, int, Ticket]]] = {}
+        # Live (not cancelled) tickets per queue; cancelled ones are dropped lazily from the heap
+        self.waiting: Dict[QueueKey, int] = {}
+        self.tickets: Dict[str, Ticket] = {}
+        self.sequence = itertools.count()
+        self.matches: 'queue.Queue[List[Ticket]]' = queue.Queue()
+
+        # Listing index: updated as tables form and games end, serialized once per change
+        self.tables: Dict[str, Dict] = {}
+        self.listing_version = 0
+        self.listing_cache: Optional[Tuple[int, bytes]] = None
+
+        self.tables_formed = 0
+        self.games_created = 0
+        self.failures = 0
+
+    def join(self, username: str, deck_text: str, table_size: int = 2, format: str = DEFAULT_FORMAT) -> Ticket:
+        if table_size not in TABLE_SIZES:
+            raise ValueError(f"Tables are for {TABLE_SIZES[0]}-{TABLE_SIZES[-1]} players")
+        ticket = Ticket(username, deck_text, table_size, format, time.time())
+        with self.lock:
+            self.tickets[ticket.ticket_id] = ticket
+            self._push(ticket)
+            self._form_tables((table_size, format))
+        return ticket
+
+    def cancel(self, ticket_id: str) -> bool:
+        """Leave the queue; a ticket that already has a table cannot be cancelled"""
+        with self.lock:
+            ticket = self.tickets.get(ticket_id)
+            if ticket is None or ticket.status != 'queued':
+                return False
+            ticket.status = 'cancelled'
+            ticket.finished_at = time.monotonic()
+            key = (ticket.table_size, ticket.format)
+            self.waiting[key] -= 1
+            self.listing_version += 1
+
+            heap = self.queues[key]
+            if len(heap) > 2 * self.waiting[key] + 64:
+                heap[:] = [entry for entry in heap if entry[2].status == 'queued']
+                heapq.heapify(heap)
+            return True
+
+    def get_ticket(self, ticket_id: str) -> Optional[Ticket]:
+        return self.tickets.get(ticket_id)
+
+    def _push(self, ticket: Ticket):
+        key = (ticket.table_size, ticket.format)
+        heapq.heappush(self.queues.setdefault(key, []), (ticket.priority, next(self.sequence), ticket))
+        self.waiting[key] = self.waiting.get(key, 0) + 1
+        self.listing_version += 1
+
+    def _form_tables(self, key: QueueKey):
+        """Pop full tables off a queue (lock held)"""
+        heap = self.queues[key]
+        while self.waiting[key] >= key[0]:
+            table = []
+            while len(table) < key[0]:
+                _, _, ticket = heapq.heappop(heap)
+                if ticket.status == 'queued':
+                    ticket.status = 'matched'
+                    table.append(ticket)
+            self.waiting[key] -= key[0]
+            self.tables_formed += 1
+            self.listing_version += 1
+            self.matches.put(table)
+
+    def run(self, expire_interval: float = 30):
+        """Create games for matched tables forever (start with socketio.start_background_task)"""
+        last_expired = time.monotonic()
+        while True:
+            try:
+                table = self.matches.get(timeout=1)
+            except queue.Empty:
+                table = None
+            if table is not None:
+                try:
+                    self.create_game(table)
+                except Exception:
+                    logger.exception("Lobby game creation failed")
+                    self._fail(table, 'Could not create the game')
+
+            if time.monotonic() - last_expired >= expire_interval:
+                self.expire_tickets()
+                last_expired = time.monotonic()
+
+    def _fail(self, tickets: List[Ticket], error: str):
+        with self.lock:
+            for ticket in tickets:
+                ticket.status = 'failed'
+                ticket.error = error
+                ticket.finished_at = time.monotonic()
+                self.failures += 1
+            self.listing_version += 1
+
+    def create_game(self, table: List[Ticket]):
+        start = time.perf_counter()
+        decks = []
+        bad = []
+        for ticket in table:
+            try:
+                deck = self.resolve_deck(ticket.deck_text)
+            except Exception as e:
+                logger.warning("Could not resolve lobby deck", extra={'ticket_id': ticket.ticket_id, 'error': str(e)})
+                deck = None
+            if not deck:
+                bad.append(ticket)
+            decks.append(deck)
+
+        if bad:
+            # Only the players with bad decks drop out; the rest go back to their place in the queue
+            self._fail(bad, 'No cards found in deck list')
+            with self.lock:
+                for ticket in table:
+                    if ticket not in bad:
+                        ticket.status = 'queued'
+                        self._push(ticket)
+                self._form_tables((table[0].table_size, table[0].format))
+            return
+
+        game = GameState(str(uuid.uuid4()))
+        for ticket, deck in zip(table, decks):
+            game.add_player(ticket.player_id, ticket.username, deck)
+        game.start_game()
+        game.clear_history()
+        game.collect_changes()
+        self.save_game(game)
+
+        now = time.monotonic()
+        with self.lock:
+            for ticket in table:
+                ticket.status = 'ready'
+                ticket.game_id = game.game_id
+                ticket.finished_at = now
+                MATCH_SECONDS.observe(now - ticket.queued_at)
+            # Public: no game id, which is enough to spectate the game or, in a load test, to join it
+            self.tables[game.game_id] = {
+                'players': [ticket.username for ticket in table],
+                'format': table[0].format,
+                'started': time.time()
+            }
+            self.games_created += 1
+            self.listing_version += 1
+        GAME_CREATE_SECONDS.observe(time.perf_counter() - start)
+
+    def game_ended(self, game_id: str):
+        """Drop a game from the listing (e.g. when it is evicted)"""
+        with self.lock:
+            if self.tables.pop(game_id, None) is not None:
+                self.listing_version += 1
+
+    def expire_tickets(self):
+        """Forget tickets that finished more than ticket_ttl seconds ago"""
+        cutoff = time.monotonic() - self.ticket_ttl
+        with self.lock:
+            expired = [
+                ticket_id for ticket_id, ticket in self.tickets.items()
+                if ticket.finished_at is not None and ticket.finished_at < cutoff
+            ]
+            for ticket_id in expired:
+                del self.tickets[ticket_id]
+
+    def listing_json(self) -> bytes:
+        """Queue sizes and running lobby games, serialized once per change"""
+        cached = self.listing_cache
+        if cached is not None and cached[0] == self.listing_version:
+            return cached[1]
+
+        with self.lock:
+            version = self.listing_version
+            listing = {
+                'queues': [
+                    {'players': size, 'format': format, 'waiting': waiting}
+                    for (size, format), waiting in sorted(self.waiting.items()) if waiting
+                ],
+                'games': list(self.tables.values())
+            }
+        data = json.dumps(listing, separators=(',', ':')).encode('utf-8')
+        self.listing_cache = (version, data)
+        return data
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                'waiting': sum(self.waiting.values()),
+                'tickets': len(self.tickets),
+                'pending_tables': self.matches.qsize(),
+                'tables_formed': self.tables_formed,
+                'games_created': self.games_created,
+                'failures': self.failures,
+                'listed_games': len(self.tables)
+            }
@@ -0,0 +1,148 @@
+"""Structured, rate-limited logging for the server.
+
+Records are handed to a background thread through a queue, so a log call on
+a socket handler costs an enqueue instead of a write to stderr. Each
+distinct message (logger, level, format string) may be logged `burst` times
+per `interval` seconds; the rest are dropped and counted, and the count is
+attached to the next record that gets through.
+
+Environment variables: LOG_LEVEL (default INFO), LOG_FORMAT (json or text,
+default json), LOG_RATE_BURST (default 20), LOG_RATE_INTERVAL (seconds,
+default 10).
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+ROOT_LOGGER = 'lorcana'
+
+# Attributes every LogRecord has; anything else came from `extra=` and is logged as a field
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and any `extra` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Plain lines for local development, with `extra` fields appended as key=value"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = ' '.join(
+            f"{key}={value}" for key, value in record.__dict__.items() if key not in _STANDARD_ATTRS
+        )
+        return f"{line} {fields}" if fields else line
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets each distinct message through at most `burst` times per `interval` seconds"""
+
+    max_keys = 10000
+
+    def __init__(self, burst: int = 20, interval: float = 10.0):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.lock = threading.Lock()
+        # (logger, level, msg) -> [window start, passed in window, suppressed in window]
+        self.windows: Dict[Tuple[str, int, str], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None and len(self.windows) >= self.max_keys:
+                self._prune(now)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                self.windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+    def _prune(self, now: float):
+        # Messages formatted before logging (f-strings) make a new key each time; drop idle windows
+        for key, window in list(self.windows.items()):
+            if now - window[0] >= self.interval:
+                del self.windows[key]
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The listener runs in this process, so the record (with exc_info) can be passed as is;
+        # only render the message now, while its arguments still have their current values
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None,
+                      burst: Optional[int] = None, interval: Optional[float] = None):
+    """Set up the 'lorcana' logger tree once; later calls are no-ops"""
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        _configured = True
+
+    level = level or os.environ.get('LOG_LEVEL', 'INFO')
+    fmt = fmt or os.environ.get('LOG_FORMAT', 'json')
+    burst = burst if burst is not None else int(os.environ.get('LOG_RATE_BURST', 20))
+    interval = interval if interval is not None else float(os.environ.get('LOG_RATE_INTERVAL', 10))
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+
+    # queue.Queue rather than SimpleQueue: its blocking get is built on threading, so it stays
+    # cooperative when server.py monkey patches the process for eventlet or gevent
+    records = queue.Queue()
+    handler = _QueueHandler(records)
+    handler.addFilter(RateLimitFilter(burst, interval))
+    listener = logging.handlers.QueueListener(records, output)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(level.upper())
+    root.addHandler(handler)
+    root.propagate = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
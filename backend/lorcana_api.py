@@ -1,133 +1,299 @@
+import hashlib
 import requests
 import time
-from typing import Optional, Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import Optional, Dict, List, Tuple
 
+from card_cache import CardCache
+from card_catalog import CardCatalog, card_info_from_api, card_key
+from logs import get_logger
+from metrics import REGISTRY
+
+logger = get_logger('lorcana_api')
+
+API_FETCH_SECONDS = REGISTRY.histogram(
+    'lorcana_api_fetch_seconds', 'Card API request time', ['outcome'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+API_FETCH_FOUND = API_FETCH_SECONDS.labels(outcome='found')
+API_FETCH_NOT_FOUND = API_FETCH_SECONDS.labels(outcome='not_found')
+API_FETCH_ERROR = API_FETCH_SECONDS.labels(outcome='error')
+API_FAILURES = REGISTRY.counter('lorcana_api_failures_total', 'Cards that fell back to a mock after retries')
+
+# Bundled with the UI (see card_images.py), so mock cards need no image service
 MOCK_CARD_IMAGES = {
-    'character': 'https://via.placeholder.com/250x350/4A90E2/FFFFFF?text=Character',
-    'action': 'https://via.placeholder.com/250x350/E27A3F/FFFFFF?text=Action',
-    'item': 'https://via.placeholder.com/250x350/45B7D1/FFFFFF?text=Item',
+    'character': '/static/placeholders/character.svg',
+    'action': '/static/placeholders/action.svg',
+    'item': '/static/placeholders/item.svg',
 }
 
+DeckLine = Tuple[int, str, Optional[str]]
+
+
+def parse_deck_lines(deck_text: str) -> List[DeckLine]:
+    """Parse a Dreamborn deck list into (count, main_name, subtitle) tuples"""
+    entries = []
+    lines = deck_text.strip().split('\n')
+    
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        
+        parts = line.split(' ', 1)
+        if len(parts) != 2:
+            continue
+        
+        try:
+            count = int(parts[0])
+        except ValueError as e:
+            logger.warning("Could not parse deck line", extra={'line': line, 'error': str(e)})
+            continue
+        
+        full_name = parts[1]
+        if ' - ' in full_name:
+            main_name, subtitle = full_name.split(' - ', 1)
+            entries.append((count, main_name.strip(), subtitle.strip() or None))
+        else:
+            entries.append((count, full_name.strip(), None))
+    
+    return entries
+
+
+def deck_hash(entries: List[DeckLine]) -> str:
+    """Content hash of a deck list, independent of line order, spacing and case"""
+    counts: Dict[str, int] = {}
+    for count, main_name, subtitle in entries:
+        key = card_key(main_name, subtitle)
+        counts[key] = counts.get(key, 0) + count
+    
+    normalized = '\n'.join(f"{counts[key]} {key}" for key in sorted(counts))
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+class ResolvedDeck:
+    """Immutable resolved deck list, shared by every player using the same list.
+    
+    The card dicts are shared with the card cache and must be treated as read-only.
+    """
+    __slots__ = ('deck_hash', 'entries', 'cards', 'has_placeholders')
+    
+    def __init__(self, deck_hash: str, entries: List[Tuple[int, Dict]]):
+        object.__setattr__(self, 'deck_hash', deck_hash)
+        object.__setattr__(self, 'entries', tuple(entries))
+        object.__setattr__(self, 'cards', tuple(
+            card_data for count, card_data in entries for _ in range(count)
+        ))
+        object.__setattr__(self, 'has_placeholders', any(
+            card_data.get('mock') or card_data.get('error') for _, card_data in entries
+        ))
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("ResolvedDeck is immutable")
+    
+    def __len__(self):
+        return len(self.cards)
+    
+    def __iter__(self):
+        return iter(self.cards)
+    
+    def __getitem__(self, index):
+        return self.cards[index]
+
+
 class LorcanaAPI:
     BASE_URL = "https://api.lorcana-api.com"
     
-    def __init__(self, use_mock=False):
-        self.cache = {}
+    def __init__(self, use_mock=False, catalog: Optional[CardCatalog] = None, offline=False,
+                 max_workers: int = 8, retries: int = 2, backoff: float = 0.25, timeout: float = 3,
+                 cache: Optional[CardCache] = None, deck_cache_size: int = 256):
+        self.cache = cache if cache is not None else CardCache()
+        self.deck_cache = CardCache(max_size=deck_cache_size)
         self.use_mock = use_mock
         self.all_cards = None
+        self.catalog = catalog
+        self.offline = offline
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.failures: Dict[str, Dict] = {}
+        
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
     
     def search_card(self, main_name: str, subtitle: str) -> Optional[Dict]:
-        cache_key = f"{main_name}|{subtitle}".lower()
+        return self.resolve_cards([(main_name, subtitle)])[card_key(main_name, subtitle)]
+    
+    def search_card_no_subtitle(self, main_name: str) -> Optional[Dict]:
+        return self.resolve_cards([(main_name, None)])[card_key(main_name, None)]
+    
+    def resolve_cards(self, names: List[Tuple[str, Optional[str]]]) -> Dict[str, Dict]:
+        """Resolve many cards at once; cache misses are fetched concurrently"""
+        resolved = {}
+        misses = {}
         
-        if cache_key in self.cache:
-            return self.cache[cache_key]
+        for main_name, subtitle in names:
+            key = card_key(main_name, subtitle)
+            if key in resolved or key in misses:
+                continue
+            
+            card_info = self._lookup_local(key, main_name, subtitle)
+            if card_info is not None:
+                resolved[key] = card_info
+            else:
+                misses[key] = (main_name, subtitle)
         
-        if not self.use_mock:
-            try:
-                full_name = f"{main_name} - {subtitle}"
-                response = requests.get(
-                    f"{self.BASE_URL}/cards/fetch",
-                    params={"strict": full_name},
-                    timeout=3
-                )
-                response.raise_for_status()
-                data = response.json()
-                
-                if data and len(data) > 0:
-                    card = data[0]
-                    
-                    image_url = card.get('Image')
-                    
-                    card_info = {
-                        'name': card.get('Name', main_name),
-                        'subtitle': card.get('Subtitle', subtitle),
-                        'full_name': f"{main_name} - {subtitle}",
-                        'image_url': image_url,
-                        'cost': card.get('Cost'),
-                        'inkwell': card.get('Inkable'),
-                        'type': card.get('Type'),
-                        'classification': card.get('Classifications'),
-                        'color': card.get('Color'),
-                        'strength': card.get('Strength'),
-                        'willpower': card.get('Willpower'),
-                        'lore': card.get('Lore_Value') or card.get('Lore'),
-                        'abilities': card.get('Body_Text'),
-                        'flavor_text': card.get('Flavor_Text'),
-                        'rarity': card.get('Rarity'),
-                        'set': card.get('Set_Name'),
-                        'card_num': card.get('Card_Num'),
-                        'artist': card.get('Artist')
-                    }
-                    
-                    self.cache[cache_key] = card_info
-                    return card_info
-                
-            except Exception as e:
-                print(f"API error for {main_name} - {subtitle}: {e}")
-                self.use_mock = True
+        if not misses:
+            return resolved
         
-        card_type = 'character'
-        mock_card = {
-            'name': main_name,
-            'subtitle': subtitle,
-            'full_name': f"{main_name} - {subtitle}",
-            'image_url': MOCK_CARD_IMAGES[card_type],
-            'mock': True,
-            'cost': 3,
-            'inkwell': True,
-            'type': 'Character'
-        }
+        if self.use_mock or self.offline:
+            for key, (main_name, subtitle) in misses.items():
+                resolved[key] = self._mock_card(main_name, subtitle)
+                self.cache.set(key, resolved[key], kind='mock')
+            return resolved
         
-        self.cache[cache_key] = mock_card
-        return mock_card
+        if len(misses) == 1:
+            (key, (main_name, subtitle)), = misses.items()
+            resolved[key] = self._fetch_with_retry(key, main_name, subtitle)
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(misses))) as pool:
+                futures = {
+                    key: pool.submit(self._fetch_with_retry, key, main_name, subtitle)
+                    for key, (main_name, subtitle) in misses.items()
+                }
+                for key, future in futures.items():
+                    resolved[key] = future.result()
+        return resolved
     
-    def search_card_no_subtitle(self, main_name: str) -> Optional[Dict]:
-        cache_key = f"{main_name}|NO_SUBTITLE".lower()
+    def parse_dreamborn_deck(self, deck_text: str) -> List[Dict]:
+        return list(self.resolve_deck(deck_text).cards)
+    
+    def resolve_deck(self, deck_text: str) -> 'ResolvedDeck':
+        """Resolve a deck list once; identical lists share one ResolvedDeck"""
+        entries = parse_deck_lines(deck_text)
+        key = deck_hash(entries)
+        
+        deck = self.deck_cache.get(key)
+        if deck is not None:
+            return deck
         
-        if cache_key in self.cache:
-            return self.cache[cache_key]
+        resolved = self.resolve_cards([(main_name, subtitle) for _, main_name, subtitle in entries])
         
-        if not self.use_mock:
+        deck_entries = []
+        for count, main_name, subtitle in entries:
+            card_data = resolved.get(card_key(main_name, subtitle))
+            
+            if not card_data:
+                logger.warning("Could not find card", extra={'card': card_key(main_name, subtitle)})
+                card_data = {
+                    'name': main_name,
+                    'subtitle': subtitle or '',
+                    'image_url': MOCK_CARD_IMAGES['action'],
+                    'error': True,
+                    'cost': 1,
+                    'inkwell': True,
+                    'type': 'Character'
+                }
+            
+            deck_entries.append((count, card_data))
+        
+        deck = ResolvedDeck(key, deck_entries)
+        logger.debug("Resolved deck", extra={
+            'deck_hash': key, 'cards': len(deck), 'placeholders': deck.has_placeholders
+        })
+        self.deck_cache.set(key, deck, kind='mock' if deck.has_placeholders else 'card')
+        return deck
+    
+    def _lookup_local(self, key: str, main_name: str, subtitle: Optional[str]) -> Optional[Dict]:
+        card_info = self.cache.get(key)
+        if card_info is not None:
+            return card_info
+        
+        if self.catalog is not None:
+            card_info = self.catalog.get(main_name, subtitle)
+            if card_info:
+                self.cache.set(key, card_info)
+                return card_info
+        
+        return None
+    
+    def _fetch_with_retry(self, key: str, main_name: str, subtitle: Optional[str]) -> Dict:
+        """Fetch one card, retrying with exponential backoff; falls back to a mock for this card only"""
+        last_error = None
+        
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * (2 ** (attempt - 1)))
             try:
-                response = requests.get(
-                    f"{self.BASE_URL}/cards/fetch",
-                    params={"strict": main_name},
-                    timeout=3
-                )
-                response.raise_for_status()
-                data = response.json()
-                
-                if data and len(data) > 0:
-                    card = data[0]
-                    
-                    image_url = card.get('Image')
-                    
-                    card_info = {
-                        'name': card.get('Name', main_name),
-                        'subtitle': '',
-                        'full_name': main_name,
-                        'image_url': image_url,
-                        'cost': card.get('Cost'),
-                        'inkwell': card.get('Inkable'),
-                        'type': card.get('Type'),
-                        'classification': card.get('Classifications'),
-                        'color': card.get('Color'),
-                        'rarity': card.get('Rarity'),
-                        'abilities': card.get('Body_Text'),
-                        'flavor_text': card.get('Flavor_Text'),
-                        'set': card.get('Set_Name'),
-                        'card_num': card.get('Card_Num'),
-                        'artist': card.get('Artist')
-                    }
-                    
-                    self.cache[cache_key] = card_info
-                    return card_info
-                    
+                card_info = self._fetch_card(main_name, subtitle)
             except Exception as e:
-                print(f"API error for {main_name}: {e}")
-                self.use_mock = True
+                last_error = e
+                continue
+            
+            self.failures.pop(key, None)
+            if card_info is None:
+                card_info = self._mock_card(main_name, subtitle)
+                self.cache.set(key, card_info, kind='negative')
+                return card_info
+            
+            if self.catalog is not None:
+                self.catalog.put(main_name, subtitle, card_info)
+            self.cache.set(key, card_info)
+            return card_info
+        
+        logger.warning("Card API request failed", extra={
+            'card': card_key(main_name, subtitle), 'error': str(last_error)
+        })
+        API_FAILURES.inc()
+        failure = self.failures.setdefault(key, {'count': 0})
+        failure['count'] += 1
+        failure['error'] = str(last_error)
+        failure['last_failed'] = time.time()
         
-        mock_card = {
+        mock_card = self._mock_card(main_name, subtitle)
+        self.cache.set(key, mock_card, kind='mock')
+        return mock_card
+    
+    def _fetch_card(self, main_name: str, subtitle: Optional[str]) -> Optional[Dict]:
+        """Single API request; raises on network errors, returns None if the card does not exist"""
+        full_name = f"{main_name} - {subtitle}" if subtitle else main_name
+        start = time.perf_counter()
+        try:
+            response = self.session.get(
+                f"{self.BASE_URL}/cards/fetch",
+                params={"strict": full_name},
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            data = response.json()
+        except Exception:
+            API_FETCH_ERROR.observe(time.perf_counter() - start)
+            raise
+        
+        if data and len(data) > 0:
+            API_FETCH_FOUND.observe(time.perf_counter() - start)
+            return card_info_from_api(data[0], main_name, subtitle)
+        API_FETCH_NOT_FOUND.observe(time.perf_counter() - start)
+        return None
+    
+    def _mock_card(self, main_name: str, subtitle: Optional[str]) -> Dict:
+        if subtitle:
+            return {
+                'name': main_name,
+                'subtitle': subtitle,
+                'full_name': f"{main_name} - {subtitle}",
+                'image_url': MOCK_CARD_IMAGES['character'],
+                'mock': True,
+                'cost': 3,
+                'inkwell': True,
+                'type': 'Character'
+            }
+        
+        return {
             'name': main_name,
             'subtitle': '',
             'full_name': main_name,
@@ -137,67 +303,6 @@ class LorcanaAPI:
             'inkwell': True,
             'type': 'Action'
         }
-        
-        self.cache[cache_key] = mock_card
-        return mock_card
-    
-    def parse_dreamborn_deck(self, deck_text: str) -> List[Dict]:
-        cards = []
-        lines = deck_text.strip().split('\n')
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-            
-            parts = line.split(' ', 1)
-            if len(parts) != 2:
-                continue
-            
-            try:
-                count = int(parts[0])
-                full_name = parts[1]
-                
-                if ' - ' in full_name:
-                    main_name, subtitle = full_name.split(' - ', 1)
-                    main_name = main_name.strip()
-                    subtitle = subtitle.strip()
-                else:
-                    main_name = full_name.strip()
-                    subtitle = None
-                
-                if subtitle:
-                    card_data = self.search_card(main_name, subtitle)
-                else:
-                    card_data = self.search_card_no_subtitle(main_name)
-                
-                if card_data:
-                    for _ in range(count):
-                        cards.append(card_data)
-                    
-                    if card_data.get('mock'):
-                        print(f"Added {count}x {main_name}" + (f" - {subtitle}" if subtitle else "") + " (MOCK)")
-                    else:
-                        inkwell_status = "✓ Inkable" if card_data.get('inkwell') else "✗ Not Inkable"
-                        print(f"Added {count}x {main_name}" + (f" - {subtitle}" if subtitle else "") + f" [{inkwell_status}]")
-                else:
-                    print(f"Could not find card: {main_name}" + (f" - {subtitle}" if subtitle else ""))
-                    for _ in range(count):
-                        cards.append({
-                            'name': main_name,
-                            'subtitle': subtitle or '',
-                            'image_url': MOCK_CARD_IMAGES['action'],
-                            'error': True,
-                            'cost': 1,
-                            'inkwell': True,
-                            'type': 'Character'
-                        })
-                    
-            except ValueError as e:
-                print(f"Error parsing line: {line} - {e}")
-                continue
-        
-        return cards
 
 
 def test_api_response():
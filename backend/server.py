@@ -0,0 +1,104 @@
+"""Production entrypoint: the app on gevent or eventlet instead of the werkzeug dev server.
+
+The process is monkey patched before the app is imported, so sockets, locks
+and sleeps are cooperative: a slow card API lookup (requests) parks its own
+green thread instead of a worker, and thousands of idle sockets cost a
+greenlet each rather than an OS thread.
+
+Environment variables:
+- SERVER_ASYNC_MODE - gevent or eventlet (default: the first one installed)
+- HOST, PORT - where to listen (default 0.0.0.0:5000)
+- SERVER_WORKERS - worker processes, on PORT, PORT+1, ... behind a load balancer
+  with sticky sessions (default 1; more need GAME_STORE=redis,
+  SOCKETIO_MESSAGE_QUEUE, SECRET_KEY and ACTION_LOG_PATH='', and only the
+  worker on PORT serves /lobby)
+
+plus the app's own settings (SECRET_KEY, CORS_ALLOWED_ORIGINS,
+SOCKETIO_PING_INTERVAL, SOCKETIO_PING_TIMEOUT, ...; see the README).
+"""
+import importlib.util
+import os
+import signal
+import subprocess
+import sys
+from typing import List
+
+ASYNC_MODES = ('gevent', 'eventlet')
+
+
+def select_async_mode() -> str:
+    requested = os.environ.get('SERVER_ASYNC_MODE')
+    if requested and requested not in ASYNC_MODES:
+        sys.exit(f"SERVER_ASYNC_MODE must be one of {', '.join(ASYNC_MODES)}")
+    for mode in ([requested] if requested else ASYNC_MODES):
+        if importlib.util.find_spec(mode) is not None:
+            return mode
+    sys.exit(f"{requested or 'gevent or eventlet'} is not installed (pip install gevent)")
+
+
+def monkey_patch(mode: str):
+    if mode == 'eventlet':
+        import eventlet
+        eventlet.monkey_patch()
+    else:
+        from gevent import monkey
+        monkey.patch_all()
+
+
+def check_multi_worker():
+    """Several workers only work if games, broadcasts and sessions are shared between them.
+
+    The action log is an SQLite file with a single writer, so it has to be off
+    (ACTION_LOG_PATH=''): each worker would otherwise log and recover games
+    on its own. The lobby runs on the first worker only (see app.lobby_owner).
+    """
+    missing = [
+        name for name, ok in (
+            ('GAME_STORE=redis', os.environ.get('GAME_STORE') == 'redis'),
+            ('SOCKETIO_MESSAGE_QUEUE', bool(os.environ.get('SOCKETIO_MESSAGE_QUEUE'))),
+            ('SECRET_KEY', bool(os.environ.get('SECRET_KEY'))),
+            ("ACTION_LOG_PATH=''", os.environ.get('ACTION_LOG_PATH') == '')
+        ) if not ok
+    ]
+    if missing:
+        sys.exit(f"SERVER_WORKERS > 1 needs {', '.join(missing)}")
+
+
+def run_workers(workers: int, port: int):
+    """Start one single-worker process per port and stop them all together"""
+    check_multi_worker()
+    children: List[subprocess.Popen] = []
+    for index in range(workers):
+        env = dict(os.environ, PORT=str(port + index), SERVER_WORKERS='1', SERVER_WORKER_INDEX=str(index))
+        children.append(subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env))
+
+    def stop(signum, frame):
+        for child in children:
+            child.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    exit_code = 0
+    for child in children:
+        exit_code = child.wait() or exit_code
+    sys.exit(exit_code)
+
+
+def main():
+    host = os.environ.get('HOST', '0.0.0.0')
+    port = int(os.environ.get('PORT', 5000))
+    workers = int(os.environ.get('SERVER_WORKERS', 1))
+    if workers > 1:
+        run_workers(workers, port)
+
+    mode = select_async_mode()
+    # Before anything imports socket, threading or requests
+    monkey_patch(mode)
+
+    import app as server
+    server.logger.info("Starting server", extra={'async_mode': server.socketio.async_mode, 'port': port})
+    server.socketio.run(server.app, host=host, port=port, log_output=False)
+
+
+if __name__ == "__main__":
+    main()
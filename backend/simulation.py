@@ -0,0 +1,286 @@
+"""Headless game simulation for deck testing.
+
+Drives GameState directly with scripted or random policies, e.g.
+`python simulation.py my_deck.txt --games 1000000 --workers 8 --policy greedy`.
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import time
+from typing import Dict, List, Optional
+
+from card_catalog import CardCatalog, DEFAULT_DB_PATH
+from game_state import GameState
+
+
+class Policy:
+    """How a simulated player mulligans and takes turns"""
+    name = 'pass'
+
+    def mulligan(self, game: GameState, player_id: str, rng: random.Random) -> List[int]:
+        """Card ids to put back from the opening hand"""
+        return []
+
+    def take_turn(self, game: GameState, player_id: str, rng: random.Random, played: List[int]):
+        """Ink and play cards for one turn, appending the cost of every card played to `played`"""
+
+
+class GreedyPolicy(Policy):
+    """Ink the most expensive inkable card, then play the most expensive cards that fit"""
+    name = 'greedy'
+
+    def __init__(self, mulligan_cost: int = 5):
+        self.mulligan_cost = mulligan_cost
+
+    def mulligan(self, game, player_id, rng):
+        cards = game.cards
+        return [
+            card_id for card_id in game.players[player_id].zones['hand']
+            if cards[card_id].definition_data.cost >= self.mulligan_cost
+        ]
+
+    def take_turn(self, game, player_id, rng, played):
+        player = game.players[player_id]
+        cards = game.cards
+        hand = sorted(player.zones['hand'], key=lambda card_id: -cards[card_id].definition_data.cost)
+
+        if len(hand) > 1:
+            for card_id in hand:
+                if cards[card_id].definition_data.inkable:
+                    game.ink_card(card_id)
+                    hand.remove(card_id)
+                    break
+
+        for card_id in hand:
+            cost = cards[card_id].definition_data.cost
+            if cost <= player.ink_available:
+                game.play_card(card_id)
+                played.append(cost)
+
+        if game.turn_number >= 3 and player.zones['mystery']:
+            game.flip_mystery_card(player_id)
+
+
+class RandomPolicy(Policy):
+    """Ink a random inkable card most turns and play affordable cards at random"""
+    name = 'random'
+
+    def __init__(self, ink_chance: float = 0.8, play_chance: float = 0.7):
+        self.ink_chance = ink_chance
+        self.play_chance = play_chance
+
+    def take_turn(self, game, player_id, rng, played):
+        player = game.players[player_id]
+        cards = game.cards
+        hand = player.zones['hand'].to_list()
+
+        inkable = [card_id for card_id in hand if cards[card_id].definition_data.inkable]
+        if inkable and rng.random() < self.ink_chance:
+            card_id = rng.choice(inkable)
+            game.ink_card(card_id)
+            hand.remove(card_id)
+
+        rng.shuffle(hand)
+        for card_id in hand:
+            cost = cards[card_id].definition_data.cost
+            if cost <= player.ink_available and rng.random() < self.play_chance:
+                game.play_card(card_id)
+                played.append(cost)
+
+
+POLICIES = {policy.name: policy for policy in (Policy, GreedyPolicy, RandomPolicy)}
+
+
+class SimulationStats:
+    """Counters summed over simulated games; stats from separate workers merge by addition"""
+
+    def __init__(self, turns: int, curve_turns: int):
+        self.turns = turns
+        self.curve_turns = curve_turns
+        self.games = 0
+        self.samples = 0
+        self.opening_inkable = [0] * 8
+        self.kept_inkable = [0] * 8
+        self.mulligans = 0
+        self.ink_by_turn = [0] * (turns + 1)
+        self.on_curve = [0] * (turns + 1)
+        self.curve_outs = 0
+
+    def merge(self, other: 'SimulationStats'):
+        self.games += other.games
+        self.samples += other.samples
+        self.mulligans += other.mulligans
+        self.curve_outs += other.curve_outs
+        for name in ('opening_inkable', 'kept_inkable', 'ink_by_turn', 'on_curve'):
+            mine = getattr(self, name)
+            for i, value in enumerate(getattr(other, name)):
+                mine[i] += value
+
+    def to_dict(self) -> Dict:
+        samples = self.samples or 1
+        return {
+            'games': self.games,
+            'player_samples': self.samples,
+            'opening_inkable': [count / samples for count in self.opening_inkable],
+            'opening_inkable_mean': sum(i * c for i, c in enumerate(self.opening_inkable)) / samples,
+            'kept_inkable_mean': sum(i * c for i, c in enumerate(self.kept_inkable)) / samples,
+            'mulligan_rate': self.mulligans / samples,
+            'ink_by_turn': {turn: self.ink_by_turn[turn] / samples for turn in range(1, self.turns + 1)},
+            'on_curve_by_turn': {turn: self.on_curve[turn] / samples for turn in range(1, self.turns + 1)},
+            'curve_out_rate': self.curve_outs / samples,
+            'curve_turns': self.curve_turns
+        }
+
+
+def count_inkable(game: GameState, player_id: str) -> int:
+    cards = game.cards
+    return sum(1 for card_id in game.players[player_id].zones['hand'] if cards[card_id].definition_data.inkable)
+
+
+def simulate_game(deck: List[Dict], policies: List[Policy], rng: random.Random, stats: SimulationStats,
+                  turns: int = 8):
+    """Play one game of `turns` rounds and add its numbers to stats"""
+    game = GameState('sim', seed=rng.getrandbits(63), undo_limit=0, rollback=False)
+    player_ids = [f"p{i}" for i in range(len(policies))]
+    for player_id in player_ids:
+        game.add_player(player_id, player_id, deck)
+    game.start_game()
+
+    policy_for = dict(zip(player_ids, policies))
+    on_curve = {player_id: 0 for player_id in player_ids}
+    played: List[int] = []
+
+    for player_id in game.player_order:
+        inkable = count_inkable(game, player_id)
+        stats.opening_inkable[inkable] += 1
+
+        put_back = policy_for[player_id].mulligan(game, player_id, rng)
+        if put_back:
+            stats.mulligans += 1
+            game.mulligan(player_id, put_back)
+            inkable = count_inkable(game, player_id)
+        stats.kept_inkable[inkable] += 1
+
+    first_player = game.player_order[0]
+    for turn in range(1, turns + 1):
+        for player_id in game.player_order:
+            # The starting player skips their first draw
+            if turn > 1 or player_id != first_player:
+                game.draw_cards(player_id, 1)
+
+            played.clear()
+            policy_for[player_id].take_turn(game, player_id, rng, played)
+
+            stats.ink_by_turn[turn] += game.players[player_id].ink_total
+            if turn in played:
+                stats.on_curve[turn] += 1
+                if turn <= stats.curve_turns:
+                    on_curve[player_id] += 1
+
+            game.end_turn(player_id)
+
+    stats.games += 1
+    stats.samples += len(player_ids)
+    stats.curve_outs += sum(1 for count in on_curve.values() if count == stats.curve_turns)
+
+
+# Set in each pool worker by _init_worker, so the deck is pickled once per worker, not per task
+_worker_deck: Optional[List[Dict]] = None
+
+
+def _init_worker(deck: List[Dict]):
+    global _worker_deck
+    _worker_deck = deck
+
+
+def _run_chunk(task) -> SimulationStats:
+    seed, chunk, games, policy_names, turns, curve_turns = task
+    deck = _worker_deck
+    rng = random.Random(f"{seed}:{chunk}")
+    policies = [POLICIES[name]() for name in policy_names]
+    stats = SimulationStats(turns, curve_turns)
+    for _ in range(games):
+        simulate_game(deck, policies, rng, stats, turns)
+    return stats
+
+
+def run_simulations(deck: List[Dict], games: int, policy_names: List[str], turns: int = 8,
+                    curve_turns: int = 4, workers: int = 1, seed: int = 0,
+                    chunk_size: int = 2000) -> SimulationStats:
+    """Simulate `games` games, split into fixed chunks with their own seeds.
+
+    Results depend only on seed, games and chunk_size - not on the number of workers.
+    """
+    tasks = []
+    for chunk, start in enumerate(range(0, games, chunk_size)):
+        tasks.append((seed, chunk, min(chunk_size, games - start), policy_names, turns, curve_turns))
+
+    total = SimulationStats(turns, curve_turns)
+    if workers <= 1:
+        _init_worker(deck)
+        for task in tasks:
+            total.merge(_run_chunk(task))
+        return total
+
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(deck,)) as pool:
+        for stats in pool.imap_unordered(_run_chunk, tasks):
+            total.merge(stats)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('deck', help="Dreamborn deck list file ('-' for stdin)")
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='greedy',
+                        help='policy for the deck being tested')
+    parser.add_argument('--opponent', choices=sorted(POLICIES), default='greedy')
+    parser.add_argument('--players', type=int, default=2)
+    parser.add_argument('--turns', type=int, default=8)
+    parser.add_argument('--curve-turns', type=int, default=4,
+                        help='a curve-out is a card played at cost N on each turn N up to this')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-size', type=int, default=2000)
+    parser.add_argument('--card-db', default=DEFAULT_DB_PATH)
+    parser.add_argument('--offline', action='store_true', help='resolve cards from the local catalog only')
+    parser.add_argument('--json', action='store_true', help='print the statistics as JSON')
+    args = parser.parse_args()
+
+    from lorcana_api import LorcanaAPI
+
+    deck_text = sys.stdin.read() if args.deck == '-' else open(args.deck, encoding='utf-8').read()
+    api = LorcanaAPI(catalog=CardCatalog(args.card_db), offline=args.offline)
+    deck = api.parse_dreamborn_deck(deck_text)
+    if not deck:
+        print("Deck list is empty")
+        sys.exit(1)
+
+    policy_names = [args.policy] + [args.opponent] * (args.players - 1)
+    start = time.perf_counter()
+    stats = run_simulations(deck, args.games, policy_names, args.turns, args.curve_turns,
+                            args.workers, args.seed, args.chunk_size)
+    elapsed = time.perf_counter() - start
+
+    result = stats.to_dict()
+    result['elapsed_s'] = elapsed
+    result['games_per_sec'] = stats.games / elapsed
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"{len(deck)}-card deck, {stats.games} games ({', '.join(policy_names)}), "
+          f"{elapsed:.1f}s ({result['games_per_sec']:.0f} games/s)")
+    print(f"opening hand inkable cards: mean {result['opening_inkable_mean']:.2f}, "
+          f"after mulligan {result['kept_inkable_mean']:.2f} (mulligan rate {result['mulligan_rate']:.1%})")
+    print("  " + "  ".join(f"{i}:{share:.1%}" for i, share in enumerate(result['opening_inkable'])))
+    print(f"curve-out (cost N on each turn 1..{args.curve_turns}): {result['curve_out_rate']:.1%}")
+    for turn in range(1, args.turns + 1):
+        print(f"  turn {turn}: ink {result['ink_by_turn'][turn]:.2f}, "
+              f"on curve {result['on_curve_by_turn'][turn]:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+import fnmatch
+import json
+import os
+import random
+import struct
+import sys
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from game_state import SNAPSHOT_JSON, GameState  # noqa: E402
+
+
+def make_deck(size=30, prefix='Card'):
+    """Distinct mock cards with costs 1-6, alternating inkable"""
+    return [
+        {'name': f"{prefix} {i}", 'full_name': f"{prefix} {i}", 'cost': i % 6 + 1,
+         'inkwell': i % 2 == 0, 'type': 'Character'}
+        for i in range(size)
+    ]
+
+
+def make_game(game_id='game', players=2, seed=1, undo_limit=50, deck_size=30):
+    game = GameState(game_id, seed=seed, undo_limit=undo_limit)
+    for index in range(players):
+        game.add_player(f"p{index}", f"Player {index + 1}", make_deck(deck_size))
+    game.start_game()
+    game.clear_history()
+    game.collect_changes()
+    return game
+
+
+CARD_TYPES = ['Character', 'Character', 'Character', 'Action', 'Item', 'Character']
+ZONES = ['deck', 'hand', 'discard', 'ink', 'summoning', 'ready']
+
+
+def make_rich_deck(distinct=24, size=60):
+    """A 60-card deck of cards with every field the API returns, repeated like a real deck"""
+    definitions = [
+        {'name': f"Rich Card {i}", 'subtitle': f"Version {i}", 'full_name': f"Rich Card {i} - Version {i}",
+         'image_url': f"https://example.invalid/cards/{i}.png", 'cost': 1 + i % 8, 'inkwell': i % 4 != 0,
+         'type': CARD_TYPES[i % len(CARD_TYPES)], 'classification': 'Storyborn, Hero', 'color': 'Amber',
+         'strength': i % 5, 'willpower': 1 + i % 6, 'lore': 1 + i % 3,
+         'abilities': 'When you play this character, draw a card. ' * 3,
+         'flavor_text': 'A long flavor text line that most cards carry around.',
+         'rarity': 'Common', 'set': 'Test', 'card_num': i, 'artist': 'Nobody'}
+        for i in range(distinct)
+    ]
+    return [definitions[i % distinct] for i in range(size)]
+
+
+def new_game(game_id, deck, players=3, **kwargs):
+    """A started game whose players all play `deck`, as player-<game_id>-<n>"""
+    game = GameState(game_id, **kwargs)
+    for index in range(players):
+        game.add_player(f"player-{game_id}-{index}", f"Player {index + 1}", deck)
+    game.start_game()
+    return game
+
+
+def random_action(game, rng):
+    card_id = rng.randrange(1, game.next_card_id)
+    player_id = game.cards[card_id].owner
+    roll = rng.random()
+
+    if roll < 0.35:
+        game.move_card(card_id, rng.choice(ZONES), face_up=rng.choice([None, True, False]))
+    elif roll < 0.5:
+        if game.can_ink_card(card_id)[0]:
+            game.ink_card(card_id)
+    elif roll < 0.65:
+        if game.can_play_card(card_id)[0]:
+            game.play_card(card_id)
+    elif roll < 0.75:
+        game.draw_cards(player_id, 1)
+    elif roll < 0.8:
+        game.end_turn(game.current_turn)
+    elif roll < 0.85:
+        game.shuffle_deck(player_id)
+    else:
+        game.exert_card(card_id)
+    game.collect_changes()
+
+
+def played_games(count=3, actions=300, every=None, prefix='game'):
+    """<prefix>-<i> after `actions` random actions seeded by i; with `every`, also yielded every that many actions"""
+    deck = make_rich_deck()
+    for i in range(count):
+        game = new_game(f"{prefix}-{i}", deck, seed=i)
+        rng = random.Random(i)
+        for step in range(1, actions + 1):
+            random_action(game, rng)
+            if step == actions or (every and step % every == 0):
+                yield game
+
+
+def fingerprint(game):
+    """Snapshot contents without the version and action count, which keep counting up through undo/redo"""
+    snapshot = json.loads(game.to_bytes(include_definitions=False, encoding=SNAPSHOT_JSON)[1:])
+    del snapshot[-1]
+    del snapshot[2]
+    return snapshot
+
+
+def check_invariants(game):
+    """Every card is in exactly one zone, matching card.zone, and ink counters add up"""
+    errors = []
+    seen = {}
+    for player in game.players.values():
+        for zone_name, zone in player.zones.items():
+            try:
+                card_ids = zone.to_list()
+            except (KeyError, RuntimeError):
+                errors.append(f"{player.id} {zone_name}: zone links are corrupted")
+                continue
+            if len(card_ids) != len(zone):
+                errors.append(f"{player.id} {zone_name}: linked list and index disagree")
+            for card_id in card_ids:
+                if card_id in seen:
+                    errors.append(f"card {card_id} in {seen[card_id]} and {zone_name}")
+                seen[card_id] = zone_name
+                if game.cards[card_id].zone != zone_name:
+                    errors.append(f"card {card_id} in {zone_name} but card.zone is {game.cards[card_id].zone}")
+
+        try:
+            ink = [game.cards[card_id] for card_id in player.zones['ink']]
+        except (KeyError, RuntimeError):
+            continue
+        if player.ink_total != len(ink) or player.ink_available != sum(1 for c in ink if not c.face_up):
+            errors.append(f"{player.id} ink counters out of sync")
+
+    if len(seen) != len(game.cards):
+        errors.append(f"{len(game.cards) - len(seen)} cards missing from every zone")
+    return errors
+
+
+class FakeRedis:
+    """The slice of redis-py that RedisGameStore uses, in memory"""
+
+    def __init__(self):
+        self.data = {}
+        self.locks = {}
+        self.mutex = threading.Lock()
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def expire(self, key, seconds):
+        pass
+
+    def scan_iter(self, match='*'):
+        return [key for key in list(self.data) if fnmatch.fnmatchcase(key, match)]
+
+    def hset(self, key, field, value):
+        self.data.setdefault(key, {})[field] = value
+
+    def hget(self, key, field):
+        return self.data.get(key, {}).get(field)
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.data.get(key, {}).pop(field, None)
+
+    def hlen(self, key):
+        return len(self.data.get(key, {}))
+
+    def sadd(self, key, *members):
+        self.data.setdefault(key, set()).update(members)
+
+    def srem(self, key, *members):
+        self.data.get(key, set()).difference_update(members)
+
+    def smembers(self, key):
+        return set(self.data.get(key, set()))
+
+    def scard(self, key):
+        return len(self.data.get(key, set()))
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    @contextmanager
+    def lock(self, key, timeout=None, blocking_timeout=None):
+        with self.mutex:
+            lock = self.locks.setdefault(key, threading.Lock())
+        with lock:
+            yield
+
+
+def make_png(width, height, rgb=(74, 144, 226)):
+    """A solid-colour PNG, so the image cache can be exercised without Pillow"""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    rows = b''.join(b'\x00' + bytes(rgb) * width for _ in range(height))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b''))
+
+
+class ImageOrigin:
+    """Local stand-in for the card image host: /cards/<n>.png, 404 for anything else, counts requests"""
+
+    def __init__(self, latency=0.0, width=734, height=1024):
+        origin = self
+        self.requests = {}
+        self.lock = threading.Lock()
+        body = make_png(width, height)
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with origin.lock:
+                    origin.requests[self.path] = origin.requests.get(self.path, 0) + 1
+                if latency:
+                    time.sleep(latency)
+
+                if not self.path.startswith('/cards/'):
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def image_origin():
+    origin = ImageOrigin(latency=0.02)
+    yield origin
+    origin.close()
+
+
+class FakePipeline:
+    """Queues FakeRedis calls until execute()"""
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+        return lambda *args, **kwargs: self.calls.append((method, args, kwargs))
+
+    def execute(self):
+        results = [method(*args, **kwargs) for method, args, kwargs in self.calls]
+        self.calls = []
+        return results
+
+
+@pytest.fixture
+def fake_redis():
+    return FakeRedis()
+
+
+@pytest.fixture(scope='session')
+def server(tmp_path_factory):
+    """The app module, offline and without the action log; broadcasts only flush when a test asks"""
+    tmp = tmp_path_factory.mktemp('server')
+    os.environ.update({
+        'LORCANA_OFFLINE': '1',
+        'ACTION_LOG_PATH': '',
+        'SECRET_KEY': 'test',
+        'BROADCAST_INTERVAL_MS': '3600000',
+        'LORCANA_CARD_DB': str(tmp / 'cards.db'),
+        'CARD_IMAGE_DIR': str(tmp / 'card_images'),
+        'GAME_HIBERNATE_DIR': str(tmp / 'hibernated'),
+    })
+    import app
+    return app
+
+
+@pytest.fixture
+def seated(server):
+    """Connect a socket client as a player of a game saved in server.game_store"""
+    clients = []
+
+    def connect(game, player_id):
+        server.game_store.save(game)
+        http = server.app.test_client()
+        with http.session_transaction() as session:
+            session['game_id'] = game.game_id
+            session['player_id'] = player_id
+        client = server.socketio.test_client(server.app, flask_test_client=http)
+        client.emit('join_game', {'game_id': game.game_id, 'player_id': player_id})
+        clients.append(client)
+        return client
+
+    yield connect
+    for client in clients:
+        if client.is_connected():
+            client.disconnect()
+
+
+@pytest.fixture
+def emitted(server, monkeypatch):
+    """(event, data, room) of every emit, from handlers and broadcasts.
+
+    Recorded at the call rather than read from the test client, which does not
+    see packets python-socketio encodes once for several recipients.
+    """
+    calls = []
+
+    def socketio_emit(event, data=None, room=None, **kwargs):
+        calls.append((event, data, room))
+
+    def handler_emit(event, data=None, **kwargs):
+        calls.append((event, data, None))
+
+    monkeypatch.setattr(server.socketio, 'emit', socketio_emit)
+    monkeypatch.setattr(server, 'emit', handler_emit)
+    return calls
+
+
+def of_event(calls, event):
+    return [(data, room) for name, data, room in calls if name == event]
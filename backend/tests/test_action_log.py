@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+from action_log import ActionLog
+from conftest import fingerprint, make_game, make_rich_deck, new_game, random_action
+
+
+@pytest.fixture
+def log(tmp_path):
+    log = ActionLog(str(tmp_path / 'actions.db'), checkpoint_every=50)
+    yield log
+    log.close()
+
+
+def test_replay_matches_the_live_game(log):
+    rng = random.Random(1)
+    deck = make_rich_deck()
+    games = [new_game(f"replay-{i}", deck) for i in range(3)]
+    for game in games:
+        log.start(game)
+
+    expected = {}
+    check_at = set(rng.sample(range(1, 200), 10))
+    for step in range(200):
+        for game in games:
+            random_action(game, rng)
+            if step in check_at:
+                expected[(game.game_id, game.action_seq)] = game.to_bytes(include_definitions=False)
+
+    for (game_id, seq), data in expected.items():
+        assert log.replay(game_id, upto=seq).to_bytes(include_definitions=False) == data
+    for game in games:
+        assert log.replay(game.game_id).to_bytes(include_definitions=False) == \
+            game.to_bytes(include_definitions=False)
+
+
+def test_recover_rebuilds_games_in_progress(tmp_path):
+    path = str(tmp_path / 'actions.db')
+    log = ActionLog(path)
+    games = [make_game(f"recover-{i}", seed=i) for i in range(3)]
+    for game in games:
+        log.start(game)
+        game.add_lore(game.player_order[0], 2)
+    log.finish(games[2].game_id)
+    log.close()
+
+    # A restarted server opens the log again
+    log = ActionLog(path)
+    recovered = {game.game_id: game for game in log.recover()}
+    log.close()
+    assert set(recovered) == {games[0].game_id, games[1].game_id}
+    for game in games[:2]:
+        assert fingerprint(recovered[game.game_id]) == fingerprint(game)
+
+
+def test_undo_and_redo_are_checkpointed_for_replay(log):
+    game = make_game()
+    log.start(game)
+    with game.acting_as('p0'):
+        game.draw_cards('p0', 2)
+        game.add_lore('p0', 1)
+        game.undo('p0')
+        game.undo('p0')
+        game.redo('p0')
+    game.add_lore('p1', 1)
+
+    assert fingerprint(log.replay(game.game_id)) == fingerprint(game)
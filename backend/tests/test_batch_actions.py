@@ -0,0 +1,92 @@
+import pytest
+
+from action_log import ActionLog
+from conftest import fingerprint, make_game, of_event
+from game_store import InMemoryGameStore
+
+
+@pytest.fixture
+def table(server, seated, monkeypatch):
+    monkeypatch.setattr(server, 'game_store', InMemoryGameStore())
+    game = make_game('batch-game')
+    return game, seated(game, 'p0')
+
+
+def test_batch_applies_every_action(table, emitted):
+    game, client = table
+    client.emit('batch_actions', {'actions': [
+        {'type': 'add_lore', 'amount': 1},
+        {'type': 'draw_card'},
+    ]})
+    assert of_event(emitted, 'error') == []
+    assert game.players['p0'].lore == 1
+    assert len(game.players['p0'].zones['hand']) == 8
+
+
+def test_refused_action_rolls_back_the_batch(table, emitted):
+    game, client = table
+    before = fingerprint(game)
+    opponent_card = game.players['p1'].zones['hand'][0]
+    client.emit('batch_actions', {'actions': [
+        {'type': 'add_lore', 'amount': 1},
+        {'type': 'draw_card'},
+        {'type': 'move_card', 'card_id': opponent_card, 'to_zone': 'discard'},
+    ]})
+    assert of_event(emitted, 'error') == [({'message': 'Not your card'}, None)]
+    assert fingerprint(game) == before
+    assert not game.can_undo()
+
+
+def test_raising_action_rolls_back_the_batch(table, emitted):
+    game, client = table
+    before = fingerprint(game)
+    client.emit('batch_actions', {'actions': [
+        {'type': 'add_lore', 'amount': 1},
+        {'type': 'exert_card', 'card_id': 999999},
+    ]})
+    assert of_event(emitted, 'error') == [({'message': 'Action failed'}, None)]
+    assert fingerprint(game) == before
+
+
+def test_malformed_batch_is_rejected_whole(table, emitted):
+    game, client = table
+    before = fingerprint(game)
+    for data in [{'actions': [{'type': 'add_lore', 'amount': 1}, 1]}, {'actions': 'add_lore'}, [1]]:
+        client.emit('batch_actions', data)
+    assert of_event(emitted, 'error') == [({'message': 'Invalid actions'}, None)] * 3
+    assert fingerprint(game) == before
+
+
+def test_undo_inside_a_failed_batch_is_rolled_back():
+    game = make_game()
+    with game.acting_as('p0'):
+        game.draw_cards('p0', 2)
+        game.add_lore('p0', 1)
+        game.undo('p0')
+    before = fingerprint(game)
+
+    with pytest.raises(KeyError):
+        with game.acting_as('p0'), game.atomic():
+            game.undo('p0')
+            game.redo('p0')
+            game.undo('p0')
+            game.move_card(999999, 'hand')
+    assert fingerprint(game) == before
+    assert game.redo('p0')
+    assert game.players['p0'].lore == 1
+
+
+def test_rollback_is_checkpointed_for_replay(tmp_path):
+    log = ActionLog(str(tmp_path / 'actions.db'))
+    game = make_game()
+    log.start(game)
+
+    with pytest.raises(KeyError):
+        with game.atomic():
+            game.add_lore('p0', 2)
+            game.move_card(999999, 'hand')
+    game.add_lore('p1', 1)
+    log.flush()
+
+    assert fingerprint(log.replay(game.game_id)) == fingerprint(game)
+    log.close()
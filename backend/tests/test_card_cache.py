@@ -0,0 +1,92 @@
+import json
+import os
+import threading
+
+import pytest
+
+import card_cache
+from card_cache import CardCache
+from card_catalog import CardCatalog
+from lorcana_api import LorcanaAPI
+
+
+def test_concurrent_saves_leave_a_complete_file(tmp_path):
+    path = str(tmp_path / 'cards.json')
+    cache = CardCache(path=path)
+    for i in range(200):
+        cache.set(f"card {i}", {'name': f"Card {i}", 'abilities': 'Draw a card. ' * 20})
+
+    errors = []
+
+    def save_many():
+        try:
+            for _ in range(20):
+                cache.save()
+        except OSError as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=save_many) for _ in range(8)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert errors == []
+    assert [p.name for p in tmp_path.iterdir()] == ['cards.json']
+    restarted = CardCache(path=path)
+    assert len(restarted) == 200
+    assert restarted.get('card 7')['name'] == 'Card 7'
+
+
+def test_failed_save_removes_its_temp_file(tmp_path):
+    path = str(tmp_path / 'cards.json')
+    cache = CardCache(path=path)
+    cache.set('bad', {'value': object()})
+
+    with pytest.raises(TypeError):
+        cache.save()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_failed_save_keeps_the_cache_dirty(tmp_path):
+    cache = CardCache(path=str(tmp_path / 'cards.json'))
+    cache.set('bad', {'value': object()})
+
+    cache.flush()
+    assert cache.dirty
+
+    cache.set('bad', {'value': 'fixed'})
+    cache.flush()
+    assert not cache.dirty
+    assert CardCache(path=cache.path).get('bad') == {'value': 'fixed'}
+
+
+def test_change_during_a_save_is_saved_next_time(tmp_path, monkeypatch):
+    cache = CardCache(path=str(tmp_path / 'cards.json'))
+    cache.set('first', {'name': 'First'})
+    dump = json.dump
+
+    def dump_while_changing(data, f):
+        cache.set('second', {'name': 'Second'})
+        dump(data, f)
+
+    monkeypatch.setattr(card_cache.json, 'dump', dump_while_changing)
+    cache.save()
+    assert cache.dirty
+
+    monkeypatch.setattr(card_cache.json, 'dump', dump)
+    cache.flush()
+    assert not cache.dirty
+    assert CardCache(path=cache.path).get('second') == {'name': 'Second'}
+
+
+def test_resolving_cards_does_not_write_the_cache(tmp_path):
+    cache = CardCache(path=str(tmp_path / 'cards.json'))
+    api = LorcanaAPI(catalog=CardCatalog(str(tmp_path / 'cards.db')), offline=True, cache=cache)
+
+    api.resolve_cards([('Stitch', 'Carefree Surfer')])
+    assert cache.dirty
+    assert not os.path.exists(cache.path)
+
+    cache.flush()
+    assert len(CardCache(path=cache.path)) == 1
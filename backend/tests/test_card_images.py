@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+
+from card_images import VARIANTS, CardImageStore, Image
+
+
+def run_threads(target, count, stagger=0.0):
+    workers = [threading.Thread(target=target) for _ in range(count)]
+    for worker in workers:
+        worker.start()
+        time.sleep(stagger)
+    for worker in workers:
+        worker.join()
+
+
+def test_concurrent_requests_fetch_an_image_once(image_origin, tmp_path):
+    store = CardImageStore(str(tmp_path), max_workers=8)
+    url = f"{image_origin.url}/cards/0.png"
+
+    run_threads(lambda: store.get(url, 'thumb'), 8)
+    assert image_origin.requests['/cards/0.png'] == 1
+    assert store.fetching == {}
+
+
+def test_prefetch_fetches_each_url_once(image_origin, tmp_path):
+    store = CardImageStore(str(tmp_path), max_workers=8)
+    urls = [f"{image_origin.url}/cards/{i}.png" for i in range(20)]
+
+    store.prefetch(urls + urls)
+    store.executor.shutdown(wait=True)
+    assert len(image_origin.requests) == 20
+    assert set(image_origin.requests.values()) == {1}
+
+
+def test_waiters_keep_the_url_lock_after_a_failed_fetch(tmp_path, monkeypatch):
+    # The first fetch fails; with failure_ttl=0 the next caller retries. Callers arriving while
+    # that retry runs must wait on the same lock instead of starting a download of their own.
+    store = CardImageStore(str(tmp_path), failure_ttl=0)
+    calls = []
+    running = []
+
+    def fetch(url, url_hash):
+        running.append(url)
+        assert len(running) == 1, "two downloads of the same URL at once"
+        calls.append(url)
+        time.sleep(0.05)
+        running.pop()
+        if len(calls) == 1:
+            return None
+        return {'url': url, 'digest': 'abc', 'variants': {'full': ('abc.png', 'image/png')}}
+
+    monkeypatch.setattr(store, '_fetch', fetch)
+    errors = []
+
+    def get():
+        try:
+            store.get('http://images.invalid/cards/1.png', 'thumb')
+        except AssertionError as e:
+            errors.append(e)
+
+    run_threads(get, 12, stagger=0.01)
+    assert not errors
+    assert len(calls) == 2
+    assert store.fetching == {}
+
+
+def test_variants_are_cached_and_fit_their_box(image_origin, tmp_path):
+    store = CardImageStore(str(tmp_path))
+    url = f"{image_origin.url}/cards/1.png"
+
+    for variant, box in VARIANTS.items():
+        image = store.get(url, variant)
+        assert image.immutable
+        assert os.path.exists(image.path)
+        if Image is not None:
+            with Image.open(image.path) as opened:
+                assert opened.width <= box[0] and opened.height <= box[1]
+    assert image_origin.requests['/cards/1.png'] == 1
+
+
+def test_restarted_store_reuses_images_on_disk(image_origin, tmp_path):
+    url = f"{image_origin.url}/cards/3.png"
+    etag = CardImageStore(str(tmp_path)).get(url, 'full').etag
+
+    restarted = CardImageStore(str(tmp_path))
+    assert restarted.get(url, 'full').etag == etag
+    assert image_origin.requests['/cards/3.png'] == 1
+
+
+def test_missing_image_is_a_placeholder_and_not_refetched(image_origin, tmp_path):
+    store = CardImageStore(str(tmp_path))
+    url = f"{image_origin.url}/missing/1.png"
+
+    for _ in range(3):
+        image = store.get(url, 'thumb', 'Item')
+    assert not image.immutable
+    assert image.path.endswith('item.svg')
+    assert image_origin.requests['/missing/1.png'] == 1
+
+
+def test_offline_store_never_fetches(image_origin, tmp_path):
+    store = CardImageStore(str(tmp_path), offline=True)
+    image = store.get(f"{image_origin.url}/cards/5.png", 'thumb', 'Character')
+    assert image.path.endswith('character.svg')
+    assert not image_origin.requests
@@ -0,0 +1,56 @@
+import tracemalloc
+
+import pytest
+
+from conftest import make_deck
+from deck_analysis import (
+    analyze_deck, is_inkable, monte_carlo, np, p_after_mulligan_at_least, p_opening_at_least
+)
+from game_state import CARD_DEFINITIONS
+
+
+def test_mulligan_with_no_unseen_cards_is_the_opening_probability():
+    assert p_after_mulligan_at_least(7, 3, 4) == p_opening_at_least(7, 3, 4)
+
+
+def test_exact_odds_match_monte_carlo():
+    deck = make_deck(60)
+    exact = analyze_deck(deck)['inkable_at_least']
+    for k in (1, 3):
+        for mulligan, label in ((False, 'opening'), (True, 'after_mulligan')):
+            estimate = monte_carlo(deck, is_inkable, k, mulligan=mulligan, trials=20000)
+            assert estimate == pytest.approx(exact[k][label], abs=0.02)
+
+
+@pytest.mark.skipif(np is None, reason='needs NumPy')
+def test_million_trial_estimate_stays_small():
+    deck = make_deck(60)
+    exact = analyze_deck(deck)
+
+    tracemalloc.start()
+    try:
+        estimate = monte_carlo(deck, is_inkable, 3, mulligan=True, trials=1000000)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < 16 * 1024 * 1024
+    assert estimate == pytest.approx(exact['inkable_at_least'][3]['after_mulligan'], abs=0.002)
+
+    on_curve = monte_carlo(deck, lambda definition: definition.cost == 2, 1, turn=2, on_play=False, trials=1000000)
+    assert on_curve == pytest.approx(exact['on_curve'][2]['on_draw'], abs=0.002)
+
+
+def test_analysis_does_not_intern_definitions():
+    before = len(CARD_DEFINITIONS)
+    analyze_deck(make_deck(60, prefix='Analysis only'))
+    assert len(CARD_DEFINITIONS) == before
+
+
+def test_endpoint_rejects_decks_too_small_to_deal(server):
+    client = server.app.test_client()
+    response = client.post('/deck_analysis', json={'deck': '7 Made Up Card - Nobody'})
+    assert response.status_code == 400
+
+    response = client.post('/deck_analysis', json={'deck': '8 Made Up Card - Nobody'})
+    assert response.status_code == 200
+    assert response.get_json()['deck_size'] == 8
@@ -0,0 +1,38 @@
+import random
+import sys
+import threading
+
+from conftest import check_invariants, make_rich_deck, new_game, random_action
+from game_executor import GameExecutor
+
+
+def test_concurrent_actions_keep_games_consistent():
+    deck = make_rich_deck()
+    games = [new_game(f"stress-{i}", deck) for i in range(4)]
+    executor = GameExecutor()
+    crashes = []
+
+    def worker(seed):
+        rng = random.Random(seed)
+        for _ in range(300):
+            game = rng.choice(games)
+            try:
+                executor.run(game.game_id, random_action, game, rng)
+            except Exception as e:
+                crashes.append(f"{game.game_id}: {type(e).__name__} {e}")
+
+    # Switch threads as often as possible to expose races
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert crashes == []
+    assert [error for game in games for error in check_invariants(game)] == []
+    assert executor.stats()['actions'] == 8 * 300
@@ -0,0 +1,52 @@
+import os
+
+from conftest import fingerprint, played_games
+from game_lifecycle import GameLifecycle
+from game_store import InMemoryGameStore
+
+
+def save_played_games(store):
+    """Fingerprints of 20 played games saved to store, by game id"""
+    reference = {}
+    for game in played_games(count=20, actions=50):
+        store.save(game)
+        reference[game.game_id] = fingerprint(game)
+    return reference
+
+
+def test_memory_budget_hibernates_least_recently_active_games(tmp_path):
+    lifecycle = GameLifecycle(str(tmp_path), hibernate_after=3600, evict_after=7200, min_idle=0)
+    store = InMemoryGameStore(lifecycle=lifecycle)
+    save_played_games(store)
+
+    lifecycle.sweep()
+    lifecycle.memory_budget = lifecycle.live_bytes() // 2
+    assert lifecycle.sweep()['over_budget'] > 0
+    assert lifecycle.live_bytes() <= lifecycle.memory_budget
+    # The first games saved were the least recently active
+    assert 'game-0' not in store.games
+    assert 'game-19' in store.games
+
+
+def test_hibernate_wake_and_evict_round_trip(tmp_path):
+    lifecycle = GameLifecycle(str(tmp_path), hibernate_after=0, evict_after=7200, min_idle=0)
+    store = InMemoryGameStore(lifecycle=lifecycle)
+    reference = save_played_games(store)
+
+    assert lifecycle.sweep()['hibernated'] == len(reference)
+    assert store.games == {}
+
+    # A new store over the same directory (as after a restart) wakes games on their next transaction
+    restarted = InMemoryGameStore(lifecycle=GameLifecycle(str(tmp_path), hibernate_after=3600, evict_after=7200))
+    for game_id, expected in reference.items():
+        assert game_id in restarted
+        with restarted.transaction(game_id) as game:
+            assert fingerprint(game) == expected
+            # The undo history was hibernated with the game
+            if game.can_undo():
+                assert game.undo()
+
+    restarted.lifecycle.evict_after = 0
+    assert restarted.lifecycle.sweep()['evicted'] == len(reference)
+    assert restarted.games == {}
+    assert not any(name.endswith('.game') for name in os.listdir(tmp_path))
@@ -0,0 +1,140 @@
+import json
+import random
+
+import pytest
+
+from conftest import ZONES, make_deck, make_game
+from game_state import SPECTATOR_ID, GameState
+
+VIEWERS = ['p0', 'p1', SPECTATOR_ID]
+
+
+def apply_delta(state, delta):
+    """What a client does with a game_patch: apply its ops to the previous state"""
+    assert delta['base_version'] == state['version']
+    for op in delta['ops']:
+        *parents, key = op['path'].split('/')[1:]
+        target = state
+        for parent in parents:
+            target = target[parent]
+        if op['op'] == 'remove':
+            target.pop(key, None)
+        else:
+            target[key] = op['value']
+    state['version'] = delta['version']
+    return state
+
+
+def projection(game, viewer_id):
+    return json.loads(game.get_state_json(viewer_id))
+
+
+def check_deltas(game, states, changes):
+    """Patch every viewer's previous projection and compare it with a fresh one.
+
+    Clients keep definitions they were sent, so card_defs may only grow.
+    Returns the serialized delta sent to each viewer.
+    """
+    sent = {}
+    for viewer_id, state in states.items():
+        sent[viewer_id] = json.dumps(game.get_delta_for_player(viewer_id, changes))
+        patched = apply_delta(state, json.loads(sent[viewer_id]))
+        expected = projection(game, viewer_id)
+        assert expected['card_defs'].items() <= patched['card_defs'].items()
+        assert {**patched, 'card_defs': None} == {**expected, 'card_defs': None}
+    return sent
+
+
+def play(game, states, step):
+    step()
+    changes = game.collect_changes()
+    assert changes is not None
+    return check_deltas(game, states, changes)
+
+
+def test_patched_projection_matches_the_full_state():
+    game = make_game(undo_limit=500)
+    states = {viewer_id: projection(game, viewer_id) for viewer_id in VIEWERS}
+    p0 = game.players['p0']
+
+    with game.acting_as('p0'):
+        play(game, states, lambda: game.draw_cards('p0', 2))
+        inkable = next(cid for cid in p0.zones['hand'] if game.can_ink_card(cid)[0])
+        play(game, states, lambda: game.ink_card(inkable))
+        play(game, states, lambda: game.move_card(p0.zones['hand'][0], 'ready', face_up=True))
+        play(game, states, lambda: game.move_card(p0.zones['ready'][0], 'hand'))
+        play(game, states, lambda: game.end_turn('p0'))
+        play(game, states, lambda: game.undo('p0'))
+        play(game, states, lambda: game.undo('p0'))
+        play(game, states, lambda: game.redo('p0'))
+
+        def rolled_back():
+            with pytest.raises(KeyError):
+                with game.atomic():
+                    game.move_card(p0.zones['hand'][0], 'discard', face_up=True)
+                    game.add_lore('p0', 3)
+                    game.exert_card(999999)
+
+        play(game, states, rolled_back)
+
+    rng = random.Random(1)
+    for _ in range(200):
+        card_id, to_zone = rng.randrange(1, game.next_card_id), rng.choice(ZONES)
+        play(game, states, lambda: game.move_card(card_id, to_zone, face_up=rng.choice([None, True, False])))
+
+
+def two_deck_game():
+    """p0 plays 'Mine' cards and p1 'Theirs', so each player's definitions can be told apart"""
+    game = GameState('two-decks', seed=1)
+    game.add_player('p0', 'Player 1', make_deck(30, 'Mine'))
+    game.add_player('p1', 'Player 2', make_deck(30, 'Theirs'))
+    game.start_game()
+    game.collect_changes()
+    return game
+
+
+def seen_by(game, viewer_id):
+    return {card.definition_data.key for card in game.cards.values() if card.visible_to(viewer_id)}
+
+
+def test_opponent_hand_does_not_leak_through_deltas():
+    game = two_deck_game()
+    states = {viewer_id: projection(game, viewer_id) for viewer_id in VIEWERS}
+    p1 = game.players['p1']
+    sent = []
+
+    with game.acting_as('p1'):
+        sent.append(play(game, states, lambda: game.draw_cards('p1', 3)))
+        sent.append(play(game, states, lambda: game.mulligan('p1', list(p1.zones['hand'])[:4])))
+        sent.append(play(game, states, lambda: game.move_card(p1.zones['deck'][0], 'hand', face_up=True)))
+        sent.append(play(game, states, lambda: game.shuffle_deck('p1')))
+
+    for viewer_id in ('p0', SPECTATOR_ID):
+        assert not any('Theirs' in deltas[viewer_id] for deltas in sent)
+        assert 'Theirs' not in json.dumps(states[viewer_id])
+    assert len(states['p1']['my_cards']) == 30
+
+
+def test_card_defs_are_sent_once_per_viewer_and_only_once_seen():
+    game = two_deck_game()
+    theirs = {card.definition_data.key for card in game.cards.values() if card.owner == 'p1'}
+    sent = {}
+    for viewer_id in VIEWERS:
+        sent[viewer_id] = set(projection(game, viewer_id)['card_defs'])
+        assert sent[viewer_id] == seen_by(game, viewer_id)
+    assert not sent['p0'] & theirs
+
+    rng = random.Random(2)
+    for _ in range(300):
+        game.move_card(rng.randrange(1, game.next_card_id), rng.choice(ZONES),
+                       face_up=rng.choice([None, True, False]))
+        changes = game.collect_changes()
+        for viewer_id in VIEWERS:
+            seen = seen_by(game, viewer_id)
+            for op in game.get_delta_for_player(viewer_id, changes)['ops']:
+                if op['path'].startswith('/card_defs/'):
+                    key = op['path'][len('/card_defs/'):]
+                    assert key not in sent[viewer_id]
+                    assert key in seen
+                    sent[viewer_id].add(key)
+    assert sent['p0'] & theirs
@@ -0,0 +1,90 @@
+from conftest import make_game, of_event
+from game_store import InMemoryGameStore, RedisGameStore
+
+
+def test_redis_store_keeps_pending_changes_between_transactions(fake_redis):
+    store = RedisGameStore(client=fake_redis)
+    store.save(make_game())
+
+    with store.transaction('game') as game:
+        game.add_lore('p0', 2)
+        version = game.version
+
+    with store.transaction('game') as game:
+        changes = game.collect_changes()
+    assert changes is not None
+    assert changes['version'] == version
+    assert 'p0' in changes['players']
+
+    with store.transaction('game') as game:
+        assert game.collect_changes() is None
+
+
+def test_transaction_saves_only_when_the_game_changed(fake_redis, monkeypatch):
+    store = RedisGameStore(client=fake_redis)
+    store.save(make_game())
+    saves = []
+    set_key = fake_redis.set
+
+    def counted_set(key, value, ex=None):
+        saves.append(key)
+        set_key(key, value, ex=ex)
+
+    monkeypatch.setattr(fake_redis, 'set', counted_set)
+
+    with store.transaction('game') as game:
+        game.get_state_for_player('p0')
+    with store.transaction('missing') as game:
+        assert game is None
+    assert saves == []
+
+    with store.transaction('game') as game:
+        game.add_lore('p0', 1)
+    assert len(saves) == 1
+
+    # Sending the pending broadcast only moves broadcast_version, which must be kept too
+    with store.transaction('game') as game:
+        assert game.collect_changes() is not None
+    assert len(saves) == 2
+    with store.transaction('game') as game:
+        assert game.collect_changes() is None
+    assert len(saves) == 2
+
+
+def test_redis_delete_forgets_the_game_spectators(fake_redis):
+    store = RedisGameStore(client=fake_redis)
+    store.save(make_game('gone'))
+    store.save(make_game('kept'))
+    store.add_spectator('gone', 'sid-1')
+    store.add_spectator('gone', 'sid-2')
+    store.add_spectator('kept', 'sid-3')
+
+    store.delete('gone')
+    assert 'gone' not in store
+    assert store.spectator_count('gone') == 0
+    assert store.spectator_count() == 1
+    assert store.remove_spectator('sid-1') is None
+    assert store.remove_spectator('sid-3') == 'kept'
+
+
+def emit_lore(server, seated, emitted, game_id):
+    client = seated(make_game(game_id), 'p0')
+
+    client.emit('add_lore', {'amount': 1})
+    server.broadcast_scheduler.flush()
+
+    patches = of_event(emitted, 'game_patch')
+    assert [room for _, room in patches] == [server.game_store.get_session('p0')]
+    ops = patches[0][0]['ops']
+    assert {'op': 'replace', 'path': '/players/p0'}.items() <= ops[0].items()
+    assert ops[0]['value']['lore'] == 1
+
+
+def test_action_through_redis_store_emits_patch(server, seated, emitted, fake_redis, monkeypatch):
+    monkeypatch.setattr(server, 'game_store', RedisGameStore(client=fake_redis))
+    emit_lore(server, seated, emitted, 'redis-game')
+
+
+def test_action_through_memory_store_emits_patch(server, seated, emitted, monkeypatch):
+    monkeypatch.setattr(server, 'game_store', InMemoryGameStore())
+    emit_lore(server, seated, emitted, 'memory-game')
@@ -0,0 +1,99 @@
+import json
+import random
+import threading
+import time
+
+from conftest import make_rich_deck
+from lobby import TABLE_SIZES, Lobby
+
+
+def run_lobby(deck, players=600, threads=4, cancel_rate=0.1, seed=1):
+    games = {}
+    lobby = Lobby(lambda deck_text: deck, lambda game: games.__setitem__(game.game_id, game))
+    threading.Thread(target=lobby.run, daemon=True).start()
+
+    joined = [[] for _ in range(threads)]
+    cancelled = set()
+
+    def join_many(index):
+        rng = random.Random(seed + index)
+        for i in range(index, players, threads):
+            ticket = lobby.join(f"player-{i}", f"deck {i}", rng.choice(TABLE_SIZES), rng.choice(['core', 'infinity']))
+            joined[index].append(ticket)
+            if rng.random() < cancel_rate and lobby.cancel(ticket.ticket_id):
+                cancelled.add(ticket.ticket_id)
+
+    workers = [threading.Thread(target=join_many, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    deadline = time.monotonic() + 30
+    while lobby.games_created + lobby.failures < lobby.tables_formed and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return lobby, games, [ticket for tickets in joined for ticket in tickets], cancelled
+
+
+def test_every_player_is_seated_once_at_a_full_table():
+    deck = make_rich_deck()
+    lobby, games, tickets, cancelled = run_lobby(deck)
+
+    seats = {}
+    for game in games.values():
+        for pid in game.player_order:
+            seats[pid] = seats.get(pid, 0) + 1
+    assert all(count == 1 for count in seats.values())
+
+    waiting = {}
+    for ticket in tickets:
+        if ticket.status == 'ready':
+            game = games[ticket.game_id]
+            assert ticket.player_id in game.players
+            assert len(game.player_order) == ticket.table_size
+        elif ticket.status == 'queued':
+            key = (ticket.table_size, ticket.format)
+            waiting[key] = waiting.get(key, 0) + 1
+        else:
+            assert ticket.status == 'cancelled' and ticket.ticket_id in cancelled
+    # Anyone still waiting is short of a full table
+    assert all(count < size for (size, _), count in waiting.items())
+
+    assert lobby.games_created == len(games)
+    listing = json.loads(lobby.listing_json())
+    assert len(listing['games']) == len(games)
+    # The public listing must not hand out ids of running games
+    assert not any(game_id in lobby.listing_json().decode() for game_id in games)
+    assert all('game_id' not in table for table in listing['games'])
+
+
+def test_bad_decks_drop_out_and_the_rest_of_the_table_requeues():
+    deck = make_rich_deck()
+    games = {}
+    lobby = Lobby(lambda deck_text: [] if deck_text == 'bad' else deck,
+                  lambda game: games.__setitem__(game.game_id, game))
+
+    good = lobby.join('good', 'good', 2)
+    bad = lobby.join('bad', 'bad', 2)
+    lobby.create_game(lobby.matches.get_nowait())
+    assert bad.status == 'failed'
+    assert good.status == 'queued'
+    assert not games
+
+    later = lobby.join('later', 'good', 2)
+    lobby.create_game(lobby.matches.get_nowait())
+    assert good.status == later.status == 'ready'
+    assert good.game_id == later.game_id
+    assert lobby.stats()['failures'] == 1
+
+
+def test_matched_ticket_cannot_be_cancelled():
+    lobby = Lobby(lambda deck_text: make_rich_deck(), lambda game: None)
+    first = lobby.join('a', 'deck', 2)
+    assert lobby.cancel(first.ticket_id)
+    assert first.status == 'cancelled'
+
+    second = lobby.join('b', 'deck', 2)
+    third = lobby.join('c', 'deck', 2)
+    assert second.status == third.status == 'matched'
+    assert not lobby.cancel(second.ticket_id)
@@ -0,0 +1,36 @@
+import pytest
+
+import server as entrypoint
+
+MULTI_WORKER_ENV = {
+    'GAME_STORE': 'redis',
+    'SOCKETIO_MESSAGE_QUEUE': 'redis://localhost:6379/0',
+    'SECRET_KEY': 'test',
+    'ACTION_LOG_PATH': ''
+}
+
+
+def test_several_workers_need_shared_state_and_no_action_log(monkeypatch):
+    for name, value in MULTI_WORKER_ENV.items():
+        monkeypatch.setenv(name, value)
+    entrypoint.check_multi_worker()
+
+    monkeypatch.delenv('ACTION_LOG_PATH')
+    with pytest.raises(SystemExit, match='ACTION_LOG_PATH'):
+        entrypoint.check_multi_worker()
+
+    monkeypatch.setenv('ACTION_LOG_PATH', '')
+    monkeypatch.setenv('GAME_STORE', 'memory')
+    with pytest.raises(SystemExit, match='GAME_STORE=redis'):
+        entrypoint.check_multi_worker()
+
+
+def test_only_the_lobby_owner_serves_the_lobby(server, monkeypatch):
+    client = server.app.test_client()
+    assert client.get('/lobby').status_code == 200
+
+    monkeypatch.setattr(server, 'lobby_owner', False)
+    assert client.get('/lobby').status_code == 404
+    response = client.post('/lobby/queue', json={'username': 'a', 'deck': '60 Card - A'})
+    assert response.status_code == 404
+    assert server.lobby.stats()['waiting'] == 0
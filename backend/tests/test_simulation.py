@@ -0,0 +1,20 @@
+import simulation
+from conftest import make_rich_deck
+from game_state import GameState
+
+
+def simulate(workers=1):
+    stats = simulation.run_simulations(make_rich_deck(), 300, ['greedy', 'random'], workers=workers, seed=7,
+                                       chunk_size=100)
+    return stats.to_dict()
+
+
+def test_results_do_not_depend_on_the_number_of_workers():
+    assert simulate(workers=1) == simulate(workers=2)
+
+
+def test_skipping_the_journal_does_not_change_results(monkeypatch):
+    without_journal = simulate()
+    monkeypatch.setattr(simulation, 'GameState',
+                        lambda *args, **kwargs: GameState(*args, **dict(kwargs, rollback=True)))
+    assert simulate() == without_journal
@@ -0,0 +1,48 @@
+import json
+import pickle
+
+import pytest
+
+from conftest import check_invariants, make_game, played_games
+from game_state import SNAPSHOT_JSON, SNAPSHOT_MSGPACK, GameState, msgpack
+
+ENCODINGS = [SNAPSHOT_JSON] + ([SNAPSHOT_MSGPACK] if msgpack is not None else [])
+
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+@pytest.mark.parametrize('include_definitions', [True, False])
+def test_round_trip(encoding, include_definitions):
+    for game in played_games(every=25):
+        data = game.to_bytes(encoding=encoding, include_definitions=include_definitions)
+        restored = GameState.from_bytes(data)
+
+        assert check_invariants(restored) == []
+        assert restored.to_bytes(encoding=encoding, include_definitions=include_definitions) == data
+        for pid in game.player_order:
+            assert json.loads(restored.get_state_json(pid)) == json.loads(game.get_state_json(pid))
+
+
+def test_history_and_pending_broadcast_round_trip():
+    game = make_game()
+    with game.acting_as('p0'):
+        game.draw_cards('p0', 1)
+        game.add_lore('p0', 1)
+        game.undo('p0')
+    game.get_state_for_player('p0')
+
+    restored = GameState.from_bytes(game.to_bytes(include_history=True, include_broadcast=True))
+    assert len(restored.undo_stack) == len(game.undo_stack)
+    assert restored.redo('p0')
+    assert restored.players['p0'].lore == 1
+    assert restored.revealed_defs == game.revealed_defs
+
+    expected = game.collect_changes()
+    restored = GameState.from_bytes(game.to_bytes(include_broadcast=True))
+    assert restored.collect_changes() is None
+    assert expected is not None
+
+
+def test_pickle_goes_through_the_snapshot():
+    game = make_game()
+    restored = pickle.loads(pickle.dumps(game))
+    assert restored.to_bytes() == game.to_bytes()
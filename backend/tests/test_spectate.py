@@ -0,0 +1,59 @@
+import pytest
+
+from conftest import fingerprint, make_game, of_event
+from game_state import SPECTATOR_ID
+from game_store import InMemoryGameStore
+
+
+@pytest.fixture
+def watched(server, seated, monkeypatch):
+    """A game with p0 seated and a second socket, never seated, spectating it"""
+    monkeypatch.setattr(server, 'game_store', InMemoryGameStore())
+    game = make_game('watched-game')
+    player = seated(game, 'p0')
+    spectator = server.socketio.test_client(server.app)
+    spectator.emit('spectate_game', {'game_id': game.game_id})
+    yield game, player, spectator
+    spectator.disconnect()
+
+
+def hand_card_ids(game):
+    return {cid for player in game.players.values() for cid in player.zones['hand']}
+
+
+def test_spectator_gets_the_public_projection(watched, emitted):
+    game, _, spectator = watched
+    # Again, now that emits are recorded
+    spectator.emit('spectate_game', {'game_id': game.game_id})
+
+    [(state, _)] = of_event(emitted, 'game_update')
+    assert state == game.get_state_for_player(SPECTATOR_ID)
+    assert state['my_cards'] == {}
+    assert all(player['zones'] == {} for player in state['players'].values())
+    assert not hand_card_ids(game) & {int(cid) for cid in state['visible_cards']}
+
+
+def test_spectator_patches_do_not_show_hands(server, watched, emitted):
+    game, player, _ = watched
+    player.emit('draw_card', {})
+    server.broadcast_scheduler.flush()
+
+    [delta] = [data for data, room in of_event(emitted, 'game_patch') if room == server.spectator_room(game.game_id)]
+    drawn = game.players['p0'].zones['hand'][-1]
+    assert {'op': 'remove', 'path': f'/visible_cards/{drawn}'} in delta['ops']
+    assert not [op for op in delta['ops'] if op['path'].startswith('/card_defs/')]
+
+
+def test_spectator_cannot_act(server, watched, emitted):
+    game, _, spectator = watched
+    before = fingerprint(game)
+    hand = game.players['p0'].zones['hand']
+
+    spectator.emit('add_lore', {'amount': 5})
+    spectator.emit('draw_card', {})
+    spectator.emit('move_card', {'card_id': hand[0], 'to_zone': 'discard'})
+    spectator.emit('batch_actions', {'actions': [{'type': 'end_turn'}, {'type': 'add_lore', 'amount': 1}]})
+    server.broadcast_scheduler.flush()
+
+    assert fingerprint(game) == before
+    assert of_event(emitted, 'game_patch') == []
@@ -0,0 +1,25 @@
+from conftest import make_game
+
+
+def test_join_route_only_exists_for_load_tests(server):
+    assert not server.load_test_routes
+    server.game_store.save(make_game('test-unlisted'))
+
+    response = server.app.test_client().get('/test_game/test-unlisted/join/0')
+    assert response.status_code == 404
+
+
+def test_join_rejects_games_not_made_by_test_game(server):
+    server.game_store.save(make_game('lobby-game'))
+    server.game_store.save(make_game('test-shared'))
+
+    with server.app.test_request_context():
+        response, status = server.join_test_game('lobby-game', 0)
+        assert status == 404
+        response = server.join_test_game('test-shared', 1)
+        assert response.get_json()['player_id'] == 'p1'
+
+
+def test_test_games_get_the_test_prefix(server):
+    created = server.app.test_client().get('/test_game').get_json()
+    assert created['game_id'].startswith(server.TEST_GAME_PREFIX)
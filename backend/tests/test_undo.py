@@ -0,0 +1,91 @@
+import random
+
+import pytest
+
+from conftest import check_invariants, fingerprint, make_game, make_rich_deck, new_game, of_event, random_action
+from game_store import InMemoryGameStore
+
+
+def test_undo_and_redo_restore_each_step():
+    game = make_game()
+    states = [fingerprint(game)]
+    with game.acting_as('p0'):
+        game.draw_cards('p0', 2)
+        states.append(fingerprint(game))
+        game.add_lore('p0', 3)
+        states.append(fingerprint(game))
+
+    assert game.undo('p0')
+    assert fingerprint(game) == states[1]
+    assert game.undo('p0')
+    assert fingerprint(game) == states[0]
+    assert game.redo('p0')
+    assert fingerprint(game) == states[1]
+    assert game.redo('p0')
+    assert fingerprint(game) == states[2]
+
+
+def test_undo_everything_and_redo_everything_after_random_actions():
+    rng = random.Random(1)
+    game = new_game('undo', make_rich_deck(), seed=1, undo_limit=500)
+    game.clear_history()
+    states = [fingerprint(game)]
+    for _ in range(500):
+        depth = len(game.undo_stack)
+        random_action(game, rng)
+        if len(game.undo_stack) != depth:
+            states.append(fingerprint(game))
+
+    steps = len(game.undo_stack)
+    for i in range(steps):
+        assert game.undo()
+        assert fingerprint(game) == states[-i - 2], f"undo step {i + 1}"
+    assert check_invariants(game) == []
+
+    for i in range(steps):
+        assert game.redo()
+        assert fingerprint(game) == states[i + 1], f"redo step {i + 1}"
+    assert check_invariants(game) == []
+
+
+def test_players_only_undo_and_redo_their_own_last_action():
+    game = make_game()
+    first, second = game.player_order
+    with game.acting_as(second):
+        game.add_lore(second, 1)
+    with game.acting_as(first):
+        game.end_turn(first)
+
+    assert not game.undo(second)
+    assert game.undo(first)
+    assert game.current_turn == first
+    assert not game.redo(second)
+    assert game.redo(first)
+    # Undo without a player (replay, tools) is not restricted
+    assert game.undo()
+
+
+@pytest.mark.parametrize('undo_limit', [0, 50])
+def test_failed_action_is_rolled_back(undo_limit):
+    game = make_game(undo_limit=undo_limit)
+    card_id = game.players['p0'].zones['hand'][0]
+    before = fingerprint(game)
+
+    with pytest.raises(KeyError):
+        game.move_card(card_id, 'nowhere')
+    assert fingerprint(game) == before
+
+
+def test_opponent_cannot_undo_over_socket(server, seated, emitted, monkeypatch):
+    monkeypatch.setattr(server, 'game_store', InMemoryGameStore())
+    game = make_game('undo-game')
+    p0 = seated(game, 'p0')
+    p1 = seated(game, 'p1')
+
+    p0.emit('add_lore', {'amount': 2})
+    p1.emit('undo', {})
+    assert of_event(emitted, 'error') == [({'message': 'You can only undo your own last action'}, None)]
+    assert game.players['p0'].lore == 2
+
+    p0.emit('undo', {})
+    assert game.players['p0'].lore == 0